@@ -0,0 +1,102 @@
+import os
+
+# --- Account Configuration ---
+# A single account is configured with CDS_USERNAME / CDS_PASSWORD (and the
+# API key in ~/.cdsapirc), exactly as before. To shard requests over several
+# accounts, list their names in CDS_ACCOUNTS and give each one its own
+# suffixed variables, e.g. for CDS_ACCOUNTS=main,second:
+#
+#   CDS_USERNAME / CDS_PASSWORD                 (main, no suffix)
+#   CDS_USERNAME_SECOND / CDS_PASSWORD_SECOND
+#   CDS_API_KEY_SECOND                          (API key for cdsapi)
+#   CDS_API_URL_SECOND                          (optional, defaults to cdsapirc)
+#   CDS_MAX_ACTIVE_SECOND                       (optional slot budget)
+#   CDS_STATUS_SOURCE_SECOND                    ('selenium' or 'api')
+#
+# 'api' accounts are polled with cdsapi instead of a browser session; this is
+# what the local stand-in server (fake_cds.py) is used with.
+DEFAULT_ACCOUNT = 'main'
+DEFAULT_MAX_ACTIVE = 8
+
+
+class Account:
+    """One set of CDS credentials with its own client, session and slot budget."""
+
+    def __init__(self, name, username=None, password=None, api_url=None, api_key=None,
+                 max_active=DEFAULT_MAX_ACTIVE, status_source='selenium'):
+        self.name = name
+        self.username = username
+        self.password = password
+        self.api_url = api_url
+        self.api_key = api_key
+        self.max_active = max_active
+        self.status_source = status_source
+        # Set up by the manager
+        self.client = None
+        self.driver = None
+        self.controller = None
+        # Request IDs listed on the account's CDS page at the last scrape
+        # (None for 'api' accounts, which are not scraped)
+        self.remote_request_ids = None
+
+    @property
+    def uses_browser(self):
+        return self.status_source == 'selenium'
+
+    def __repr__(self):
+        return f"Account({self.name!r}, max_active={self.max_active}, status_source={self.status_source!r})"
+
+
+def _env(name, account_name):
+    """Reads NAME for the default account and NAME_<ACCOUNT> for the others."""
+    if account_name == DEFAULT_ACCOUNT:
+        return os.getenv(name)
+    return os.getenv(f"{name}_{account_name.upper()}")
+
+
+def load_accounts(max_active=DEFAULT_MAX_ACTIVE):
+    """Builds the configured accounts from the environment (.env must be loaded)."""
+    names = [n.strip() for n in os.getenv("CDS_ACCOUNTS", DEFAULT_ACCOUNT).split(",") if n.strip()]
+
+    accounts = []
+    for name in names:
+        account_max = _env("CDS_MAX_ACTIVE", name)
+        accounts.append(Account(
+            name=name,
+            username=_env("CDS_USERNAME", name),
+            password=_env("CDS_PASSWORD", name),
+            api_url=_env("CDS_API_URL", name),
+            api_key=_env("CDS_API_KEY", name),
+            max_active=int(account_max) if account_max else max_active,
+            status_source=(_env("CDS_STATUS_SOURCE", name) or 'selenium').lower(),
+        ))
+    return accounts
+
+
+def validate_accounts(accounts):
+    """Returns a list of configuration problems (empty when all accounts are usable)."""
+    problems = []
+    if not accounts:
+        problems.append("No accounts configured.")
+    for account in accounts:
+        if account.uses_browser and (not account.username or not account.password):
+            problems.append(f"Account '{account.name}' has no username/password.")
+        if account.status_source not in ('selenium', 'api'):
+            problems.append(f"Account '{account.name}' has unknown status source '{account.status_source}'.")
+        if account.name != DEFAULT_ACCOUNT and not account.api_key:
+            problems.append(f"Account '{account.name}' has no API key (CDS_API_KEY_{account.name.upper()}).")
+    return problems
+
+
+def assign_account(accounts, free_slots):
+    """
+    Picks the account with the most free slots for the next job.
+    Returns None when every account is full.
+    """
+    best = None
+    for account in accounts:
+        if free_slots.get(account.name, 0) <= 0:
+            continue
+        if best is None or free_slots[account.name] > free_slots[best.name]:
+            best = account
+    return best
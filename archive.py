@@ -0,0 +1,155 @@
+"""
+Read API over the downloaded ERA5 archive in era5_data/.
+
+    import archive
+    ds = archive.load('TX', '2021-02-10', '2021-02-17', ['2m_temperature', 'total_precipitation'])
+
+A sidecar index (era5_data/.archive_index.json) records, for every output
+file, its state, time range, variables, stream (instant/accum) and size.
+load() uses it to open only the files that overlap the request. Files are
+opened lazily, so only the selected time steps are read from disk.
+"""
+import json
+import os
+
+import pandas as pd
+import xarray as xr
+
+import storage
+from naming import parse_output_filename, short_variable_names
+
+DEFAULT_DATA_DIR = "era5_data"
+INDEX_FILENAME = ".archive_index.json"
+INDEX_VERSION = 1
+
+
+def time_dim_of(ds):
+    """Name of the time dimension ('valid_time' in new CDS files, 'time' in old ones)."""
+    return 'valid_time' if 'valid_time' in ds.dims else 'time'
+
+
+def describe_file(path):
+    """Reads the index entry for one file (metadata only, no data values)."""
+    parsed = parse_output_filename(path)
+    with xr.open_dataset(path) as ds:
+        time_dim = time_dim_of(ds)
+        times = ds[time_dim].values
+        stat = os.stat(path)
+        return {
+            'state': parsed['state'],
+            'year': parsed['year'],
+            'label': parsed['label'],
+            'stream': parsed['stream'] or 'all',
+            'start': str(pd.Timestamp(times.min())),
+            'end': str(pd.Timestamp(times.max())),
+            'time_dim': time_dim,
+            'variables': sorted(ds.data_vars),
+            'bytes': stat.st_size,
+            'mtime': stat.st_mtime,
+        }
+
+
+def load_index(data_dir=DEFAULT_DATA_DIR):
+    path = os.path.join(data_dir, INDEX_FILENAME)
+    try:
+        with open(path) as f:
+            index = json.load(f)
+        if index.get('version') == INDEX_VERSION:
+            return index
+    except (OSError, json.JSONDecodeError):
+        pass
+    return {'version': INDEX_VERSION, 'files': {}}
+
+
+def save_index(index, data_dir=DEFAULT_DATA_DIR):
+    path = os.path.join(data_dir, INDEX_FILENAME)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def refresh_index(data_dir=DEFAULT_DATA_DIR):
+    """
+    Brings the index in line with the directory. Only files that are new or
+    whose size/mtime changed are opened; removed files are dropped.
+    """
+    index = load_index(data_dir)
+    files = index['files']
+    seen = set()
+    changed = False
+
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            parsed = parse_output_filename(entry.name)
+            # Monthly/box parts of split requests are merged later; skip them
+            if not parsed or parsed['month'] or parsed['box'] or not entry.is_file():
+                continue
+            seen.add(entry.name)
+            stat = entry.stat()
+            known = files.get(entry.name)
+            if known and known['bytes'] == stat.st_size and known['mtime'] == stat.st_mtime:
+                continue
+            try:
+                files[entry.name] = describe_file(entry.path)
+                changed = True
+            except Exception as e:
+                print(f"Warning: could not index {entry.name}: {e}")
+
+    for name in list(files):
+        if name not in seen:
+            del files[name]
+            changed = True
+
+    if changed:
+        save_index(index, data_dir)
+    return index
+
+
+def find_files(state, start, end, variables=None, data_dir=DEFAULT_DATA_DIR):
+    """Index entries (name, entry) of files overlapping the request, oldest first."""
+    index = refresh_index(data_dir)
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    matches = []
+    for name, entry in index['files'].items():
+        if entry['state'] != state:
+            continue
+        if pd.Timestamp(entry['end']) < start or pd.Timestamp(entry['start']) > end:
+            continue
+        if variables and not set(variables) & set(entry['variables']):
+            continue
+        matches.append((name, entry))
+    matches.sort(key=lambda item: item[1]['start'])
+    return matches
+
+
+def load(state, start, end, variables=None, data_dir=DEFAULT_DATA_DIR):
+    """
+    Returns a lazily loaded xarray Dataset of one state's data between start
+    and end (inclusive). `variables` may list CDS names or the short names
+    stored in the files; only files holding at least one of them are opened.
+    """
+    if variables:
+        variables = short_variable_names(variables)
+    # Files moved to cold storage are brought back first
+    storage.rehydrate_range(state, start, end, hot_dir=data_dir)
+    matches = find_files(state, start, end, variables, data_dir)
+    if not matches:
+        raise FileNotFoundError(f"No data for {state} between {start} and {end} in {data_dir}")
+
+    by_stream = {}
+    for name, entry in matches:
+        ds = xr.open_dataset(os.path.join(data_dir, name))
+        time_dim = entry['time_dim']
+        ds = ds.sel({time_dim: slice(pd.Timestamp(start), pd.Timestamp(end))})
+        if variables:
+            ds = ds[[v for v in ds.data_vars if v in variables]]
+        by_stream.setdefault(entry['stream'], []).append((time_dim, ds))
+
+    # Concatenate quarters within a stream, then merge the streams
+    parts = []
+    for stream_parts in by_stream.values():
+        time_dim = stream_parts[0][0]
+        datasets = [ds for _, ds in stream_parts]
+        parts.append(datasets[0] if len(datasets) == 1 else xr.concat(datasets, dim=time_dim))
+    return parts[0] if len(parts) == 1 else xr.merge(parts, compat='override')
@@ -0,0 +1,361 @@
+"""
+Benchmark of the data-processing stages on synthetic ERA5-like files, so
+the effect of a change (or a different machine) on the multi-GB stages can
+be measured without downloading anything:
+
+    python benchmark.py                           # small and large state, 3 timed passes
+    python benchmark.py --cases large --repeat 5
+    python benchmark.py --output results.jsonl
+
+For each case a zip is generated the way CDS delivers it: an instant and an
+accum NetCDF stream of one three-month chunk, hourly, on the 0.25 degree
+grid of a state's bounding box, with smooth fields plus noise so they
+compress like real data. The stages then run on it in pipeline order:
+
+    extract   retrieve.process_downloaded_file (unzip + rename)
+    verify    storage.verify_file on each stream
+    repack    repack.repack_file on each stream
+    rollup    rollup.rollup_state (daily and monthly aggregates)
+
+A warm-up pass, which is not timed, measures peak memory per stage with
+tracemalloc (Python and numpy allocations; the HDF5 library's own buffers
+are not included); the timed passes follow. Each run is appended as one
+JSON line to the results file with the machine, library versions and git
+commit, and compared with the previous run of the same configuration.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import repack
+import rollup
+import storage
+from naming import build_output_filename, chunk_months, stream_paths
+from retrieve import process_downloaded_file
+
+RESULTS_FILE = "benchmark_results.jsonl"
+DEFAULT_REPEAT = 3
+DEFAULT_SEED = 0
+BENCH_YEAR = 2021
+BENCH_LABEL = 'Jan-Mar'
+GRID_STEP = 0.25
+STAGES = ('extract', 'verify', 'repack', 'rollup')
+
+# Case -> (state, [N, W, S, E]); the boxes are the manager's for these states
+CASES = {
+    'small': ('DE', [39.839007, -75.79003, 38.451013, -75.048939]),
+    'large': ('TX', [36.500704, -106.647191, 25.837377, -93.508292]),
+}
+
+# Instant variables: (base value, amplitude of the spatial and diurnal
+# pattern, noise standard deviation), in the units CDS uses
+INSTANT_FIELDS = {
+    'u10': (0.0, 3.0, 1.5),
+    'v10': (0.0, 3.0, 1.5),
+    'd2m': (275.0, 8.0, 1.0),
+    't2m': (280.0, 10.0, 1.0),
+    'msl': (101500.0, 800.0, 50.0),
+    'sst': (290.0, 3.0, 0.1),
+    'sp': (98000.0, 3000.0, 50.0),
+}
+# Share of hours with precipitation, and the gamma shape/scale of the amount in m
+RAIN_PROBABILITY = 0.1
+RAIN_GAMMA = (0.5, 0.002)
+
+STREAM_NAMES = {
+    'instant': "data_stream-oper_stepType-instant.nc",
+    'accum': "data_stream-oper_stepType-accum.nc",
+}
+
+
+# --- Synthetic payloads ---
+
+def grid_axes(box):
+    """Latitudes (north to south) and longitudes of the 0.25 degree grid points inside a box."""
+    north, west, south, east = box
+    latitudes = np.arange(np.floor(north / GRID_STEP), np.ceil(south / GRID_STEP) - 1, -1) * GRID_STEP
+    longitudes = np.arange(np.ceil(west / GRID_STEP), np.floor(east / GRID_STEP) + 1) * GRID_STEP
+    return latitudes, longitudes
+
+
+def chunk_times(year=BENCH_YEAR, label=BENCH_LABEL):
+    months = chunk_months(label)
+    start = pd.Timestamp(f"{year}-{months[0]}-01")
+    end = pd.Timestamp(f"{year}-{months[-1]}-01") + pd.offsets.MonthEnd(0) + pd.Timedelta(hours=23)
+    return pd.date_range(start, end, freq='h')
+
+
+def stream_dataset(fields, times, latitudes, longitudes):
+    coords = {
+        'valid_time': times,
+        'latitude': latitudes,
+        'longitude': longitudes,
+        'number': 0,
+        'expver': ('valid_time', np.full(len(times), '0001')),
+    }
+    data_vars = {name: (('valid_time', 'latitude', 'longitude'), values) for name, values in fields.items()}
+    return xr.Dataset(data_vars, coords=coords, attrs={'GRIB_centre': 'ecmf', 'Conventions': 'CF-1.7'})
+
+
+def synthetic_streams(box, times, rng):
+    """(instant, accum) datasets for one chunk of a box."""
+    latitudes, longitudes = grid_axes(box)
+    hours = times.hour.values[:, None, None]
+    lat = np.deg2rad(latitudes)[None, :, None]
+    lon = np.deg2rad(longitudes)[None, None, :]
+    shape = (len(times), len(latitudes), len(longitudes))
+    # The same smooth pattern for every variable: a gradient across the box
+    # and a diurnal cycle that shifts with longitude
+    pattern = 0.5 * np.cos(4 * lat) * np.sin(3 * lon) + 0.5 * np.sin(2 * np.pi * hours / 24 + lon)
+
+    instant = {}
+    for name, (base, amplitude, noise) in INSTANT_FIELDS.items():
+        values = base + amplitude * pattern + noise * rng.standard_normal(shape)
+        instant[name] = values.astype(np.float32)
+    # Sea surface temperature is missing over land: the western half of the box here
+    instant['sst'][:, :, : len(longitudes) // 2] = np.nan
+
+    raining = rng.random(shape) < RAIN_PROBABILITY
+    tp = np.where(raining, rng.gamma(*RAIN_GAMMA, size=shape), 0.0).astype(np.float32)
+
+    return (stream_dataset(instant, times, latitudes, longitudes),
+            stream_dataset({'tp': tp}, times, latitudes, longitudes))
+
+
+def cds_encoding(ds):
+    """Compressed float32 with one chunk per time step, as CDS writes its NetCDF files."""
+    return {
+        name: {'zlib': True, 'complevel': 1, 'shuffle': True, 'chunksizes': (1,) + da.shape[1:]}
+        for name, da in ds.data_vars.items()
+    }
+
+
+def build_payload(case, payload_dir, seed=DEFAULT_SEED):
+    """
+    Writes the zip for a case. Returns a dict with its path, the output
+    filename it is extracted to and the grid shape.
+    """
+    state, box = CASES[case]
+    times = chunk_times()
+    instant, accum = synthetic_streams(box, times, np.random.default_rng(seed))
+    zip_path = os.path.join(payload_dir, f"{case}.zip")
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_STORED) as zf:
+        for stream, ds in (('instant', instant), ('accum', accum)):
+            nc_path = os.path.join(payload_dir, STREAM_NAMES[stream])
+            ds.to_netcdf(nc_path, encoding=cds_encoding(ds))
+            zf.write(nc_path, arcname=STREAM_NAMES[stream])
+            os.remove(nc_path)
+    return {
+        'case': case,
+        'state': state,
+        'zip_path': zip_path,
+        'output_filename': build_output_filename(state, BENCH_YEAR, BENCH_LABEL),
+        'grid': [instant.sizes['valid_time'], instant.sizes['latitude'], instant.sizes['longitude']],
+        'payload_bytes': os.path.getsize(zip_path),
+    }
+
+
+# --- Stages ---
+
+@contextlib.contextmanager
+def measured(results, stage, nbytes, files, trace):
+    """Records the duration (and with trace, the tracemalloc peak) of the enclosed stage."""
+    if trace:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        peak = None
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        results[stage] = {'seconds': seconds, 'bytes': nbytes, 'files': files, 'peak_bytes': peak}
+
+
+def run_pass(payload, work_dir, trace=False):
+    """Runs every stage once on a fresh copy of the payload. Returns {stage: measurement}."""
+    shutil.rmtree(work_dir, ignore_errors=True)
+    data_dir = os.path.join(work_dir, "era5_data")
+    rollup_dir = os.path.join(work_dir, "rollups")
+    os.makedirs(data_dir)
+    os.makedirs(rollup_dir)
+    zip_path = os.path.join(data_dir, os.path.basename(payload['zip_path']))
+    shutil.copyfile(payload['zip_path'], zip_path)
+    results = {}
+
+    with measured(results, 'extract', payload['payload_bytes'], 1, trace):
+        with contextlib.redirect_stdout(io.StringIO()):
+            process_downloaded_file(zip_path, payload['output_filename'], output_dir=data_dir)
+    paths = [path for path in stream_paths(data_dir, payload['output_filename']) if os.path.exists(path)]
+    sizes = sum(os.path.getsize(path) for path in paths)
+
+    with measured(results, 'verify', sizes, len(paths), trace):
+        verified = [storage.verify_file(path) for path in paths]
+    if not all(verified):
+        raise RuntimeError(f"Synthetic files failed verification: {paths}")
+
+    with measured(results, 'repack', sizes, len(paths), trace):
+        for path in paths:
+            repack.repack_file(path)
+    sizes = sum(os.path.getsize(path) for path in paths)
+
+    with measured(results, 'rollup', sizes, len(paths), trace):
+        rollup.rollup_state(payload['state'], paths, rollup_dir)
+    return results
+
+
+def benchmark_case(payload, work_dir, repeat=DEFAULT_REPEAT):
+    """A traced warm-up pass for memory, then `repeat` timed passes. Returns {stage: summary}."""
+    warmup = run_pass(payload, work_dir, trace=True)
+    passes = [run_pass(payload, work_dir) for _ in range(repeat)]
+    summary = {}
+    for stage in STAGES:
+        timings = [p[stage]['seconds'] for p in passes]
+        best = min(timings)
+        nbytes, files = passes[0][stage]['bytes'], passes[0][stage]['files']
+        summary[stage] = {
+            'seconds': best,
+            'median_seconds': statistics.median(timings),
+            'bytes': nbytes,
+            'files': files,
+            'mb_per_s': nbytes / 1e6 / best if best else None,
+            'files_per_s': files / best if best else None,
+            'peak_traced_mb': warmup[stage]['peak_bytes'] / 1e6,
+        }
+    return summary
+
+
+# --- Results ---
+
+def machine_info():
+    import netCDF4
+
+    return {
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpus': os.cpu_count(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'xarray': xr.__version__,
+        'netCDF4': netCDF4.__version__,
+        'hdf5': netCDF4.__hdf5libversion__,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def max_rss_mb():
+    """Peak resident memory of this process so far (None where the resource module is missing)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    scale = 1 if platform.system() == 'Darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+def previous_run(results_file, config):
+    """The latest earlier run with the same configuration, or None."""
+    if not os.path.exists(results_file):
+        return None
+    latest = None
+    with open(results_file) as f:
+        for line in f:
+            try:
+                run = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if run.get('config') == config:
+                latest = run
+    return latest
+
+
+def print_case(case, payload, summary, previous=None):
+    time_steps, rows, columns = payload['grid']
+    print(f"\n--- {case}: {payload['state']}, {rows} x {columns} cells, {time_steps} hours, "
+          f"{payload['payload_bytes'] / 1e6:.1f} MB zipped ---")
+    print(f"{'stage':<10}{'best s':>9}{'median s':>10}{'MB/s':>9}{'files/s':>9}{'peak MB':>9}{'vs last':>9}")
+    for stage, result in summary.items():
+        versus = ""
+        if previous and stage in previous:
+            # Above 1 means this run is faster
+            versus = f"{previous[stage]['seconds'] / result['seconds']:.2f}x"
+        print(f"{stage:<10}{result['seconds']:>9.3f}{result['median_seconds']:>10.3f}{result['mb_per_s']:>9.1f}"
+              f"{result['files_per_s']:>9.2f}{result['peak_traced_mb']:>9.1f}{versus:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark extract/verify/repack/rollup on synthetic ERA5-like files.")
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help="Timed passes per case (the best counts).")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--output', default=RESULTS_FILE, help="JSON lines file the run is appended to.")
+    args = parser.parse_args()
+
+    config = {'cases': args.cases, 'year': BENCH_YEAR, 'label': BENCH_LABEL, 'repeat': max(args.repeat, 1), 'seed': args.seed}
+    machine = machine_info()
+    previous = previous_run(args.output, config)
+    if previous and previous.get('machine') != machine:
+        print("Note: the previous run of this configuration was on a different machine or library versions.")
+
+    temp_dir = tempfile.mkdtemp(prefix="era5_bench_")
+    results = {}
+    try:
+        for case in args.cases:
+            print(f"Generating the {case} payload...")
+            payload = build_payload(case, temp_dir, seed=args.seed)
+            summary = benchmark_case(payload, os.path.join(temp_dir, "work"), repeat=config['repeat'])
+            print_case(case, payload, summary, previous and previous['results'].get(case, {}).get('stages'))
+            results[case] = {
+                'state': payload['state'],
+                'grid': payload['grid'],
+                'payload_bytes': payload['payload_bytes'],
+                'stages': summary,
+            }
+            os.remove(payload['zip_path'])
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    run = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'config': config,
+        'machine': machine,
+        'max_rss_mb': max_rss_mb(),
+        'results': results,
+    }
+    with open(args.output, 'a') as f:
+        f.write(json.dumps(run) + "\n")
+    print(f"\nResults appended to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
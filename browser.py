@@ -0,0 +1,76 @@
+"""
+The CDS website session shared by the scripts that read the 'Your requests'
+page (manager.py, retrieve.py, update_status.py and pipeline.py). This is
+where selenium is imported, so only browser-based commands load it.
+"""
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+from selenium.webdriver.common.by import By
+from selenium.webdriver.common.keys import Keys
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+from webdriver_manager.chrome import ChromeDriverManager
+
+CDS_URL = "https://cds.climate.copernicus.eu/"
+REQUESTS_URL = "https://cds.climate.copernicus.eu/requests?tab=all"
+# One row per request on 'Your requests', carrying the request ID
+REQUEST_ROW_SELECTOR = "div[data-requid]"
+
+
+def start_driver():
+    """A Chrome session, with the matching chromedriver installed on first use."""
+    service = ChromeService(ChromeDriverManager().install())
+    return webdriver.Chrome(service=service)
+
+
+def login(driver, account, log=print):
+    """
+    Logs the browser into CDS as the given account, past the cookie banner,
+    and waits for the request list on 'Your requests'. Progress goes to `log`
+    (print for the scripts, logger.info for the manager).
+    """
+    log(f"[{account.name}] Attempting login...")
+    # Action 1: Go to the website
+    driver.get(CDS_URL)
+
+    # Action 2: Handle Cookie Banner
+    try:
+        log("Waiting for cookie banner...")
+        WebDriverWait(driver, 5).until(
+            EC.element_to_be_clickable((By.XPATH, "//button[text()='Deny all']"))
+        ).click()
+        log("Clicked 'Deny all' on cookie banner.")
+    except Exception:
+        log("Cookie banner not found or 'Deny all' not clickable. Continuing...")
+
+    # Action 3: Click "Login - Register"
+    log("Waiting for Login button...")
+    WebDriverWait(driver, 10).until(
+        EC.element_to_be_clickable((By.XPATH, "//button[.//p[text()='Login - Register']]"))
+    ).click()
+
+    # Action 4: Input Username and Password
+    log("Waiting for login form...")
+    username_field = WebDriverWait(driver, 10).until(
+        EC.visibility_of_element_located((By.ID, "username"))
+    )
+    
+    log("Entering credentials...")
+    username_field.send_keys(account.username)
+    driver.find_element(By.ID, "password").send_keys(account.password)
+
+    # Action 5: Hit Enter
+    log("Logging in...")
+    driver.find_element(By.ID, "password").send_keys(Keys.RETURN)
+
+    # Action 6: Click "Your requests"
+    log("Waiting for 'Your requests' link...")
+    WebDriverWait(driver, 10).until(
+        EC.element_to_be_clickable((By.LINK_TEXT, "Your requests"))
+    ).click()
+    
+    # Wait for the page to load
+    WebDriverWait(driver, 10).until(
+        EC.visibility_of_element_located((By.CSS_SELECTOR, REQUEST_ROW_SELECTOR))
+    )
+    log(f"[{account.name}] Login successful. On 'Your requests' page.")
@@ -0,0 +1,77 @@
+"""
+Single entry point for the workflow scripts:
+
+    python cli.py submit              # submit.py: single-account submitter
+    python cli.py status              # update_status.py: scrape 'Your requests' into requests.db
+    python cli.py retrieve            # retrieve.py: download completed requests
+    python cli.py upload              # upload.py: publish to Kaggle
+    python cli.py peek --watch        # peek.db.py: database summary or live dashboard
+    python cli.py daemon --profile    # manager.py: the long-running manager
+
+Everything after the subcommand is passed to the script, so each keeps its
+own options (`python cli.py <command> --help`). A script, and with it
+selenium, cdsapi or xarray, is only imported when its subcommand runs, so
+quick commands such as `peek` start without loading the browser and API
+stacks. The scripts can still be run directly as before.
+"""
+import importlib
+import importlib.util
+import os
+import sys
+
+# Subcommand -> (module, or script file for names that are not importable, help)
+COMMANDS = {
+    'submit': ('submit', "Submit the missing chunks with one account."),
+    'status': ('update_status', "Scrape 'Your requests' with a browser and update requests.db."),
+    'retrieve': ('retrieve', "Download and unzip completed requests."),
+    'upload': ('upload', "Stage the finalized files and publish them to Kaggle."),
+    'peek': ('peek.db.py', "Summarize requests.db, or --watch the progress dashboard."),
+    'daemon': ('manager', "Run the manager: status, submission and assembly every cycle."),
+    'pipeline': ('pipeline', "Run the lease-coordinated worker processes."),
+    'plan': ('planner', "Estimate jobs, bytes and time of the download plan."),
+    'simulate': ('simulate', "Replay the plan through the scheduler offline."),
+    'repack': ('repack', "Repack downloaded files for size and read speed."),
+    'derive': ('derive', "Compute derived variables."),
+    'rollup': ('rollup', "Update or query the daily and monthly state rollups."),
+    'storage': ('storage', "Demote, evict or rehydrate raw files."),
+    'benchmark': ('benchmark', "Benchmark the processing stages on synthetic files."),
+    'rolling': ('rolling', "Show or rebuild the near-real-time tail past the configured years."),
+}
+
+
+def load(target):
+    """Imports a module by name, or a script such as peek.db.py by its path next to this file."""
+    if not target.endswith('.py'):
+        return importlib.import_module(target)
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), target)
+    spec = importlib.util.spec_from_file_location(target[:-len(".py")].replace('.', '_'), path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def usage():
+    lines = [f"usage: {os.path.basename(sys.argv[0])} <command> [options]", "", "commands:"]
+    width = max(len(name) for name in COMMANDS)
+    lines += [f"  {name:<{width}}  {text}" for name, (_, text) in COMMANDS.items()]
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage())
+        return 0
+    command, args = argv[0], argv[1:]
+    if command not in COMMANDS:
+        print(f"Unknown command '{command}'.\n\n{usage()}", file=sys.stderr)
+        return 2
+
+    module = load(COMMANDS[command][0])
+    # The script parses sys.argv as if it had been started directly
+    sys.argv = [f"{os.path.basename(sys.argv[0])} {command}"] + args
+    return module.main()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
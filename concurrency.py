@@ -0,0 +1,166 @@
+import sqlite3
+from datetime import datetime
+
+# --- Slot Controller Configuration ---
+# The active-request target moves between SLOT_FLOOR and SLOT_CEILING:
+# +SLOT_INCREASE per cycle while the queue is short and everything is
+# accepted, multiplied down when CDS pushes back.
+SLOT_FLOOR = 1
+SLOT_CEILING = 16               # hard ceiling, never exceeded
+SLOT_INCREASE = 1
+LIMIT_ERROR_FACTOR = 0.5        # after an HTTP 429 / "too many requests" error
+CONGESTION_FACTOR = 0.75        # after rejections or a long queue
+# Queue waits are measured from started_at, which the status scrape stamps
+# once per poll, so a measured wait overstates the real one by up to one
+# poll interval. The thresholds are raised by that interval.
+QUEUE_WAIT_LOW_SECONDS = 30 * 60
+QUEUE_WAIT_HIGH_SECONDS = 3 * 3600
+REJECTION_RATE_HIGH = 0.2
+
+ACTIVE_STATUSES = ('accepted', 'queued', 'running')
+
+# Messages of API errors about the number of queued or running requests.
+# Per-request cost or size limits ("cost limits exceeded", "request too
+# large") are rejections of that one request and say nothing about slots.
+LIMIT_ERROR_MARKERS = (
+    '429',
+    'too many requests',
+    'too many queued',
+    'too many active',
+    'number of api queued requests',
+    'queued requests',
+    'temporarily limited',
+    'temporally limited',
+    'rate limit',
+    'concurrent requests',
+)
+
+
+def is_limit_error(error):
+    """True for API errors that mean the account has too many requests queued or running."""
+    text = str(error).lower()
+    return any(marker in text for marker in LIMIT_ERROR_MARKERS)
+
+
+def setup_metrics_table(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS slot_metrics (
+        recorded_at TIMESTAMP NOT NULL,
+        account TEXT NOT NULL,
+        target REAL NOT NULL,
+        active INTEGER,
+        queue_wait_seconds REAL,
+        rejection_rate REAL,
+        limit_errors INTEGER
+    )
+    """)
+    conn.commit()
+
+
+def load_slot_target(conn, account, default):
+    """Returns the last recorded target for an account, or the default."""
+    try:
+        row = conn.execute(
+            "SELECT target FROM slot_metrics WHERE account = ? ORDER BY recorded_at DESC LIMIT 1",
+            (account,)
+        ).fetchone()
+    except sqlite3.OperationalError:
+        # No metrics table yet
+        return default
+    return row[0] if row else default
+
+
+class SlotController:
+    """AIMD controller for one account's active-request target."""
+
+    def __init__(self, account, initial, floor=SLOT_FLOOR, ceiling=SLOT_CEILING, poll_seconds=0, now=None):
+        self.account = account
+        self.floor = floor
+        self.ceiling = ceiling
+        self.target = float(min(max(initial, floor), ceiling))
+        self.limit_errors = 0
+        self.wait_low = QUEUE_WAIT_LOW_SECONDS + poll_seconds
+        self.wait_high = QUEUE_WAIT_HIGH_SECONDS + poll_seconds
+        # The first observation only judges what happened since the controller started
+        self.last_observed_at = now or datetime.now()
+
+    @property
+    def slots(self):
+        return int(self.target)
+
+    def record_limit_error(self):
+        self.limit_errors += 1
+
+    def observe(self, conn, active, logger, now=None):
+        """
+        Updates the target from what happened since the previous cycle:
+        queue wait of requests that started running, share of finished
+        requests that were rejected, and limit errors seen on submission.
+        A cycle in which nothing started gives no queue-wait signal.
+        """
+        now = now or datetime.now()
+        since = self.last_observed_at
+        queue_wait = observed_queue_wait(conn, self.account, since)
+        rejection_rate = observed_rejection_rate(conn, self.account, since)
+        previous = self.target
+
+        if self.limit_errors:
+            self.target *= LIMIT_ERROR_FACTOR
+            reason = f"{self.limit_errors} limit error(s)"
+        elif rejection_rate is not None and rejection_rate > REJECTION_RATE_HIGH:
+            self.target *= CONGESTION_FACTOR
+            reason = f"rejection rate {rejection_rate:.0%}"
+        elif queue_wait is not None and queue_wait > self.wait_high:
+            self.target *= CONGESTION_FACTOR
+            reason = f"queue wait {queue_wait / 60:.0f} min"
+        elif active >= self.slots and queue_wait is not None and queue_wait < self.wait_low:
+            # Every slot in use and jobs start quickly: probe for more
+            self.target += SLOT_INCREASE
+            reason = "short queue, all slots busy"
+        else:
+            reason = "steady"
+        self.target = min(max(self.target, self.floor), self.ceiling)
+
+        wait_text = f"{queue_wait / 60:.0f} min" if queue_wait is not None else "n/a"
+        rate_text = f"{rejection_rate:.0%}" if rejection_rate is not None else "n/a"
+        logger.info(
+            f"[{self.account}] Slot target {previous:.2f} -> {self.target:.2f} ({reason}). "
+            f"Active: {active}, queue wait: {wait_text}, rejections: {rate_text}, limit errors: {self.limit_errors}"
+        )
+        conn.execute(
+            "INSERT INTO slot_metrics (recorded_at, account, target, active, queue_wait_seconds, rejection_rate, limit_errors) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (now, self.account, self.target, active, queue_wait, rejection_rate, self.limit_errors)
+        )
+        conn.commit()
+
+        self.limit_errors = 0
+        self.last_observed_at = now
+        return self.slots
+
+
+def observed_queue_wait(conn, account, since):
+    """Median seconds from submission to start for requests that started after `since`."""
+    rows = conn.execute(
+        "SELECT created_at, started_at FROM requests WHERE account = ? AND started_at IS NOT NULL AND started_at > ?",
+        (account, since)
+    ).fetchall()
+    waits = sorted(
+        (datetime.fromisoformat(str(started)) - datetime.fromisoformat(str(created))).total_seconds()
+        for created, started in rows
+    )
+    if not waits:
+        return None
+    return waits[len(waits) // 2]
+
+
+def observed_rejection_rate(conn, account, since):
+    """Share of requests finishing after `since` that failed."""
+    row = conn.execute(
+        "SELECT COUNT(*), SUM(CASE WHEN status = 'failed' THEN 1 ELSE 0 END) FROM requests "
+        "WHERE account = ? AND finished_at IS NOT NULL AND finished_at > ?",
+        (account, since)
+    ).fetchone()
+    finished, failed = row[0], row[1] or 0
+    if not finished:
+        return None
+    return failed / finished
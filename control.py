@@ -0,0 +1,289 @@
+"""
+Local control API for a running manager.py.
+
+The manager serves JSON over HTTP on 127.0.0.1:CONTROL_PORT (default 8788,
+clear of fake_cds.py's 8765):
+
+    GET  /status    cycle phase, per-account slot usage, in-flight requests and downloads
+    GET  /queue     head of the submission priority queue from the last cycle
+    POST /cycle     run a status/submit cycle now instead of waiting out the sleep
+    POST /pause     stop submitting new requests (status polling continues)
+    POST /resume    undo /pause
+    POST /drain     stop submitting and exit once no request is active on CDS
+
+The POST routes change what the manager does, so they need the token in an
+`Authorization: Bearer <token>` header. The token is CONTROL_TOKEN from the
+environment or, if that is not set, a random one the manager writes to
+CONTROL_TOKEN_FILE (readable by its user only) when the server starts.
+
+From a shell (the token is picked up the same way):
+
+    python control.py status
+    python control.py cycle
+"""
+import argparse
+import hmac
+import json
+import os
+import secrets
+import sqlite3
+import sys
+import threading
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTROL_HOST = "127.0.0.1"
+CONTROL_PORT = int(os.getenv("CONTROL_PORT", "8788"))
+CONTROL_TOKEN = os.getenv("CONTROL_TOKEN")
+CONTROL_TOKEN_FILE = os.getenv("CONTROL_TOKEN_FILE", ".control_token")
+QUEUE_PREVIEW_SIZE = 50
+
+
+class ControlState:
+    """
+    Shared between the manager's main loop and the HTTP thread. The main loop
+    publishes what it is doing; the HTTP thread flips the flags and wakes it.
+    """
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.paused = False
+        self.draining = False
+        self.cycle = 0
+        self.phase = 'starting'
+        self.next_cycle_at = None
+        self.accounts = {}
+        self.submitting = None
+        self.queue_length = 0
+        self.queue_head = []
+
+    # --- Called from the main loop ---
+
+    def set_phase(self, phase):
+        with self.lock:
+            self.phase = phase
+
+    def start_cycle(self):
+        # Cleared before the cycle's work, so a request arriving during it
+        # makes the next wait() return at once instead of being lost
+        self.wake.clear()
+        with self.lock:
+            self.cycle += 1
+            self.next_cycle_at = None
+
+    def publish_accounts(self, accounts, active_counts):
+        with self.lock:
+            self.accounts = {
+                account.name: {
+                    'active': active_counts.get(account.name),
+                    'slots': account.controller.slots if account.controller else account.max_active,
+                    'status_source': account.status_source,
+                }
+                for account in accounts
+            }
+
+    def publish_queue(self, queue):
+        head = [
+            {'output_filename': job['output_filename'], 'priority': round(priority, 3), 'retry': bool(job['retry_of'])}
+            for priority, job in queue.peek(QUEUE_PREVIEW_SIZE)
+        ]
+        with self.lock:
+            self.queue_length = len(queue)
+            self.queue_head = head
+
+    def set_submitting(self, filename):
+        with self.lock:
+            self.submitting = filename
+
+    def submissions_allowed(self):
+        return not (self.paused or self.draining)
+
+    def wait(self, seconds):
+        """
+        Sleeps like time.sleep() but returns early when a cycle is requested,
+        including one requested while the last cycle was running. The event is
+        left set for start_cycle() to clear. Returns True if woken by a request.
+        """
+        with self.lock:
+            self.phase = 'sleeping'
+            self.next_cycle_at = datetime.now() + timedelta(seconds=seconds)
+        return self.wake.wait(seconds)
+
+    # --- Called from the HTTP thread ---
+
+    def request_cycle(self):
+        self.wake.set()
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+
+    def drain(self):
+        self.draining = True
+        self.wake.set()
+
+    def in_flight(self):
+        """Active CDS requests per account/status and finished ones still to be downloaded."""
+        conn = sqlite3.connect(self.db_name)
+        try:
+            rows = conn.execute(
+                "SELECT account, status, COUNT(*) FROM requests WHERE status IN ('accepted', 'queued', 'running') GROUP BY account, status"
+            ).fetchall()
+            awaiting_download = conn.execute(
+                "SELECT COUNT(*) FROM requests WHERE status = 'completed' AND download = 0"
+            ).fetchone()[0]
+        finally:
+            conn.close()
+        active = {}
+        for account, status, count in rows:
+            active.setdefault(account, {})[status] = count
+        return {'active': active, 'awaiting_download': awaiting_download}
+
+    def snapshot(self):
+        with self.lock:
+            status = {
+                'cycle': self.cycle,
+                'phase': self.phase,
+                'paused': self.paused,
+                'draining': self.draining,
+                'next_cycle_at': self.next_cycle_at.isoformat(timespec='seconds') if self.next_cycle_at else None,
+                'accounts': dict(self.accounts),
+                'submitting': self.submitting,
+                'queue_length': self.queue_length,
+            }
+        status['requests'] = self.in_flight()
+        return status
+
+    def queue_snapshot(self):
+        with self.lock:
+            return {'queue_length': self.queue_length, 'head': list(self.queue_head)}
+
+
+def create_token(path=CONTROL_TOKEN_FILE):
+    """Writes a new random token to `path`, readable and writable by the owner only. Returns it."""
+    token = secrets.token_urlsafe(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token + "\n")
+    os.chmod(path, 0o600)
+    return token
+
+
+def load_token(path=CONTROL_TOKEN_FILE):
+    """The token a client sends: CONTROL_TOKEN, or the one the manager wrote. None if neither exists."""
+    if CONTROL_TOKEN:
+        return CONTROL_TOKEN
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class ControlHandler(BaseHTTPRequestHandler):
+    state = None
+    logger = None
+    token = None
+
+    def _reply(self, code, body):
+        data = json.dumps(body, indent=1).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/status':
+            try:
+                return self._reply(200, self.state.snapshot())
+            except sqlite3.Error as e:
+                return self._reply(500, {'error': str(e)})
+        if self.path == '/queue':
+            return self._reply(200, self.state.queue_snapshot())
+        self._reply(404, {'error': f"unknown path {self.path}"})
+
+    def do_POST(self):
+        actions = {
+            '/cycle': self.state.request_cycle,
+            '/pause': self.state.pause,
+            '/resume': self.state.resume,
+            '/drain': self.state.drain,
+        }
+        action = actions.get(self.path)
+        if action is None:
+            return self._reply(404, {'error': f"unknown path {self.path}"})
+        if not self.authorized():
+            self.logger.warning(f"Control: rejected {self.path[1:]} without a valid token.")
+            return self._reply(401, {'error': "missing or invalid token"})
+        action()
+        self.logger.info(f"Control: {self.path[1:]} requested.")
+        self._reply(200, {'ok': True, 'paused': self.state.paused, 'draining': self.state.draining})
+
+    def authorized(self):
+        header = self.headers.get('Authorization', '')
+        scheme, _, token = header.partition(' ')
+        return scheme == 'Bearer' and hmac.compare_digest(token.strip().encode(), self.token.encode())
+
+    def log_message(self, format, *args):
+        self.logger.debug("Control API: " + format % args)
+
+
+def start_control_server(state, logger, host=CONTROL_HOST, port=CONTROL_PORT, token=CONTROL_TOKEN):
+    """Serves the control API from a daemon thread. Returns the server (None if the port is taken)."""
+    try:
+        token = token or create_token()
+    except OSError as e:
+        logger.error(f"Control API disabled: cannot write {CONTROL_TOKEN_FILE} ({e})")
+        return None
+    handler = type('BoundControlHandler', (ControlHandler,), {'state': state, 'logger': logger, 'token': token})
+    try:
+        server = ThreadingHTTPServer((host, port), handler)
+    except OSError as e:
+        logger.error(f"Control API disabled: cannot listen on {host}:{port} ({e})")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='control-api', daemon=True).start()
+    logger.info(f"Control API listening on http://{host}:{port}")
+    return server
+
+
+def main():
+    commands = {'status': 'GET', 'queue': 'GET', 'cycle': 'POST', 'pause': 'POST', 'resume': 'POST', 'drain': 'POST'}
+    parser = argparse.ArgumentParser(description="Talk to a running manager.py.")
+    parser.add_argument('command', choices=list(commands))
+    parser.add_argument('--port', type=int, default=CONTROL_PORT)
+    args = parser.parse_args()
+
+    headers = {}
+    if commands[args.command] == 'POST':
+        token = load_token()
+        if not token:
+            print(f"No token: set CONTROL_TOKEN or start the manager, which writes {CONTROL_TOKEN_FILE}.")
+            sys.exit(1)
+        headers['Authorization'] = f"Bearer {token}"
+    request = urllib.request.Request(
+        f"http://{CONTROL_HOST}:{args.port}/{args.command}",
+        data=b'' if commands[args.command] == 'POST' else None,
+        headers=headers,
+        method=commands[args.command],
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            print(json.dumps(json.load(response), indent=2))
+    except urllib.error.HTTPError as e:
+        print(f"The manager refused '{args.command}': {e.code} {json.load(e).get('error', e.reason)}")
+        sys.exit(1)
+    except (urllib.error.URLError, ConnectionError) as e:
+        print(f"Could not reach the manager on port {args.port}: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+The requests table: its schema, the columns added since the first version
+and the indexes, shared by every script that writes requests.db. Databases
+from older versions pick up new columns the next time any of them starts.
+"""
+import logging
+import sqlite3
+
+import fingerprints
+from accounts import DEFAULT_ACCOUNT
+from concurrency import setup_metrics_table
+from config import DB_NAME
+
+# Columns added after the original schema. Applied with ALTER TABLE so that
+# existing databases pick them up on the next start.
+REQUEST_COLUMN_MIGRATIONS = {
+    'download': "BOOLEAN DEFAULT 0",
+    'attempts': "INTEGER DEFAULT 1",
+    'next_retry_at': "TIMESTAMP",
+    'parent_filename': "TEXT",
+    'parts': "INTEGER",
+    'account': f"TEXT DEFAULT '{DEFAULT_ACCOUNT}'",
+    'started_at': "TIMESTAMP",
+    'finished_at': "TIMESTAMP",
+    # Multi-process pipeline (pipeline.py)
+    'fetched_path': "TEXT",
+    'uploaded': "BOOLEAN DEFAULT 0",
+    'lease_owner': "TEXT",
+    'lease_expires_at': "TIMESTAMP",
+    # Variables left out of the request because the area has no data for them
+    'pruned_variables': "TEXT",
+    # Storage tier of the downloaded file (storage.py): hot, cold or evicted
+    'storage_tier': "TEXT DEFAULT 'hot'",
+    'tier_changed_at': "TIMESTAMP",
+    'last_accessed_at': "TIMESTAMP",
+    # Rolling near-real-time mode (rolling.py): ERA5T part awaiting final data
+    'preliminary': "BOOLEAN DEFAULT 0",
+    'final_check_at': "TIMESTAMP",
+    # When the output was downloaded (or assembled); updated_at moves on every scrape
+    'downloaded_at': "TIMESTAMP",
+}
+
+def ensure_columns(c, table, columns):
+    """Adds any missing columns (name -> declaration) to an existing table."""
+    c.execute(f"PRAGMA table_info({table})")
+    existing = {row[1] for row in c.fetchall()}
+    for name, declaration in columns.items():
+        if name not in existing:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {name} {declaration}")
+
+def column_default(declaration):
+    """The SQL default of a column declaration such as "INTEGER DEFAULT 1" ('NULL' if none)."""
+    return declaration.split(" DEFAULT ", 1)[1] if " DEFAULT " in declaration else "NULL"
+
+def connect_read_only(db_name=DB_NAME):
+    """
+    Opens the database without changing it, for tools that only report.
+    Columns an older database lacks read as their migration default, through
+    a temporary view that shadows the requests table for this connection.
+    """
+    conn = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True)
+    existing = {row[1] for row in conn.execute("PRAGMA table_info(requests)")}
+    missing = [name for name in REQUEST_COLUMN_MIGRATIONS if name not in existing]
+    if existing and missing:
+        defaults = ", ".join(f"{column_default(REQUEST_COLUMN_MIGRATIONS[name])} AS {name}" for name in missing)
+        conn.execute(f"CREATE TEMP VIEW requests AS SELECT *, {defaults} FROM main.requests")
+    return conn
+
+def setup_database(logger=None):
+    """Creates the database table if it doesn't exist and applies the migrations."""
+    logger = logger or logging.getLogger(__name__)
+    try:
+        conn = sqlite3.connect(DB_NAME)
+        c = conn.cursor()
+        # Add the 'download' column from your add_column script
+        c.execute("""
+        CREATE TABLE IF NOT EXISTS requests (
+            request_id TEXT PRIMARY KEY,
+            state_abbr TEXT NOT NULL,
+            year TEXT NOT NULL,
+            output_filename TEXT NOT NULL UNIQUE,
+            status TEXT NOT NULL,
+            location TEXT,
+            content_length INTEGER,
+            download BOOLEAN DEFAULT 0, 
+            created_at TIMESTAMP NOT NULL,
+            updated_at TIMESTAMP NOT NULL
+        )
+        """)
+        ensure_columns(c, 'requests', REQUEST_COLUMN_MIGRATIONS)
+        # Keeps incremental reads (peek.db.py --watch) cheap while the manager writes
+        c.execute("CREATE INDEX IF NOT EXISTS idx_requests_updated_at ON requests (updated_at)")
+        conn.commit()
+        setup_metrics_table(conn)
+        conn.close()
+        fingerprints.setup_fingerprint_db()
+        logger.info("Database setup complete.")
+    except Exception as e:
+        logger.error(f"Failed to setup database: {e}")
@@ -0,0 +1,233 @@
+"""
+Derived-variable stage: computes the fields every forecasting job needs from
+the raw ERA5 variables and caches them next to each source file.
+
+    python derive.py                # every file in era5_data that needs it
+    python derive.py --workers 4 era5_data/ERA5_hourly_multivariable_TX_2021_Jan-Mar_instant.nc
+
+For <name>.nc the results are written to <name>.derived.nc, tagged with the
+SHA-256 of the source. A later run (or load_derived()) reuses the cache as
+long as the source is unchanged, so only new downloads are computed.
+"""
+import argparse
+import hashlib
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import xarray as xr
+
+import storage
+from naming import parse_output_filename
+
+DEFAULT_DATA_DIR = "era5_data"
+DERIVED_SUFFIX = ".derived.nc"
+# Time steps processed per chunk; bounds memory for the largest state boxes
+DERIVE_CHUNK_HOURS = 24 * 31
+DEFAULT_WORKERS = max((os.cpu_count() or 2) - 1, 1)
+
+
+# --- Vectorized formulas (all inputs are float32 NumPy arrays) ---
+
+def wind_speed(u, v):
+    return np.hypot(u, v)
+
+
+def wind_direction(u, v):
+    """Meteorological direction the wind blows from, in degrees (0 = north)."""
+    return np.mod(270.0 - np.degrees(np.arctan2(v, u)), 360.0)
+
+
+def kelvin_to_celsius(t):
+    return t - 273.15
+
+
+def saturation_vapour_pressure(t_celsius):
+    """Magnus formula, hPa."""
+    return 6.112 * np.exp(17.67 * t_celsius / (t_celsius + 243.5))
+
+
+def relative_humidity(t, td):
+    """Relative humidity in % from 2 m temperature and dewpoint (both K)."""
+    rh = 100.0 * saturation_vapour_pressure(td - 273.15) / saturation_vapour_pressure(t - 273.15)
+    return np.clip(rh, 0.0, 100.0)
+
+
+def hourly_precipitation_mm(tp):
+    """
+    ERA5 reanalysis total_precipitation is accumulated over the hour ending at
+    each time step, in metres. Converted to mm; small negative packing
+    artefacts are clipped to zero.
+    """
+    return np.maximum(tp, 0.0) * 1000.0
+
+
+# name -> (input variables, function, units)
+DERIVATIONS = {
+    'wind_speed_10m': (('u10', 'v10'), wind_speed, 'm s-1'),
+    'wind_direction_10m': (('u10', 'v10'), wind_direction, 'degree'),
+    't2m_celsius': (('t2m',), kelvin_to_celsius, 'degC'),
+    'd2m_celsius': (('d2m',), kelvin_to_celsius, 'degC'),
+    'relative_humidity_2m': (('t2m', 'd2m'), relative_humidity, '%'),
+    'precipitation_mm': (('tp',), hourly_precipitation_mm, 'mm'),
+}
+
+
+def derived_path(source_path):
+    return source_path[:-len(".nc")] + DERIVED_SUFFIX
+
+
+def file_sha256(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_is_valid(source_path, cache_path):
+    """
+    True if the cache was built from the current source. Size and mtime are
+    checked first so unchanged files are not re-hashed on every run.
+    """
+    if not os.path.exists(cache_path):
+        return False
+    try:
+        with xr.open_dataset(cache_path) as cached:
+            attrs = dict(cached.attrs)
+    except Exception:
+        return False
+    stat = os.stat(source_path)
+    if attrs.get('source_size') == stat.st_size and attrs.get('source_mtime') == stat.st_mtime:
+        return True
+    return attrs.get('source_sha256') == file_sha256(source_path)
+
+
+def derive_to_netcdf(ds, path, attrs=None, chunk_hours=DERIVE_CHUNK_HOURS):
+    """
+    Computes every derivation whose inputs are present, chunk by chunk along
+    time, and writes each chunk straight into the variables of a new NetCDF
+    file at `path`, so memory stays bounded by one chunk whatever the file size.
+    Returns False (and writes nothing) if no derivation applies.
+    """
+    import netCDF4
+
+    time_dim = 'valid_time' if 'valid_time' in ds.dims else 'time'
+    wanted = {name: spec for name, spec in DERIVATIONS.items() if all(v in ds for v in spec[0])}
+    if not wanted:
+        return False
+    inputs = sorted({v for spec in wanted.values() for v in spec[0]})
+    template = ds[inputs[0]].transpose(time_dim, ...)
+
+    # Coordinates (small) go through xarray so their encoding matches the source
+    skeleton = xr.Dataset(coords=template.coords)
+    skeleton.attrs.update(attrs or {})
+    skeleton.to_netcdf(path)
+
+    with netCDF4.Dataset(path, 'a') as nc:
+        for dim, size in zip(template.dims, template.shape):
+            if dim not in nc.dimensions:
+                nc.createDimension(dim, size)
+        variables = {}
+        for name, (_, _, units) in wanted.items():
+            variables[name] = nc.createVariable(name, 'f4', template.dims, zlib=True, complevel=4)
+            variables[name].units = units
+
+        n_times = ds.sizes[time_dim]
+        for start in range(0, n_times, chunk_hours):
+            window = slice(start, min(start + chunk_hours, n_times))
+            arrays = {
+                v: ds[v].transpose(time_dim, ...).isel({time_dim: window}).values.astype(np.float32)
+                for v in inputs
+            }
+            for name, (needs, func, _) in wanted.items():
+                variables[name][window] = func(*(arrays[v] for v in needs))
+    return True
+
+
+def derive_file(source_path, force=False):
+    """
+    Builds (or reuses) the derived cache for one source file.
+    Returns (source_path, status) where status is 'cached', 'derived' or 'skipped'.
+    """
+    storage.ensure_hot(source_path)
+    cache_path = derived_path(source_path)
+    if not force and cache_is_valid(source_path, cache_path):
+        return source_path, 'cached'
+
+    stat = os.stat(source_path)
+    attrs = {
+        'source_file': os.path.basename(source_path),
+        'source_sha256': file_sha256(source_path),
+        'source_size': stat.st_size,
+        'source_mtime': stat.st_mtime,
+    }
+    temp_path = cache_path + ".tmp"
+    try:
+        with xr.open_dataset(source_path) as ds:
+            if not derive_to_netcdf(ds, temp_path, attrs):
+                return source_path, 'skipped'
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    os.replace(temp_path, cache_path)
+    return source_path, 'derived'
+
+
+def load_derived(source_path):
+    """Opens the derived fields for a source file, computing them on a cache miss."""
+    derive_file(source_path)
+    return xr.open_dataset(derived_path(source_path))
+
+
+def source_files(data_dir=DEFAULT_DATA_DIR):
+    """Every downloaded output file (monthly/box parts excluded) in the data directory."""
+    paths = []
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            parsed = parse_output_filename(entry.name)
+            if parsed and not (parsed['month'] or parsed['box']) and entry.is_file():
+                paths.append(entry.path)
+    return sorted(paths)
+
+
+def derive_all(paths, workers=DEFAULT_WORKERS, force=False):
+    """Runs derive_file over many files in a process pool. Returns {status: count}."""
+    counts = {'cached': 0, 'derived': 0, 'skipped': 0, 'failed': 0}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(derive_file, path, force): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                _, status = future.result()
+            except Exception as e:
+                print(f"  > FAILED {os.path.basename(path)}: {e}")
+                status = 'failed'
+            if status == 'derived':
+                print(f"  > Derived {os.path.basename(path)}")
+            counts[status] += 1
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute and cache derived variables for downloaded ERA5 files.")
+    parser.add_argument('files', nargs='*', help="Source files (default: every file in era5_data).")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--force', action='store_true', help="Recompute even if the cache is valid.")
+    args = parser.parse_args()
+
+    paths = args.files or source_files()
+    if not paths:
+        print("No source files found.")
+        sys.exit(0)
+
+    print(f"--- Deriving variables for {len(paths)} files with {args.workers} workers ---")
+    counts = derive_all(paths, workers=args.workers, force=args.force)
+    print(f"--- Done: {counts['derived']} derived, {counts['cached']} cached, "
+          f"{counts['skipped']} without inputs, {counts['failed']} failed ---")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Local stand-in for the CDS API, for exercising the manager without touching
+the real service or its queue.
+
+It speaks the legacy cdsapi protocol (POST /resources/<dataset>,
+GET /tasks/<request_id>) and serves a small zip for each completed request.
+Jobs move from 'queued' to 'running' to 'completed' on a timer, and a
+configurable fraction is rejected so the retry path can be tested.
+DELETE /tasks/<request_id> is recorded and logged, and the request is gone
+afterwards, as on CDS: a client that deletes requests before they are
+downloaded shows up as failed downloads.
+
+Usage:
+    python fake_cds.py --port 8765 --queue-seconds 30 --run-seconds 30
+
+Then point one or more accounts at it in .env, for example:
+    CDS_ACCOUNTS=local1,local2
+    CDS_API_URL_LOCAL1=http://127.0.0.1:8765
+    CDS_API_KEY_LOCAL1=1:local-key      (legacy 'uid:key' form)
+    CDS_STATUS_SOURCE_LOCAL1=api
+"""
+import argparse
+import io
+import json
+import threading
+import time
+import uuid
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+JOBS = {}
+JOBS_LOCK = threading.Lock()
+# request_id -> time of every DELETE received
+DELETED = {}
+SETTINGS = {'queue_seconds': 30, 'run_seconds': 30, 'fail_rate': 0.0, 'max_active': 8}
+
+
+def job_state(job):
+    """Derives a job's state from its age, like a queue that never stalls."""
+    if job['rejected']:
+        return 'failed'
+    elapsed = time.time() - job['created']
+    if elapsed < SETTINGS['queue_seconds']:
+        return 'queued'
+    if elapsed < SETTINGS['queue_seconds'] + SETTINGS['run_seconds']:
+        return 'running'
+    return 'completed'
+
+
+def build_payload(job):
+    """Zip with a placeholder data file echoing the request."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as zf:
+        zf.writestr('data.nc', json.dumps(job['request'], sort_keys=True))
+    return buffer.getvalue()
+
+
+class FakeCDSHandler(BaseHTTPRequestHandler):
+
+    def _send_json(self, body, code=200):
+        data = json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _reply(self, request_id, job):
+        state = job_state(job)
+        reply = {'request_id': request_id, 'state': state}
+        if state == 'completed':
+            host, port = self.server.server_address[:2]
+            reply['location'] = f"http://{host}:{port}/download/{request_id}.zip"
+            reply['content_length'] = len(build_payload(job))
+        elif state == 'failed':
+            reply['error'] = {'message': 'Rejected by fake CDS', 'reason': 'fail_rate'}
+        return reply
+
+    def do_POST(self):
+        if not self.path.startswith('/resources/'):
+            return self._send_json({'message': 'not found'}, 404)
+
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        account = self.headers.get('Authorization', 'anonymous')
+
+        with JOBS_LOCK:
+            active = sum(
+                1 for job in JOBS.values()
+                if job['account'] == account and job_state(job) in ('queued', 'running')
+            )
+            if active >= SETTINGS['max_active']:
+                return self._send_json({'message': 'too many active requests'}, 429)
+
+            request_id = str(uuid.uuid4())
+            rejected = (int(request_id[:8], 16) / 0xFFFFFFFF) < SETTINGS['fail_rate']
+            JOBS[request_id] = {'created': time.time(), 'request': request, 'account': account, 'rejected': rejected}
+            self._send_json(self._reply(request_id, JOBS[request_id]))
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/status.json'):
+            return self._send_json({})
+
+        if self.path.startswith('/tasks/'):
+            request_id = self.path.split('/')[2]
+            job = JOBS.get(request_id)
+            if not job:
+                return self._send_json({'message': 'unknown request'}, 404)
+            return self._send_json(self._reply(request_id, job))
+
+        if self.path.startswith('/download/'):
+            request_id = self.path.split('/')[2].replace('.zip', '')
+            job = JOBS.get(request_id)
+            if not job or job_state(job) != 'completed':
+                return self._send_json({'message': 'not ready'}, 404)
+            data = build_payload(job)
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/zip')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+
+        self._send_json({'message': 'not found'}, 404)
+
+    def do_DELETE(self):
+        if not self.path.startswith('/tasks/'):
+            return self._send_json({'message': 'not found'}, 404)
+        request_id = self.path.split('/')[2]
+        with JOBS_LOCK:
+            job = JOBS.pop(request_id, None)
+            DELETED[request_id] = time.time()
+        state = job_state(job) if job else 'unknown'
+        print(f"[fake-cds] DELETE of {state} request {request_id} ({len(DELETED)} deleted so far)")
+        self._send_json({'request_id': request_id, 'state': 'deleted'} if job else {'message': 'unknown request'},
+                        200 if job else 404)
+
+    def log_message(self, format, *args):
+        print(f"[fake-cds] {self.address_string()} {format % args}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in CDS API server.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--queue-seconds', type=float, default=30)
+    parser.add_argument('--run-seconds', type=float, default=30)
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Fraction of requests rejected (0-1).")
+    parser.add_argument('--max-active', type=int, default=8, help="Per-account active request limit.")
+    args = parser.parse_args()
+
+    SETTINGS.update(
+        queue_seconds=args.queue_seconds, run_seconds=args.run_seconds,
+        fail_rate=args.fail_rate, max_active=args.max_active,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), FakeCDSHandler)
+    print(f"Fake CDS listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Shutting down fake CDS.")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
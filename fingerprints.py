@@ -0,0 +1,123 @@
+import hashlib
+import json
+import sqlite3
+import urllib.error
+import urllib.request
+from datetime import datetime
+
+# --- Fingerprint Configuration ---
+# Every payload sent to CDS is canonicalized and hashed. The fingerprint is
+# kept in a database of its own, so it survives requests.db being deleted or
+# rebuilt (or a change in the output filename scheme): before submitting,
+# the manager looks for an identical earlier request on the same account
+# that is still in flight, or completed with a download link that still works,
+# and adopts it instead of queueing the same work again.
+FINGERPRINT_DB = "fingerprints.db"
+REUSABLE_ACTIVE_STATUSES = ('accepted', 'queued', 'running')
+LOCATION_CHECK_TIMEOUT = 15
+
+
+def setup_fingerprint_db(db_name=FINGERPRINT_DB):
+    conn = sqlite3.connect(db_name)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS fingerprints (
+        request_id TEXT PRIMARY KEY,
+        fingerprint TEXT NOT NULL,
+        dataset TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        account TEXT NOT NULL,
+        output_filename TEXT,
+        status TEXT,
+        location TEXT,
+        content_length INTEGER,
+        submitted_at TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP NOT NULL
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_fingerprint ON fingerprints (fingerprint, account)")
+    conn.commit()
+    conn.close()
+
+
+def canonical_payload(payload):
+    """
+    Order-independent JSON form of a request: keys sorted, list values sorted
+    (order of variables/months/days does not change what CDS returns), and
+    area coordinates rounded to the millidegree.
+    """
+    canonical = {}
+    for key, value in payload.items():
+        if key == 'area':
+            value = [round(float(v), 3) for v in value]
+        elif isinstance(value, (list, tuple)):
+            value = sorted(str(v) for v in value)
+        canonical[key] = value
+    return json.dumps(canonical, sort_keys=True, separators=(',', ':'))
+
+
+def request_fingerprint(dataset, payload):
+    return hashlib.sha256(f"{dataset}\n{canonical_payload(payload)}".encode('utf-8')).hexdigest()
+
+
+def record_submission(dataset, payload, request_id, account, output_filename, status, now=None, db_name=FINGERPRINT_DB):
+    now = now or datetime.now()
+    conn = sqlite3.connect(db_name)
+    conn.execute(
+        "INSERT OR REPLACE INTO fingerprints (request_id, fingerprint, dataset, payload, account, output_filename, status, submitted_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (request_id, request_fingerprint(dataset, payload), dataset, canonical_payload(payload),
+         account, output_filename, status, now, now)
+    )
+    conn.commit()
+    conn.close()
+
+
+def update_remote_status(items, now=None, db_name=FINGERPRINT_DB):
+    """Refreshes (request_id, status, location, content_length) tuples seen on CDS, in one transaction."""
+    if not items:
+        return
+    now = now or datetime.now()
+    conn = sqlite3.connect(db_name)
+    with conn:
+        conn.executemany(
+            "UPDATE fingerprints SET status = ?, location = COALESCE(?, location), "
+            "content_length = COALESCE(?, content_length), updated_at = ? WHERE request_id = ?",
+            [(status, location, content_length, now, request_id) for request_id, status, location, content_length in items]
+        )
+    conn.close()
+
+
+def location_is_live(url):
+    """True if the result's download link still answers (results expire on CDS)."""
+    request = urllib.request.Request(url, method='HEAD')
+    try:
+        with urllib.request.urlopen(request, timeout=LOCATION_CHECK_TIMEOUT) as response:
+            return response.status < 400
+    except (urllib.error.URLError, OSError, ValueError):
+        return False
+
+
+def find_reusable(fingerprint, account, remote_ids=None, in_use=(), db_name=FINGERPRINT_DB):
+    """
+    Returns the newest earlier request with this fingerprint on the account
+    that can be adopted, as a dict (request_id, status, location,
+    content_length), or None. `remote_ids` is the set of request IDs last
+    scraped from the account's CDS page (None if unknown); requests no longer
+    listed there are ignored. Request IDs in `in_use` are already tracked.
+    """
+    conn = sqlite3.connect(db_name)
+    rows = conn.execute(
+        "SELECT request_id, status, location, content_length FROM fingerprints "
+        "WHERE fingerprint = ? AND account = ? ORDER BY submitted_at DESC",
+        (fingerprint, account)
+    ).fetchall()
+    conn.close()
+
+    for request_id, status, location, content_length in rows:
+        if request_id in in_use:
+            continue
+        if remote_ids is not None and request_id not in remote_ids:
+            continue
+        if status in REUSABLE_ACTIVE_STATUSES or (status == 'completed' and location and location_is_live(location)):
+            return {'request_id': request_id, 'status': status, 'location': location, 'content_length': content_length}
+    return None
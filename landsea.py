@@ -0,0 +1,142 @@
+import os
+import zipfile
+
+import numpy as np
+
+# --- Land-Sea Mask Configuration ---
+# ERA5's land-sea mask (fraction of land per grid cell, 0..1) is fetched once
+# and cached next to requests.db. Variables that only carry values over the
+# sea are dropped from the request for boxes without a single sea cell, e.g.
+# sea_surface_temperature for CO, KS or UT, which would be all fill values.
+LAND_SEA_MASK_FILE = "land_sea_mask.nc"
+SEA_FRACTION_THRESHOLD = 0.5    # a cell with less land than this counts as sea
+SEA_ONLY_VARIABLES = {'sea_surface_temperature'}
+
+_mask_cache = {}
+
+
+def create_mask_client():
+    """Non-blocking client for the mask request, configured from ~/.cdsapirc like a plain cdsapi.Client()."""
+    import cdsapi
+    return cdsapi.Client(wait_until_complete=False, delete=False)
+
+
+def submit_land_sea_mask(client):
+    """Queues the global land-sea mask request (a constant field, one time step). Returns its request id."""
+    result = client.retrieve('reanalysis-era5-single-levels', {
+        'product_type': ['reanalysis'],
+        'variable': ['land_sea_mask'],
+        'year': ['2020'], 'month': ['01'], 'day': ['01'], 'time': ['00:00'],
+        'format': 'netcdf',
+    })
+    return result.reply['request_id']
+
+
+def collect_land_sea_mask(client, request_id, path=LAND_SEA_MASK_FILE):
+    """Downloads the mask to `path` if its request has completed. Returns the request's state."""
+    from cdsapi.api import Result
+
+    result = Result(client, {'request_id': request_id})
+    result.update()
+    state = result.reply['state']
+    if state != 'completed':
+        return state
+
+    download_path = path + ".download"
+    result.download(download_path)
+    if zipfile.is_zipfile(download_path):
+        with zipfile.ZipFile(download_path) as zf:
+            name = next(n for n in zf.namelist() if n.endswith('.nc'))
+            with zf.open(name) as src, open(path, 'wb') as dst:
+                dst.write(src.read())
+        os.remove(download_path)
+    else:
+        os.replace(download_path, path)
+    return state
+
+
+def ensure_land_sea_mask(logger, client=None, path=LAND_SEA_MASK_FILE):
+    """
+    Advances the one-time mask fetch by one step without waiting on the CDS
+    queue: submits the request, or collects it once it has completed. The
+    request id is kept in `path`.request across restarts. Call it every cycle;
+    returns True once the mask is cached (nothing is pruned before that).
+    """
+    if os.path.exists(path):
+        return True
+    request_file = path + ".request"
+    try:
+        client = client or create_mask_client()
+        if not os.path.exists(request_file):
+            request_id = submit_land_sea_mask(client)
+            with open(request_file, 'w') as f:
+                f.write(request_id)
+            logger.info(f"Requested the ERA5 land-sea mask (one-time, ID: {request_id}). Variables are not pruned until it arrives.")
+            return False
+        with open(request_file) as f:
+            request_id = f.read().strip()
+        state = collect_land_sea_mask(client, request_id, path)
+        if state == 'failed':
+            # Submit a fresh request next cycle
+            os.remove(request_file)
+            logger.warning(f"The land-sea mask request {request_id} failed on CDS. Requesting it again next cycle.")
+        if state != 'completed':
+            return False
+        os.remove(request_file)
+        logger.info(f"  > Cached land-sea mask in {path}")
+        return True
+    except Exception as e:
+        logger.warning(f"Could not fetch the land-sea mask, variables will not be pruned: {e}")
+        return False
+
+
+def load_land_sea_mask(path=LAND_SEA_MASK_FILE):
+    """
+    Returns (latitudes, longitudes in -180..180, land fraction [lat, lon]),
+    or None if the mask is not cached. Loaded once per process.
+    """
+    if path in _mask_cache:
+        return _mask_cache[path]
+    if not os.path.exists(path):
+        return None
+    import xarray as xr
+
+    with xr.open_dataset(path) as ds:
+        lsm = ds['lsm']
+        # Drop the single time step, whatever it is called
+        lsm = lsm.isel({dim: 0 for dim in lsm.dims if dim not in ('latitude', 'longitude')})
+        lats = lsm['latitude'].values
+        lons = lsm['longitude'].values
+        values = lsm.transpose('latitude', 'longitude').values
+    lons = np.where(lons >= 180, lons - 360, lons)
+    _mask_cache[path] = (lats, lons, values)
+    return _mask_cache[path]
+
+
+def has_sea(mask, area):
+    """True if any cell of the [N, W, S, E] area is sea. Handles boxes wrapping across 180."""
+    lats, lons, values = mask
+    north, west, south, east = area
+    lat_sel = (lats <= north) & (lats >= south)
+    if west <= east:
+        lon_sel = (lons >= west) & (lons <= east)
+    else:
+        lon_sel = (lons >= west) | (lons <= east)
+    # 180 and -180 are the same meridian
+    if east >= 180 or west <= -180:
+        lon_sel |= lons == -180
+    cells = values[np.ix_(lat_sel, lon_sel)]
+    return bool(cells.size) and bool((cells < SEA_FRACTION_THRESHOLD).any())
+
+
+def prune_variables(variables, area, mask=None):
+    """
+    Splits the variables into (kept, pruned) for an area: sea-only variables
+    are pruned when the area has no sea cell. Nothing is pruned without a mask.
+    """
+    mask = mask if mask is not None else load_land_sea_mask()
+    if mask is None or has_sea(mask, area):
+        return list(variables), []
+    kept = [v for v in variables if v not in SEA_ONLY_VARIABLES]
+    pruned = [v for v in variables if v in SEA_ONLY_VARIABLES]
+    return kept, pruned
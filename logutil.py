@@ -0,0 +1,64 @@
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import shutil
+from datetime import datetime
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for post-hoc analysis with jq/pandas."""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'msg': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def gzip_namer(name):
+    return name + ".gz"
+
+
+def gzip_rotator(source, dest):
+    """Compresses a rotated log file instead of keeping it as plain text."""
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+def build_file_handler(path, max_bytes=0, backup_count=10, when=None):
+    """
+    Rotating file handler with gzip-compressed backups. Rotates at midnight
+    (or whatever `when` says) if given, otherwise every `max_bytes`.
+    """
+    if when:
+        handler = logging.handlers.TimedRotatingFileHandler(path, when=when, backupCount=backup_count)
+    else:
+        handler = logging.handlers.RotatingFileHandler(path, mode='a', maxBytes=max_bytes, backupCount=backup_count)
+    handler.namer = gzip_namer
+    handler.rotator = gzip_rotator
+    return handler
+
+
+def start_queue_logging(logger, handlers):
+    """
+    Routes the logger through an in-memory queue: log calls only enqueue the
+    record, and a background listener thread does the formatting and I/O.
+    The listener is flushed and stopped at interpreter exit.
+    """
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
@@ -1,120 +1,81 @@
+import argparse
 import cdsapi
 import os
 import time
-import re
 import sqlite3
 import logging
 from datetime import datetime
-from dotenv import load_dotenv
 from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import NoSuchElementException, TimeoutException
 from cdsapi.api import Result # <-- Import Result for API client
+import retry
+import rolling
+from accounts import load_accounts, validate_accounts, assign_account
+from scheduler import PriorityScheduler, load_service_history
+from concurrency import SlotController, load_slot_target, is_limit_error
+from logutil import JsonFormatter, build_file_handler, start_queue_logging
+from naming import three_month_chunks, build_output_filename, stream_paths
+from reconcile import reconcile
+from regions import area_cover, job_area
+from landsea import ensure_land_sea_mask, prune_variables
+import browser
+import fingerprints
+import profiling
+from control import ControlState, start_control_server
+from config import (
+    DB_NAME, CDS_DATASET, MAX_ACTIVE_REQUESTS, LOOP_SLEEP_SECONDS, output_dir,
+    years_to_download, variables_to_download, bounding_boxes, states_to_download, parse_size_to_bytes,
+)
+from database import setup_database
 
 # --- Configuration ---
-load_dotenv()
-CDS_USERNAME = os.getenv("CDS_USERNAME")
-CDS_PASSWORD = os.getenv("CDS_PASSWORD")
-
-DB_NAME = "requests.db"
+# What to download and where: see config.py
 LOG_FILE = "manager.log"
-MAX_ACTIVE_REQUESTS = 8
-output_dir = "era5_data"
-LOOP_SLEEP_SECONDS = 3600  # 1 hour
-
-years_to_download = [str(year) for year in range(2019, 2025)]
-variables_to_download = [
-    "10m_u_component_of_wind", "10m_v_component_of_wind", "2m_dewpoint_temperature",
-    "2m_temperature", "mean_sea_level_pressure", "sea_surface_temperature",
-    "surface_pressure", "total_precipitation"
-]
-bounding_boxes = {
-    'AL': [35.008323, -88.474595, 30.222501, -84.89248], 'AK': [71.365162, -179.148909, 51.214183, 179.77847],
-    'AZ': [37.00426, -114.81651, 31.332177, -109.045223], 'AR': [36.49965, -94.619466, 33.004136, -89.655473],
-    'CA': [42.009659, -124.410607, 32.534156, -114.131211], 'CO': [41.003444, -109.060253, 36.992426, -102.041524],
-    'CT': [42.050894, -73.727775, 40.980144, -71.786994], 'DE': [39.839007, -75.79003, 38.451013, -75.048939],
-    'DC': [38.99511, -77.119759, 38.791645, -76.909395], 'FL': [31.000888, -87.634938, 24.514909, -80.031362],
-    'GA': [35.000659, -85.606749, 30.357851, -80.839729], 'HI': [28.402123, -178.334698, 18.910361, -154.806773],
-    'ID': [49.001146, -117.243027, 41.988057, -111.043564], 'IL': [42.508773, -91.514727, 36.970298, -87.494718],
-    'IN': [41.760592, -88.09776, 37.771742, -84.784579], 'IA': [43.501196, -96.639704, 40.375501, -90.140028],
-    'KS': [40.003162, -102.052894, 36.992751, -94.588413], 'KY': [39.147458, -89.572919, 36.497073, -81.964971],
-    'LA': [33.019599, -94.043147, 28.928609, -88.815578], 'ME': [47.459686, -71.084466, 42.977764, -66.949895],
-    'MD': [39.723043, -79.487651, 37.911717, -75.048939], 'MA': [42.886759, -73.508142, 41.237964, -69.928393],
-    'MI': [48.2388, -90.418136, 41.696102, -82.413474], 'MN': [49.384687, -97.239651, 43.499269, -89.490365],
-    'MS': [34.996052, -91.655009, 30.173943, -88.097888], 'MO': [40.613687, -95.774704, 35.995382, -89.098843],
-    'MT': [49.001546, -116.051141, 44.358221, -104.039138], 'NE': [43.001708, -104.053514, 39.999998, -95.30829],
-    'NV': [42.002207, -120.006543, 35.00145, -114.039648], 'NH': [45.305871, -72.557247, 42.696907, -70.610621],
-    'NJ': [41.357633, -75.560315, 38.928212, -73.893979], 'NM': [37.000482, -109.050173, 31.332301, -103.000468],
-    'NY': [45.01585, -79.763379, 40.496103, -71.856164], 'NC': [36.588133, -84.321869, 33.842316, -75.459815],
-    'ND': [49.000687, -104.0489, 45.934703, -96.554507], 'OH': [41.977874, -84.820694, 38.403202, -80.518693],
-    'OK': [37.002206, -103.004057, 33.615833, -94.430662], 'OR': [46.292035, -124.566244, 41.991619, -116.463504],
-    'PA': [42.269954, -80.52072, 39.7198, -74.689516], 'PR': [18.516095, -67.945404, 17.88328, -65.220703],
-    'RI': [42.019109, -71.862772, 41.146339, -71.120359], 'SC': [35.215402, -83.35391, 32.034258, -78.539429],
-    'SD': [45.94545, -104.05931, 42.479635, -96.435649], 'TN': [36.678335, -90.310298, 34.982551, -81.6469],
-    'TX': [36.500704, -106.647191, 25.837377, -93.508292], 'UT': [42.001928, -114.052962, 36.997905, -109.041058],
-    'VT': [45.016659, -73.439043, 42.726853, -71.464555], 'VA': [39.466012, -83.675709, 36.540738, -75.240868],
-    'WA': [49.002494, -124.763068, 45.543541, -116.915989], 'WV': [40.638801, -82.644739, 37.201483, -77.719519],
-    'WI': [47.080621, -92.889427, 42.491592, -86.805415], 'WY': [45.006059, -111.058433, 40.994746, -104.052131]
-}
-states_to_download = list(bounding_boxes.keys())
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024)))  # rotate at 50 MB
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", "10"))
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN")  # e.g. 'midnight' for daily rotation instead
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")    # 'text' or 'json'
+MAX_ACTIVE_CEILING = int(os.getenv("MAX_ACTIVE_CEILING", "16"))
+
 
 # --- Logging Setup ---
 def setup_logging():
-    """Sets up a logger that writes to file and console."""
+    """
+    Sets up a logger that writes to file and console. Log calls only put the
+    record on a queue; a background listener thread writes it out, rotating
+    manager.log by size (or by time if LOG_ROTATE_WHEN is set) and gzipping
+    old files. LOG_FORMAT=json writes one JSON object per line to the file.
+    """
     logger = logging.getLogger('cds_manager')
     logger.setLevel(logging.DEBUG) 
+
+    if logger.handlers:
+        return logger
     
     # File handler
-    fh = logging.FileHandler(LOG_FILE, mode='a') # 'a' to append
+    fh = build_file_handler(LOG_FILE, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, when=LOG_ROTATE_WHEN)
     fh.setLevel(logging.DEBUG)
     
     # Console handler
     ch = logging.StreamHandler()
     ch.setLevel(logging.INFO)
 
-    file_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    if LOG_FORMAT == 'json':
+        file_formatter = JsonFormatter()
+    else:
+        file_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     console_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
     fh.setFormatter(file_formatter)
     ch.setFormatter(console_formatter)
 
-    if not logger.handlers:
-        logger.addHandler(fh)
-        logger.addHandler(ch)
+    start_queue_logging(logger, [fh, ch])
         
     return logger
 
 # --- Database Functions ---
-def setup_database(logger):
-    """Creates the database table if it doesn't exist."""
-    try:
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        # Add the 'download' column from your add_column script
-        c.execute("""
-        CREATE TABLE IF NOT EXISTS requests (
-            request_id TEXT PRIMARY KEY,
-            state_abbr TEXT NOT NULL,
-            year TEXT NOT NULL,
-            output_filename TEXT NOT NULL UNIQUE,
-            status TEXT NOT NULL,
-            location TEXT,
-            content_length INTEGER,
-            download BOOLEAN DEFAULT 0, 
-            created_at TIMESTAMP NOT NULL,
-            updated_at TIMESTAMP NOT NULL
-        )
-        """)
-        conn.commit()
-        conn.close()
-        logger.info("Database setup complete.")
-    except Exception as e:
-        logger.error(f"Failed to setup database: {e}")
-
 def get_all_filenames_in_db(logger):
     """Gets a set of all filenames in the DB to prevent re-submission."""
     try:
@@ -128,83 +89,24 @@ def get_all_filenames_in_db(logger):
         logger.error(f"Failed to get filenames from DB: {e}")
         return set()
 
-def parse_size_to_bytes(size_str):
-    if not size_str: return None
-    size_str = size_str.strip()
-    match = re.match(r'([\d.]+)\s*(\w+)', size_str)
-    if not match: return None
-    try:
-        value = float(match.group(1))
-        unit = match.group(2).upper()
-        if unit == 'KB': return int(value * 1024)
-        elif unit == 'MB': return int(value * 1024 * 1024)
-        elif unit == 'GB': return int(value * 1024 * 1024 * 1024)
-        elif unit == 'TB': return int(value * 1024 * 1024 * 1024 * 1024)
-        elif unit == 'B': return int(value)
-        else: return None
-    except Exception: return None
-
 # --- Selenium Functions (from update_status.py) ---
-def selenium_login(driver, logger):
-    """Performs the initial login and cookie banner."""
-    logger.info("Attempting login...")
-    driver.get("https://cds.climate.copernicus.eu/")
-
-    # Action 2: Handle Cookie Banner
-    try:
-        logger.info("Waiting for cookie banner...")
-        WebDriverWait(driver, 5).until(
-            EC.element_to_be_clickable((By.XPATH, "//button[text()='Deny all']"))
-        ).click()
-        logger.info("Clicked 'Deny all' on cookie banner.")
-    except Exception:
-        logger.info("Cookie banner not found or 'Deny all' not clickable. Continuing...")
-
-    # Action 3: Click "Login - Register"
-    logger.info("Waiting for Login button...")
-    WebDriverWait(driver, 10).until(
-        EC.element_to_be_clickable((By.XPATH, "//button[.//p[text()='Login - Register']]"))
-    ).click()
-
-    # Action 4: Input Username and Password
-    logger.info("Waiting for login form...")
-    username_field = WebDriverWait(driver, 10).until(
-        EC.visibility_of_element_located((By.ID, "username"))
-    )
-    
-    logger.info("Entering credentials...")
-    username_field.send_keys(CDS_USERNAME)
-    driver.find_element(By.ID, "password").send_keys(CDS_PASSWORD)
-
-    # Action 5: Hit Enter
-    logger.info("Logging in...")
-    driver.find_element(By.ID, "password").send_keys(Keys.RETURN)
-
-    # Action 6: Click "Your requests"
-    logger.info("Waiting for 'Your requests' link...")
-    WebDriverWait(driver, 10).until(
-        EC.element_to_be_clickable((By.LINK_TEXT, "Your requests"))
-    ).click()
-    
-    # Wait for the page to load
-    WebDriverWait(driver, 10).until(
-        EC.visibility_of_element_located((By.CSS_SELECTOR, "div[data-requid]"))
-    )
-    logger.info("Login successful. On 'Your requests' page.")
+def selenium_login(driver, logger, account):
+    """Performs the initial login and cookie banner for one account."""
+    browser.login(driver, account, log=logger.info)
 
 
-def update_status_via_selenium(driver, logger):
+def update_status_via_selenium(driver, logger, account):
     """
-    Uses the Selenium browser to scrape the true status of all requests
-    and updates the local database.
+    Uses the account's Selenium browser to scrape the true status of its
+    requests and updates the local database.
     Returns the count of currently active (queued/running) requests.
     """
-    logger.info("--- Starting status update via Selenium ---")
+    logger.info(f"--- [{account.name}] Starting status update via Selenium ---")
     active_count = 0
     
     try:
         # Go to the requests page (or refresh it)
-        driver.get("https://cds.climate.copernicus.eu/requests?tab=all")
+        driver.get(browser.REQUESTS_URL)
         
         # Wait for the first request row to be visible
         logger.info("Waiting for request list to load...")
@@ -247,6 +149,9 @@ def update_status_via_selenium(driver, logger):
             except Exception as e:
                 logger.warning(f"Could not parse a row. Error: {e}")
         
+        # Everything listed on the account, also requests requests.db does not know
+        account.remote_request_ids = {item['id'] for item in scraped_data}
+
         # Now, update the database
         if scraped_data:
             logger.info(f"--- Updating local database with {len(scraped_data)} scraped items ---")
@@ -279,10 +184,13 @@ def update_status_via_selenium(driver, logger):
                     c.execute(
                         """
                         UPDATE requests 
-                        SET status = ?, location = ?, content_length = ?, updated_at = ?
-                        WHERE request_id = ?
+                        SET status = ?, location = ?, content_length = ?, updated_at = ?,
+                            started_at = COALESCE(started_at, CASE WHEN ? IN ('running', 'completed') THEN ? END),
+                            finished_at = COALESCE(finished_at, CASE WHEN ? IN ('completed', 'failed') THEN ? END)
+                        WHERE request_id = ? AND account = ?
                         """,
-                        (db_status, location, content_length, now_time, request_id)
+                        (db_status, location, content_length, now_time,
+                         db_status, now_time, db_status, now_time, request_id, account.name)
                     )
                     if c.rowcount > 0:
                         updated_count += 1
@@ -292,184 +200,480 @@ def update_status_via_selenium(driver, logger):
             conn.commit()
             conn.close()
             logger.info(f"Database update complete. {updated_count} rows updated.")
+
+            fingerprints.update_remote_status([
+                (item['id'], status_map.get(item['status']), item['location'], parse_size_to_bytes(item['content_length_str']))
+                for item in scraped_data if status_map.get(item['status'])
+            ])
             
     except TimeoutException:
         logger.error("Timed out waiting for requests page. Session may be invalid.")
         raise Exception("Session timeout") # Will be caught by main loop
     except Exception as e:
         logger.error(f"Error during Selenium scrape: {e}")
-        driver.save_screenshot("manager_error.png")
+        driver.save_screenshot(f"manager_error_{account.name}.png")
         raise e # Will be caught by main loop
         
-    logger.info(f"--- Status update finished. Active jobs: {active_count} ---")
+    logger.info(f"--- [{account.name}] Status update finished. Active jobs: {active_count} ---")
     return active_count
 
-# --- API Functions (from submit.py) ---
-def submit_new_requests(api_client, logger, current_active_count):
+def update_status_via_api(logger, account):
     """
-    Submits new requests via the API if there are available slots.
+    Polls the account's active requests with cdsapi (no browser session).
+    Used for 'api' accounts such as the local stand-in server.
+    Returns the count of currently active requests.
     """
-    logger.info("--- Starting new request submission ---")
-    available_slots = MAX_ACTIVE_REQUESTS - current_active_count
-    
-    if available_slots <= 0:
-        logger.info(f"Max active request limit ({MAX_ACTIVE_REQUESTS}) reached. No new requests will be submitted.")
-        return
-
-    logger.info(f"Have {available_slots} available slots. Starting new request submissions...")
-
-    db_filenames = get_all_filenames_in_db(logger)
-    
+    logger.info(f"--- [{account.name}] Starting status update via API ---")
     conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
-    
-    submitted_count = 0
-    stop_submission = False
+    c.execute(
+        "SELECT request_id, output_filename FROM requests WHERE status IN ('accepted', 'queued', 'running') AND account = ?",
+        (account.name,)
+    )
+    active_requests = c.fetchall()
+    polled = []
+
+    for request_id, filename in active_requests:
+        try:
+            result = Result(client=account.client, reply={"request_id": request_id})
+            result.update()
+            new_status = result.reply['state']
+            now_time = datetime.now()
 
-    three_month_chunks = [
-        {'label': 'Jan-Mar', 'months': ['01', '02', '03']},
-        {'label': 'Apr-Jun', 'months': ['04', '05', '06']},
-        {'label': 'Jul-Sep', 'months': ['07', '08', '09']},
-        {'label': 'Oct-Dec', 'months': ['10', '11', '12']}
-    ]
+            if new_status == 'completed':
+                c.execute(
+                    "UPDATE requests SET status=?, location=?, content_length=?, updated_at=? WHERE request_id=?",
+                    (new_status, result.location, result.content_length, now_time, request_id)
+                )
+                polled.append((request_id, new_status, result.location, result.content_length))
+            else:
+                c.execute("UPDATE requests SET status=?, updated_at=? WHERE request_id=?", (new_status, now_time, request_id))
+                polled.append((request_id, new_status, None, None))
+            c.execute(
+                """
+                UPDATE requests
+                SET started_at = COALESCE(started_at, CASE WHEN ? IN ('running', 'completed') THEN ? END),
+                    finished_at = COALESCE(finished_at, CASE WHEN ? IN ('completed', 'failed') THEN ? END)
+                WHERE request_id = ?
+                """,
+                (new_status, now_time, new_status, now_time, request_id)
+            )
+            logger.debug(f"  {filename} ({request_id}): {new_status}")
+        except Exception as e:
+            logger.error(f"Error checking status of {filename} ({request_id}): {e}")
 
+    conn.commit()
+    fingerprints.update_remote_status(polled)
+    c.execute(
+        "SELECT COUNT(*) FROM requests WHERE status IN ('accepted', 'queued', 'running') AND account = ?",
+        (account.name,)
+    )
+    active_count = c.fetchone()[0]
+    conn.close()
+
+    logger.info(f"--- [{account.name}] Status update finished. Active jobs: {active_count} ---")
+    return active_count
+
+def update_account_status(logger, account):
+    """Refreshes one account's requests using its configured status source."""
+    if account.uses_browser:
+        return update_status_via_selenium(account.driver, logger, account)
+    return update_status_via_api(logger, account)
+
+# --- API Functions (from submit.py) ---
+def build_cds_request(year, months, area, variables=None):
+    """Builds the 'reanalysis-era5-single-levels' payload for one job."""
+    return {
+        'product_type': ['reanalysis'],
+        'variable': variables or variables_to_download,
+        'year': [year],
+        'month': months,
+        'day': ['01', '02', '03', '04', '05', '06', '07', '08', '09', '10',
+                '11', '12', '13', '14', '15', '16', '17', '18', '19', '20',
+                '21', '22', '23', '24', '25', '26', '27', '28', '29', '30', '31'],
+        'time': ['00:00', '01:00', '02:00', '03:00', '04:00', '05:00',
+                 '06:00', '07:00', '08:00', '09:00', '10:00', '11:00',
+                 '12:00', '13:00', '14:00', '15:00', '16:00', '17:00',
+                 '18:00', '19:00', '20:00', '21:00', '22:00', '23:00'],
+        'format': 'netcdf',
+        'area': area,
+    }
+
+def build_pending_plan(db_filenames, logger):
+    """
+    Expands the configured states, years and three-month chunks into the list
+    of jobs that are neither in the DB nor already on disk. States with a
+    multi-box cover (regions.py) get one job per box; the boxes are merged
+    back into the chunk's file once downloaded.
+    """
+    jobs = []
     for state_abbr in states_to_download:
-        if stop_submission: break
         if state_abbr not in bounding_boxes:
             logger.warning(f"Bounding box for state '{state_abbr}' not found. Skipping.")
             continue
-        
-        state_area = bounding_boxes[state_abbr]
-        
+
+        cover = area_cover(state_abbr, bounding_boxes)
         for year in years_to_download:
-            if stop_submission: break
-            
             for chunk in three_month_chunks:
-                if stop_submission: break
-                
-                target_filename = f"ERA5_hourly_multivariable_{state_abbr}_{year}_{chunk['label']}.nc"
-                target_path = os.path.join(output_dir, target_filename)
+                target_filename = build_output_filename(state_abbr, year, chunk['label'])
 
                 # --- Idempotency Checks ---
                 if target_filename in db_filenames:
                     continue # Already in DB, skip
-                
-                if os.path.exists(target_path):
+
+                # Single file or the _instant/_accum pair
+                if any(os.path.exists(path) for path in stream_paths(output_dir, target_filename)):
                     logger.warning(f"Skipping {target_filename}: File already exists on disk.")
                     continue
                 # --- End Checks ---
 
-                logger.info(f"Submitting request for: {target_filename}")
+                if cover:
+                    for box in cover:
+                        jobs.append({
+                            'state_abbr': state_abbr,
+                            'year': year,
+                            'months': chunk['months'],
+                            'box': box,
+                            'output_filename': build_output_filename(state_abbr, year, chunk['label'], box=box),
+                            'parent_filename': target_filename,
+                            'cover_parts': len(cover),
+                            'retry_of': None,
+                        })
+                    continue
 
-                try:
-                    result = api_client.retrieve(
-                        'reanalysis-era5-single-levels',
-                        {
-                            'product_type': ['reanalysis'],
-                            'variable': variables_to_download,
-                            'year': [year],
-                            'month': chunk['months'],
-                            'day': ['01', '02', '03', '04', '05', '06', '07', '08', '09', '10',
-                                    '11', '12', '13', '14', '15', '16', '17', '18', '19', '20',
-                                    '21', '22', '23', '24', '25', '26', '27', '28', '29', '30', '31'],
-                            'time': ['00:00', '01:00', '02:00', '03:00', '04:00', '05:00',
-                                     '06:00', '07:00', '08:00', '09:00', '10:00', '11:00',
-                                     '12:00', '13:00', '14:00', '15:00', '16:00', '17:00',
-                                     '18:00', '19:00', '20:00', '21:00', '22:00', '23:00'],
-                            'format': 'netcdf', 
-                            'area': state_area,
-                        }
-                    )
-                    
-                    # Request submitted, add to DB
-                    now_time = datetime.now()
-                    request_id = result.reply['request_id']
-                    status = result.reply['state']
-                    
-                    # Note: We add the 'download' column here, it gets the default value of 0
-                    c.execute(
-                        "INSERT INTO requests (request_id, state_abbr, year, output_filename, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                        (request_id, state_abbr, year, target_filename, status, now_time, now_time)
-                    )
-                    conn.commit()
-                    db_filenames.add(target_filename)
-                    
-                    logger.info(f"  > Submitted. ID: {request_id}, Status: {status}")
-                    submitted_count += 1
+                jobs.append({
+                    'state_abbr': state_abbr,
+                    'year': year,
+                    'months': chunk['months'],
+                    'box': None,
+                    'output_filename': target_filename,
+                    'parent_filename': None,
+                    'retry_of': None,
+                })
+    return jobs
 
-                except Exception as e:
-                    logger.error(f"ERROR: Request submission failed for {target_filename}.")
-                    logger.error(f"Details: {e}")
-                
-                finally:
-                    if submitted_count >= available_slots:
-                        logger.info("Reached max active request limit. Stopping submissions for this cycle.")
-                        stop_submission = True
-                    
-                    if not stop_submission:
-                        logger.debug("Waiting 15s before next request...")
-                        time.sleep(15)
+def submit_job(account, conn, job):
+    """
+    Submits one job under the given account and records it, including any
+    variables pruned by the land-sea mask. If an identical payload was
+    submitted before and that request is still in flight or downloadable,
+    it is adopted instead of submitting again.
+    Returns (request_id, status, reused).
+    """
+    area = job_area(job, bounding_boxes)
+    variables, pruned = prune_variables(variables_to_download, area)
+    payload = build_cds_request(job['year'], job['months'], area, variables)
+
+    in_use = {row[0] for row in conn.execute("SELECT request_id FROM requests")}
+    # An ERA5T part is fetched again for its final data, which an earlier
+    # request for the same payload does not hold
+    reused = None if job.get('refetch') else fingerprints.find_reusable(
+        fingerprints.request_fingerprint(CDS_DATASET, payload), account.name,
+        remote_ids=account.remote_request_ids, in_use=in_use
+    )
+    now_time = datetime.now()
+    if reused:
+        request_id = reused['request_id']
+        status = reused['status']
+    else:
+        result = account.client.retrieve(CDS_DATASET, payload)
+        request_id = result.reply['request_id']
+        status = result.reply['state']
+        fingerprints.record_submission(CDS_DATASET, payload, request_id, account.name, job['output_filename'], status, now_time)
+    pruned_text = ",".join(pruned) or None
+
+    if job['retry_of']:
+        # Same output file, new CDS request: move the existing row over
+        retry.record_resubmission(conn, job['retry_of'], request_id, status, now_time, account=account.name)
+        conn.execute("UPDATE requests SET pruned_variables = ? WHERE request_id = ?", (pruned_text, request_id))
+        conn.commit()
+    else:
+        if job.get('cover_parts'):
+            # First box of a multi-box chunk: the chunk itself becomes a split parent
+            retry.record_cover_parent(conn, job, now_time)
+        if job.get('rolling_parts'):
+            # First month of a chunk past the configured years
+            rolling.record_rolling_parent(conn, job, now_time)
+        # Note: the 'download' column gets its default value of 0
+        conn.execute(
+            "INSERT INTO requests (request_id, state_abbr, year, output_filename, status, parent_filename, account, pruned_variables, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (request_id, job['state_abbr'], job['year'], job['output_filename'], status, job['parent_filename'], account.name, pruned_text, now_time, now_time)
+        )
+        conn.commit()
+    if reused and reused['location']:
+        conn.execute(
+            "UPDATE requests SET location = ?, content_length = ? WHERE request_id = ?",
+            (reused['location'], reused['content_length'], request_id)
+        )
+        conn.commit()
+    return request_id, status, bool(reused)
+
+def submit_new_requests(accounts, logger, active_counts, control=None):
+    """
+    Submits new requests via the API if any account has available slots.
+    Due retries, the monthly parts of split requests and the remaining
+    configured plan are served from a single weighted priority queue, and
+    each job goes to the account with the most free slots. An account's
+    slot count is its controller's current target. Stops early if
+    submissions are paused or drained through the control API.
+    """
+    logger.info("--- Starting new request submission ---")
+
+    conn = sqlite3.connect(DB_NAME)
+    retry.schedule_failed_requests(conn, logger, bounding_boxes=bounding_boxes)
+
+    free_slots = {
+        account.name: account.controller.slots - active_counts.get(account.name, account.controller.slots)
+        for account in accounts
+    }
+    available_slots = sum(max(n, 0) for n in free_slots.values())
+    
+    if available_slots <= 0:
+        logger.info("Max active request limit reached on every account. No new requests will be submitted.")
+        conn.close()
+        return
+
+    logger.info(f"Have {available_slots} available slots ({free_slots}). Starting new request submissions...")
+
+    db_filenames = get_all_filenames_in_db(logger)
+
+    # Queue the pending plan by priority instead of walking it in config order
+    last_served, epoch = load_service_history(conn)
+    queue = PriorityScheduler(bounding_boxes, last_served=last_served, epoch=epoch)
+    queue.extend(retry.get_due_retries(conn))
+    queue.extend(retry.get_split_children(conn, db_filenames, bounding_boxes))
+    queue.extend(build_pending_plan(db_filenames, logger))
+    if rolling.ROLLING_ENABLED:
+        queue.extend(rolling.pending_jobs(conn, db_filenames))
+        queue.extend(rolling.due_replacements(conn))
+    logger.info(f"{len(queue)} jobs pending in the priority queue.")
+    if control:
+        control.publish_queue(queue)
+    
+    submitted_count = 0
+
+    while True:
+        if control and not control.submissions_allowed():
+            logger.info("Submissions paused via the control API. Stopping submissions for this cycle.")
+            break
+
+        account = assign_account(accounts, free_slots)
+        if account is None:
+            logger.info("Reached max active request limit. Stopping submissions for this cycle.")
+            break
+
+        job = queue.pop()
+        if job is None:
+            break
+
+        target_filename = job['output_filename']
+        if job['retry_of']:
+            logger.info(f"Resubmitting failed request for: {target_filename}")
+        else:
+            logger.info(f"Submitting request for: {target_filename} (account '{account.name}')")
+
+        try:
+            if control:
+                control.set_submitting(target_filename)
+            request_id, status, reused = submit_job(account, conn, job)
+            db_filenames.add(target_filename)
+            queue.mark_served(job['state_abbr'])
+
+            if reused:
+                logger.info(f"  > Reused identical earlier request. ID: {request_id}, Status: {status}")
+                if status == 'completed':
+                    # Nothing new was queued on CDS: no slot used, no need to pace
+                    continue
+            else:
+                logger.info(f"  > Submitted. ID: {request_id}, Status: {status}")
+            submitted_count += 1
+            free_slots[account.name] -= 1
+
+        except Exception as e:
+            logger.error(f"ERROR: Request submission failed for {target_filename}.")
+            logger.error(f"Details: {e}")
+            if is_limit_error(e):
+                # CDS says this account is full: back off and stop using it this cycle
+                account.controller.record_limit_error()
+                free_slots[account.name] = 0
+        finally:
+            if control:
+                control.set_submitting(None)
+
+        if submitted_count >= available_slots:
+            logger.info("Reached max active request limit. Stopping submissions for this cycle.")
+            break
+
+        logger.debug("Waiting 15s before next request...")
+        with profiling.span('submit.spacing'):
+            time.sleep(15)
 
     conn.close()
+    if control:
+        control.publish_queue(queue)
     logger.info(f"--- Request submission finished. Submitted {submitted_count} new requests. ---")
 
 # --- Main Execution ---
+def create_api_client(account):
+    """
+    Creates a non-blocking cdsapi client for the account. delete=False: a
+    Result deletes its request on CDS when it is garbage-collected otherwise,
+    which would remove completed requests before retrieve.py downloads them.
+    """
+    kwargs = {'wait_until_complete': False, 'delete': False}
+    if account.api_url:
+        kwargs['url'] = account.api_url
+    if account.api_key:
+        kwargs['key'] = account.api_key
+    return cdsapi.Client(**kwargs)
+
+def enable_profiling(sample, logger):
+    """--profile: times the loop phases and the browser, CDS and SQLite calls inside them."""
+    report_path = profiling.enable(
+        'manager', report_dir=os.path.dirname(os.path.abspath(LOG_FILE)), sample=sample,
+        targets=[
+            (WebDriverWait, 'until', 'selenium.wait'),
+            (webdriver.Chrome, 'get', 'selenium.get'),
+            (cdsapi.Client, 'retrieve', 'cds.submit'),
+            (Result, 'update', 'cds.poll'),
+        ]
+    )
+    logger.info(f"Profiling enabled; report is rewritten after every cycle to {report_path}")
+
 def main():
+    parser = argparse.ArgumentParser(description="Submits and tracks ERA5 requests on CDS.")
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+
     logger = setup_logging()
     logger.info("====== Starting CDS Manager Script ======")
+    if args.profile:
+        enable_profiling(args.profile_sample, logger)
     
-    if not CDS_USERNAME or not CDS_PASSWORD:
-        logger.error("Error: CDS_USERNAME or CDS_PASSWORD not found in .env file.")
-        logger.error("Please create a .env file with your credentials.")
+    accounts = load_accounts(MAX_ACTIVE_REQUESTS)
+    problems = validate_accounts(accounts)
+    if problems:
+        for problem in problems:
+            logger.error(f"Error: {problem}")
+        logger.error("Please check the credentials in your .env file.")
         exit()
+    logger.info(f"Using {len(accounts)} account(s): {', '.join(a.name for a in accounts)}")
         
     setup_database(logger)
+
+    conn = sqlite3.connect(DB_NAME)
+    # Repair drift between the DB and era5_data left by crashes or manual edits
+    with profiling.span('reconcile'):
+        reconcile(conn, output_dir, logger)
+    for account in accounts:
+        # Resume each account's slot target where the last run left it
+        initial = load_slot_target(conn, account.name, account.max_active)
+        account.controller = SlotController(account.name, initial, ceiling=MAX_ACTIVE_CEILING,
+                                            poll_seconds=LOOP_SLEEP_SECONDS)
+    conn.close()
+
+    # Live status, on-demand cycles, pause and drain (see control.py)
+    control = ControlState(DB_NAME)
+    start_control_server(control, logger)
     
-    # Initialize API client (for submitting)
-    api_client = cdsapi.Client(wait_until_complete=False)
-    
-    # Initialize Selenium driver (for status checking)
-    logger.info("Setting up Selenium Chrome driver...")
-    service = ChromeService(ChromeDriverManager().install())
-    driver = webdriver.Chrome(service=service)
+    for account in accounts:
+        # Initialize API client (for submitting)
+        account.client = create_api_client(account)
+
+        # Initialize Selenium driver (for status checking)
+        if account.uses_browser:
+            logger.info(f"[{account.name}] Setting up Selenium Chrome driver...")
+            account.driver = browser.start_driver()
     
     try:
         # Initial login
-        selenium_login(driver, logger)
+        for account in accounts:
+            if account.uses_browser:
+                with profiling.span('selenium.login'):
+                    selenium_login(account.driver, logger, account)
         
         while True:
             try:
                 logger.info("--- Starting new cycle ---")
+                control.start_cycle()
+
+                # Needed once to prune sea-only variables for landlocked states; never waits on CDS
+                ensure_land_sea_mask(logger)
                 
-                # 1. Update status via Selenium & get active count
-                active_count = update_status_via_selenium(driver, logger)
+                # 1. Update status of each account & get active counts
+                control.set_phase('status')
+                active_counts = {}
+                for account in accounts:
+                    try:
+                        with profiling.span('cycle.status'):
+                            active_counts[account.name] = update_account_status(logger, account)
+                    except Exception as e:
+                        # Leave this account out of the cycle; the others keep going
+                        logger.error(f"[{account.name}] Status update failed: {e}")
+                        if account.uses_browser:
+                            logger.warning(f"[{account.name}] Attempting to re-login...")
+                            account.driver.save_screenshot(f"manager_loop_error_{account.name}.png")
+                            try:
+                                with profiling.span('selenium.login'):
+                                    selenium_login(account.driver, logger, account)
+                            except Exception as login_e:
+                                logger.critical(f"[{account.name}] Re-login failed: {login_e}")
                 
-                # 2. Submit new requests via API
-                submit_new_requests(api_client, logger, active_count)
+                # 2. Adjust each account's slot target from what CDS did last cycle
+                conn = sqlite3.connect(DB_NAME)
+                for account in accounts:
+                    if account.name in active_counts:
+                        account.controller.observe(conn, active_counts[account.name], logger)
+                conn.close()
+                control.publish_accounts(accounts, active_counts)
+
+                if control.draining and len(active_counts) == len(accounts) and not any(active_counts.values()):
+                    logger.info("Drain complete: no requests are active on CDS.")
+                    break
+
+                # 3. Submit new requests via API
+                if control.submissions_allowed():
+                    control.set_phase('submitting')
+                    with profiling.span('cycle.submit'):
+                        submit_new_requests(accounts, logger, active_counts, control)
+                else:
+                    reason = "draining" if control.draining else "paused"
+                    logger.info(f"Submissions {reason} via the control API. Skipping submission.")
+
+                # 4. Merge the downloaded parts of split requests (and rolling chunks)
+                control.set_phase('assembling')
+                conn = sqlite3.connect(DB_NAME)
+                with profiling.span('cycle.assemble'):
+                    retry.assemble_split_requests(conn, output_dir, logger)
+                    if rolling.ROLLING_ENABLED:
+                        rolling.update_rolling_chunks(conn, output_dir, logger)
+                conn.close()
+                profiling.write_report()
                 
-                # 3. Sleep for 1 hour
+                # 5. Sleep for 1 hour, or until a cycle is requested via the control API
                 logger.info(f"--- Cycle complete. Sleeping for {LOOP_SLEEP_SECONDS / 3600} hour(s) ---")
-                time.sleep(LOOP_SLEEP_SECONDS)
+                with profiling.span('idle'):
+                    woken = control.wait(LOOP_SLEEP_SECONDS)
+                if woken:
+                    logger.info("Woken up early via the control API.")
                 
             except Exception as e:
                 logger.error(f"A non-fatal error occurred in the main loop: {e}")
-                logger.warning("Attempting to re-login and continue cycle in 5 minutes...")
-                driver.save_screenshot("manager_loop_error.png")
-                try:
-                    # Try to re-login
-                    selenium_login(driver, logger)
-                except Exception as login_e:
-                    logger.critical(f"Re-login failed: {login_e}. Sleeping for 1 hour.")
-                    time.sleep(3600) # Sleep long to avoid spamming
+                logger.warning("Continuing in 5 minutes...")
+                control.wait(300)
                     
     except KeyboardInterrupt:
         logger.info("Keyboard interrupt detected. Shutting down...")
     except Exception as e:
         logger.critical(f"A fatal error occurred: {e}")
-        driver.save_screenshot("manager_fatal_error.png")
+        for account in accounts:
+            if account.driver:
+                account.driver.save_screenshot(f"manager_fatal_error_{account.name}.png")
     finally:
         logger.info("====== Shutting down CDS Manager ======")
-        driver.quit()
+        for account in accounts:
+            if account.driver:
+                account.driver.quit()
 
 if __name__ == '__main__':
     main()
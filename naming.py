@@ -0,0 +1,103 @@
+import os
+import re
+
+# Output file naming shared by the manager, the retry engine and the downloader.
+#
+#   ERA5_hourly_multivariable_<STATE>_<year>_<chunk>[_m<MM>][_box-<name>][_instant|_accum].nc
+#
+# <chunk> is one of the three-month labels below. The optional _m<MM> part
+# marks a single-month sub-request produced when a chunk is split, _box-<name>
+# marks the sub-request for one box of a multi-box state cover (regions.py),
+# and the _instant/_accum suffix is added by retrieve.py when CDS returns two
+# streams.
+
+FILENAME_PREFIX = "ERA5_hourly_multivariable"
+
+three_month_chunks = [
+    {'label': 'Jan-Mar', 'months': ['01', '02', '03']},
+    {'label': 'Apr-Jun', 'months': ['04', '05', '06']},
+    {'label': 'Jul-Sep', 'months': ['07', '08', '09']},
+    {'label': 'Oct-Dec', 'months': ['10', '11', '12']}
+]
+
+STREAM_SUFFIXES = ['', '_instant', '_accum']
+
+FILENAME_RE = re.compile(
+    r'^' + FILENAME_PREFIX +
+    r'_(?P<state>[A-Z]{2})_(?P<year>\d{4})_(?P<label>[A-Z][a-z]{2}-[A-Z][a-z]{2})'
+    r'(?:_m(?P<month>\d{2}))?'
+    r'(?:_box-(?P<box>[a-z0-9]+))?'
+    r'(?:_(?P<stream>instant|accum))?\.nc$'
+)
+
+
+def build_output_filename(state_abbr, year, label, month=None, box=None):
+    """Builds the output filename for a chunk, or for one month or cover box of a chunk."""
+    name = f"{FILENAME_PREFIX}_{state_abbr}_{year}_{label}"
+    if month:
+        name += f"_m{month}"
+    if box:
+        name += f"_box-{box}"
+    return name + ".nc"
+
+
+def parse_output_filename(filename):
+    """
+    Parses an output (or extracted stream) filename.
+    Returns a dict with state, year, label, month, box and stream, or None.
+    """
+    match = FILENAME_RE.match(os.path.basename(filename))
+    if not match:
+        return None
+    return match.groupdict()
+
+
+def chunk_months(label):
+    """Returns the list of months ('01'..'12') covered by a chunk label."""
+    for chunk in three_month_chunks:
+        if chunk['label'] == label:
+            return list(chunk['months'])
+    return []
+
+
+def months_for_filename(filename):
+    """Returns the months a request for this output filename covers."""
+    parsed = parse_output_filename(filename)
+    if not parsed:
+        return []
+    if parsed['month']:
+        return [parsed['month']]
+    return chunk_months(parsed['label'])
+
+
+def is_part_filename(filename):
+    """True for the sub-request files (month or cover box) that get merged into a chunk."""
+    parsed = parse_output_filename(filename)
+    return bool(parsed and (parsed['month'] or parsed['box']))
+
+
+def stream_paths(output_dir, filename):
+    """
+    Returns every path a finished output may live at on disk: the single-file
+    name and the _instant/_accum pair written when the zip held two streams.
+    """
+    base = filename[:-len(".nc")]
+    return [os.path.join(output_dir, f"{base}{suffix}.nc") for suffix in STREAM_SUFFIXES]
+
+
+# Short names used inside the NetCDF files for the CDS variable names
+VARIABLE_SHORT_NAMES = {
+    '10m_u_component_of_wind': 'u10',
+    '10m_v_component_of_wind': 'v10',
+    '2m_dewpoint_temperature': 'd2m',
+    '2m_temperature': 't2m',
+    'mean_sea_level_pressure': 'msl',
+    'sea_surface_temperature': 'sst',
+    'surface_pressure': 'sp',
+    'total_precipitation': 'tp',
+}
+
+
+def short_variable_names(variables):
+    """Maps CDS variable names to the names used in the files (others pass through)."""
+    return [VARIABLE_SHORT_NAMES.get(v, v) for v in variables]
@@ -1,10 +1,35 @@
+import argparse
+import os
 import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+from config import DB_NAME, states_to_download, years_to_download
+from database import REQUEST_COLUMN_MIGRATIONS, ensure_columns
+from naming import parse_output_filename, three_month_chunks
+
+REFRESH_SECONDS = 10
+THROUGHPUT_HOURS = 24
+UPDATED_AT_INDEX = "CREATE INDEX IF NOT EXISTS idx_requests_updated_at ON requests (updated_at)"
+
+# Coverage cell per chunk state: (symbol, ANSI colour), least advanced first.
+# A chunk that was split (or is rolling, rolling.py) shows its least advanced part in lower case.
+CELL_STYLES = {
+    'missing': ('.', '2'),
+    'failed': ('F', '31'),
+    'accepted': ('A', '34'),
+    'queued': ('Q', '34'),
+    'running': ('R', '33'),
+    'completed': ('C', '36'),
+    'downloaded': ('D', '32'),
+}
+CELL_ORDER = list(CELL_STYLES)
 
-DB_NAME = "requests.db"
 
 def peek_database():
     print(f"--- Peeking into {DB_NAME} ---")
-    
+
     try:
         conn = sqlite3.connect(DB_NAME)
         c = conn.cursor()
@@ -13,18 +38,18 @@ def peek_database():
         print("\n--- Summary by Status ---")
         c.execute("SELECT status, COUNT(*) FROM requests GROUP BY status")
         status_counts = c.fetchall()
-        
+
         if not status_counts:
             print("Database is empty.")
             conn.close()
             return
-        
+
         for status, count in status_counts:
             print(f"{status.title()}:\t{count}")
-            
+
         # --- 2. Show 10 Most Recent Requests ---
         print("\n--- 10 Most Recent Requests (All Data) ---")
-        
+
         # Get column names
         c.execute("PRAGMA table_info(requests)")
         col_names = [info[1] for info in c.fetchall()]
@@ -33,7 +58,7 @@ def peek_database():
         # Fetch and print data
         c.execute("SELECT * FROM requests ORDER BY created_at DESC LIMIT 10")
         recent_requests = c.fetchall()
-        
+
         for i, row in enumerate(recent_requests):
             print(f"--- Entry {i+1} ---")
             for col, val in zip(col_names, row):
@@ -49,5 +74,223 @@ def peek_database():
         if conn:
             conn.close()
 
+
+# --- Watch Mode ---
+
+def load_plan():
+    """(states, years) of the download plan (config.py)."""
+    return list(states_to_download), list(years_to_download)
+
+
+def parse_timestamp(value):
+    return datetime.fromisoformat(str(value)) if value else None
+
+
+class Dashboard:
+    """
+    In-memory copy of the request rows the dashboard needs. Each refresh
+    reads only the rows whose updated_at is at or after the newest one seen
+    so far (an index range scan), so the cost of a refresh follows the number
+    of changes, not the size of the table.
+    """
+
+    def __init__(self, db_name, hours=THROUGHPUT_HOURS, color=True):
+        self.db_name = db_name
+        self.hours = hours
+        self.color = color
+        self.rows = {}          # output_filename -> row dict
+        self.high_water = ''
+        self.states, self.years = [], []
+
+    def refresh(self):
+        """Applies the rows changed since the last refresh. Returns how many were read."""
+        if not self.states:
+            self.states, self.years = load_plan()
+        conn = sqlite3.connect(self.db_name, timeout=30)
+        try:
+            # >= rather than >: rows written in the same instant as the last
+            # one seen may have been committed after the previous read
+            changed = conn.execute(
+                "SELECT output_filename, status, download, finished_at, downloaded_at, updated_at FROM requests "
+                "WHERE updated_at >= ? ORDER BY updated_at",
+                (self.high_water,)
+            ).fetchall()
+        finally:
+            conn.close()
+
+        for filename, status, download, finished_at, downloaded_at, updated_at in changed:
+            parsed = parse_output_filename(filename)
+            if not parsed:
+                continue
+            self.rows[filename] = {
+                'parsed': parsed,
+                'status': status,
+                'download': bool(download),
+                'finished_at': parse_timestamp(finished_at),
+                'downloaded_at': parse_timestamp(downloaded_at),
+                'updated_at': parse_timestamp(updated_at),
+            }
+            self.high_water = max(self.high_water, str(updated_at))
+        return len(changed)
+
+    # --- Coverage ---
+
+    def chunk_states(self):
+        """(state, year, label) -> cell state, from the chunk rows and their parts."""
+        chunks, parts = {}, {}
+        for row in self.rows.values():
+            parsed = row['parsed']
+            key = (parsed['state'], parsed['year'], parsed['label'])
+            cell = 'downloaded' if row['download'] else row['status']
+            if parsed['month'] or parsed['box']:
+                parts.setdefault(key, []).append(cell)
+            else:
+                chunks[key] = cell
+
+        cells = {}
+        for key, cell in chunks.items():
+            if cell in ('split', 'rolling'):
+                # Parts not yet submitted count as queued
+                part_cells = [c for c in parts.get(key, []) if c in CELL_STYLES] or ['queued']
+                cells[key] = (min(part_cells, key=CELL_ORDER.index), True)
+            elif cell in CELL_STYLES:
+                cells[key] = (cell, False)
+        return cells
+
+    def paint(self, text, colour):
+        return f"\033[{colour}m{text}\033[0m" if self.color else text
+
+    def render_matrix(self, cells):
+        labels = [chunk['label'] for chunk in three_month_chunks]
+        header = "      " + " ".join(f"{year:<{len(labels)}}" for year in self.years)
+        lines = [header]
+        for state in self.states:
+            line = f"  {state:<4}"
+            for year in self.years:
+                line += " "
+                for label in labels:
+                    cell, split = cells.get((state, year, label), ('missing', False))
+                    symbol, colour = CELL_STYLES[cell]
+                    line += self.paint(symbol.lower() if split else symbol, colour)
+            lines.append(line)
+        legend = "  ".join(self.paint(f"{symbol} {name}", colour) for name, (symbol, colour) in CELL_STYLES.items())
+        lines.append(f"  {legend}  (lower case: split chunk, least advanced part)")
+        return lines
+
+    # --- Throughput ---
+
+    def downloads_per_hour(self, now):
+        """
+        Chunks downloaded in each of the last `hours` hours, oldest first, by
+        downloaded_at (rows downloaded before that column existed have none).
+        """
+        buckets = [0] * self.hours
+        start = now - timedelta(hours=self.hours)
+        for row in self.rows.values():
+            parsed = row['parsed']
+            if not row['download'] or parsed['month'] or parsed['box'] or not row['downloaded_at']:
+                continue
+            if row['downloaded_at'] >= start:
+                index = min(int((row['downloaded_at'] - start).total_seconds() // 3600), self.hours - 1)
+                buckets[index] += 1
+        return buckets
+
+    def completions_in_window(self, now):
+        start = now - timedelta(hours=self.hours)
+        return sum(1 for row in self.rows.values() if row['finished_at'] and row['finished_at'] >= start
+                   and row['status'] == 'completed')
+
+    def render_throughput(self, now, remaining):
+        buckets = self.downloads_per_hour(now)
+        total = sum(buckets)
+        bars = " ▁▂▃▄▅▆▇█"
+        peak = max(buckets) or 1
+        sparkline = "".join(bars[round(count / peak * (len(bars) - 1))] for count in buckets)
+        rate = total / self.hours
+        lines = [
+            f"  Last {self.hours} h: {total} chunks downloaded ({rate:.2f}/h), "
+            f"{self.completions_in_window(now)} requests completed on CDS",
+            f"  [{sparkline}]  (hourly, oldest first)",
+        ]
+        if remaining == 0:
+            lines.append("  ETA: plan complete")
+        elif rate > 0:
+            eta = now + timedelta(hours=remaining / rate)
+            lines.append(f"  ETA: {remaining} chunks left, ~{remaining / rate:.1f} h at this rate ({eta:%Y-%m-%d %H:%M})")
+        else:
+            lines.append(f"  ETA: {remaining} chunks left, no downloads in the window")
+        return lines
+
+    def render(self, now=None):
+        now = now or datetime.now()
+        cells = self.chunk_states()
+        plan_size = len(self.states) * len(self.years) * len(three_month_chunks)
+        downloaded = sum(
+            1 for (state, year, _), (cell, _) in cells.items()
+            if cell == 'downloaded' and state in self.states and year in self.years
+        )
+        lines = [
+            f"--- {self.db_name} at {now:%Y-%m-%d %H:%M:%S}: "
+            f"{downloaded}/{plan_size} chunks downloaded ({downloaded / plan_size:.1%}) ---" if plan_size
+            else f"--- {self.db_name} at {now:%Y-%m-%d %H:%M:%S}: nothing planned yet ---",
+            "",
+        ]
+        lines += self.render_matrix(cells)
+        lines.append("")
+        lines += self.render_throughput(now, plan_size - downloaded)
+        return "\n".join(lines)
+
+
+def prepare_database(db_name):
+    """
+    The manager migrates the table and creates the index on startup; this
+    covers databases last opened by an older version, whose rows lack the
+    columns the dashboard reads.
+    """
+    conn = sqlite3.connect(db_name, timeout=30)
+    try:
+        ensure_columns(conn.cursor(), 'requests', REQUEST_COLUMN_MIGRATIONS)
+        conn.execute(UPDATED_AT_INDEX)
+        conn.commit()
+    except sqlite3.OperationalError as e:
+        print(f"Could not migrate {db_name} ({e}).")
+    finally:
+        conn.close()
+
+
+def watch(db_name, interval, hours, color):
+    prepare_database(db_name)
+    dashboard = Dashboard(db_name, hours=hours, color=color)
+    try:
+        while True:
+            changed = dashboard.refresh()
+            screen = dashboard.render()
+            if color:
+                # Home the cursor and clear the screen before redrawing
+                sys.stdout.write("\033[H\033[2J")
+            print(screen)
+            print(f"\n  {changed} rows read this refresh; next in {interval}s (Ctrl+C to exit)")
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=f"Inspect {DB_NAME}.")
+    parser.add_argument('--watch', action='store_true', help="Live dashboard: coverage matrix, throughput and ETA.")
+    parser.add_argument('--interval', type=int, default=REFRESH_SECONDS, help="Seconds between refreshes.")
+    parser.add_argument('--hours', type=int, default=THROUGHPUT_HOURS, help="Throughput window in hours.")
+    parser.add_argument('--no-color', action='store_true', help="Plain output, no redraw (e.g. when piped).")
+    args = parser.parse_args()
+
+    if not os.path.exists(DB_NAME):
+        print(f"{DB_NAME} not found.")
+        sys.exit(1)
+
+    if args.watch:
+        watch(DB_NAME, args.interval, max(args.hours, 1), color=not args.no_color and sys.stdout.isatty())
+    else:
+        peek_database()
+
 if __name__ == "__main__":
-    peek_database()
\ No newline at end of file
+    main()
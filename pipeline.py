@@ -0,0 +1,631 @@
+"""
+Multi-process pipeline: runs the manager's stages as independent worker
+processes that coordinate only through requests.db.
+
+    python pipeline.py                              # one of each, 2 download threads, 2 extractors
+    python pipeline.py --downloaders 4 --extractors 2 --no-uploader
+    python pipeline.py --role downloader            # a single worker in the foreground
+
+Roles:
+    poller      refreshes request status on CDS (Selenium or API)
+    submitter   adjusts slot targets, submits new requests, assembles split requests
+                (and updates the rollups / storage tiers with PIPELINE_ROLLUP=1 / PIPELINE_TIERING=1)
+    downloader  fetches the zip of a completed request            (download stage, --downloaders threads)
+    extractor   unzips and renames it into era5_data              (extract stage)
+    uploader    publishes a new Kaggle dataset version            (upload stage)
+
+Downloaders and extractors claim one row at a time with an atomic UPDATE
+that sets lease_owner/lease_expires_at; a heartbeat thread keeps the lease
+alive while the work runs. If a worker dies, its lease expires after
+LEASE_SECONDS and another worker picks the row up. The poller, submitter,
+downloader and uploader hold a named lease in the workers table so only one
+of each runs at a time, even across several `pipeline.py` invocations.
+
+Run this instead of manager.py + retrieve.py, not next to them.
+"""
+import argparse
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from multiprocessing import Process
+
+import browser
+import manager
+import retrieve
+import upload
+from concurrency import SlotController, load_slot_target, ACTIVE_STATUSES
+from logutil import build_file_handler, start_queue_logging
+from naming import stream_paths
+from transfers import DiskBudget, job_reservation_bytes
+
+# --- Pipeline Configuration ---
+LEASE_SECONDS = 600             # a row/role is free again this long after the last heartbeat
+HEARTBEAT_SECONDS = 60
+IDLE_POLL_SECONDS = 30          # how often idle workers look for new work
+FAILURE_BACKOFF_SECONDS = 900   # a failed row is left alone this long before a retry
+POLL_INTERVAL_SECONDS = int(os.getenv("PIPELINE_POLL_SECONDS", "600"))
+SUBMIT_INTERVAL_SECONDS = int(os.getenv("PIPELINE_SUBMIT_SECONDS", "600"))
+UPLOAD_INTERVAL_SECONDS = int(os.getenv("PIPELINE_UPLOAD_SECONDS", str(6 * 3600)))
+UPLOAD_MIN_NEW_FILES = int(os.getenv("PIPELINE_UPLOAD_MIN_FILES", "20"))
+# Rewrite each extracted file with repack.py's default codec (needs xarray)
+REPACK_AFTER_EXTRACT = os.getenv("PIPELINE_REPACK", "0") == "1"
+# Fold new files into rollup.py's daily/monthly aggregates after each submission cycle
+ROLLUP_AFTER_DOWNLOAD = os.getenv("PIPELINE_ROLLUP", "0") == "1"
+# Then move idle rolled-up files to cold storage and evict over budget (storage.py)
+TIER_AFTER_ROLLUP = os.getenv("PIPELINE_TIERING", "0") == "1"
+DB_TIMEOUT_SECONDS = 30
+
+# stage -> condition a row must meet to be claimed for it
+STAGE_CONDITIONS = {
+    'download': "status = 'completed' AND download = 0 AND fetched_path IS NULL AND location IS NOT NULL",
+    'extract': "download = 0 AND fetched_path IS NOT NULL",
+}
+
+
+def connect():
+    """Connection for worker processes: waits on locks held by the other workers."""
+    return sqlite3.connect(manager.DB_NAME, timeout=DB_TIMEOUT_SECONDS)
+
+
+def setup_worker_table(conn):
+    # WAL lets readers (peek, control API, other workers) run during writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS workers (
+        name TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        pid INTEGER,
+        host TEXT,
+        started_at TIMESTAMP,
+        heartbeat_at TIMESTAMP,
+        expires_at TIMESTAMP
+    )
+    """)
+    conn.commit()
+
+
+# --- Leases ---
+
+def claim_row(conn, stage, owner, now=None):
+    """
+    Atomically leases the next row ready for a stage (largest first).
+    Returns (request_id, output_filename, location, content_length, fetched_path) or None.
+    """
+    now = now or datetime.now()
+    expires = now + timedelta(seconds=LEASE_SECONDS)
+    condition = STAGE_CONDITIONS[stage]
+    row = conn.execute(
+        f"""
+        UPDATE requests SET lease_owner = ?, lease_expires_at = ?
+        WHERE request_id = (
+            SELECT request_id FROM requests
+            WHERE {condition} AND (lease_owner IS NULL OR lease_expires_at < ?)
+            ORDER BY content_length DESC LIMIT 1
+        ) AND (lease_owner IS NULL OR lease_expires_at < ?)
+        RETURNING request_id, output_filename, location, content_length, fetched_path
+        """,
+        (owner, expires, now, now)
+    ).fetchone()
+    conn.commit()
+    return row
+
+
+def release_row(conn, request_id, owner, updates=None, backoff_seconds=0):
+    """
+    Ends a lease, applying `updates` (column -> value) in the same statement.
+    With a backoff the lease is kept until then, so a failing row is not
+    retried in a tight loop. Returns False if the lease had been lost.
+    """
+    updates = dict(updates or {})
+    if backoff_seconds:
+        updates['lease_expires_at'] = datetime.now() + timedelta(seconds=backoff_seconds)
+    else:
+        updates['lease_owner'] = None
+        updates['lease_expires_at'] = None
+    updates['updated_at'] = datetime.now()
+    assignments = ", ".join(f"{column} = ?" for column in updates)
+    cursor = conn.execute(
+        f"UPDATE requests SET {assignments} WHERE request_id = ? AND lease_owner = ?",
+        (*updates.values(), request_id, owner)
+    )
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+def claim_role(conn, name, owner, now=None):
+    """Takes the named singleton lease if it is free, expired or already ours."""
+    now = now or datetime.now()
+    cursor = conn.execute(
+        """
+        INSERT INTO workers (name, owner, pid, host, started_at, heartbeat_at, expires_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(name) DO UPDATE SET
+            owner = excluded.owner, pid = excluded.pid, host = excluded.host,
+            started_at = excluded.started_at, heartbeat_at = excluded.heartbeat_at,
+            expires_at = excluded.expires_at
+        WHERE workers.expires_at < excluded.heartbeat_at OR workers.owner = excluded.owner
+        """,
+        (name, owner, os.getpid(), socket.gethostname(), now, now, now + timedelta(seconds=LEASE_SECONDS))
+    )
+    conn.commit()
+    return cursor.rowcount == 1
+
+
+class Heartbeat:
+    """
+    Extends a lease from a background thread while the work runs:
+    a requests row (request_id) or a workers role (role name).
+    `lost` is set if another worker took the lease over in the meantime.
+    """
+
+    def __init__(self, owner, request_id=None, role=None):
+        self.owner = owner
+        self.request_id = request_id
+        self.role = role
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='heartbeat', daemon=True)
+
+    def _beat(self, conn):
+        now = datetime.now()
+        expires = now + timedelta(seconds=LEASE_SECONDS)
+        if self.role:
+            cursor = conn.execute(
+                "UPDATE workers SET heartbeat_at = ?, expires_at = ? WHERE name = ? AND owner = ?",
+                (now, expires, self.role, self.owner)
+            )
+        else:
+            cursor = conn.execute(
+                "UPDATE requests SET lease_expires_at = ? WHERE request_id = ? AND lease_owner = ?",
+                (expires, self.request_id, self.owner)
+            )
+        conn.commit()
+        if cursor.rowcount == 0:
+            self.lost.set()
+
+    def _run(self):
+        conn = connect()
+        try:
+            while not self._stop.wait(HEARTBEAT_SECONDS):
+                self._beat(conn)
+        finally:
+            conn.close()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+# --- Workers ---
+
+def worker_logger(name):
+    """Each worker process logs to its own rotating file and the console."""
+    logger = logging.getLogger(f"pipeline.{name}")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    formatter = logging.Formatter(f'%(asctime)s - {name} - %(levelname)s - %(message)s')
+    file_handler = build_file_handler(f"pipeline_{name}.log", max_bytes=manager.LOG_MAX_BYTES, backup_count=manager.LOG_BACKUP_COUNT)
+    console_handler = logging.StreamHandler()
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+    start_queue_logging(logger, [file_handler, console_handler])
+    return logger
+
+
+def wait_for_role(conn, role, owner, logger):
+    """Blocks until this process holds the singleton lease for `role`."""
+    while not claim_role(conn, role, owner):
+        logger.info(f"Another '{role}' is running. Waiting for its lease to expire...")
+        time.sleep(IDLE_POLL_SECONDS)
+    logger.info(f"Holding the '{role}' lease.")
+
+
+def load_pipeline_accounts(logger):
+    accounts = manager.load_accounts(manager.MAX_ACTIVE_REQUESTS)
+    problems = manager.validate_accounts(accounts)
+    if problems:
+        for problem in problems:
+            logger.error(f"Error: {problem}")
+        raise SystemExit(1)
+    return accounts
+
+
+def active_counts_from_db(conn, accounts):
+    placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+    return {
+        account.name: conn.execute(
+            f"SELECT COUNT(*) FROM requests WHERE status IN ({placeholders}) AND account = ?",
+            (*ACTIVE_STATUSES, account.name)
+        ).fetchone()[0]
+        for account in accounts
+    }
+
+
+def run_poller(name, owner, logger):
+    conn = connect()
+    wait_for_role(conn, 'poller', owner, logger)
+    accounts = load_pipeline_accounts(logger)
+    for account in accounts:
+        account.client = manager.create_api_client(account)
+        if account.uses_browser:
+            account.driver = browser.start_driver()
+            manager.selenium_login(account.driver, logger, account)
+
+    try:
+        with Heartbeat(owner, role='poller') as heartbeat:
+            while not heartbeat.lost.is_set():
+                for account in accounts:
+                    try:
+                        manager.update_account_status(logger, account)
+                    except Exception as e:
+                        logger.error(f"[{account.name}] Status update failed: {e}")
+                        if account.uses_browser:
+                            try:
+                                manager.selenium_login(account.driver, logger, account)
+                            except Exception as login_e:
+                                logger.critical(f"[{account.name}] Re-login failed: {login_e}")
+                time.sleep(POLL_INTERVAL_SECONDS)
+            logger.warning("Lost the 'poller' lease. Exiting.")
+    finally:
+        for account in accounts:
+            if account.driver:
+                account.driver.quit()
+        conn.close()
+
+
+def run_submitter(name, owner, logger):
+    conn = connect()
+    wait_for_role(conn, 'submitter', owner, logger)
+    accounts = load_pipeline_accounts(logger)
+    for account in accounts:
+        account.client = manager.create_api_client(account)
+        initial = load_slot_target(conn, account.name, account.max_active)
+        account.controller = SlotController(account.name, initial, ceiling=manager.MAX_ACTIVE_CEILING,
+                                            poll_seconds=POLL_INTERVAL_SECONDS)
+
+    with Heartbeat(owner, role='submitter') as heartbeat:
+        while not heartbeat.lost.is_set():
+            try:
+                manager.ensure_land_sea_mask(logger)
+                active_counts = active_counts_from_db(conn, accounts)
+                for account in accounts:
+                    account.controller.observe(conn, active_counts[account.name], logger)
+                manager.submit_new_requests(accounts, logger, active_counts)
+                manager.retry.assemble_split_requests(conn, manager.output_dir, logger)
+                if manager.rolling.ROLLING_ENABLED:
+                    manager.rolling.update_rolling_chunks(conn, manager.output_dir, logger)
+                if ROLLUP_AFTER_DOWNLOAD:
+                    # The submitter is a singleton, so rollup files have one writer
+                    import rollup
+                    rollup.update_rollups(manager.output_dir)
+                if TIER_AFTER_ROLLUP:
+                    import storage
+                    demoted = storage.demote(conn, hot_dir=manager.output_dir)
+                    evicted, _ = storage.evict(conn)
+                    if demoted['demoted'] or evicted:
+                        logger.info(f"Storage tiers: {demoted['demoted']} demoted, {evicted} evicted.")
+            except Exception as e:
+                logger.error(f"Submission cycle failed: {e}")
+            time.sleep(SUBMIT_INTERVAL_SECONDS)
+        logger.warning("Lost the 'submitter' lease. Exiting.")
+    conn.close()
+
+
+class HeldReservations:
+    """
+    Disk reservations of fetched zips, kept until an extractor has finished
+    with them: extraction needs the zip and its .nc files on disk at once.
+    """
+
+    def __init__(self, disk):
+        self.disk = disk
+        self._held = {}
+        self._lock = threading.Lock()
+
+    def add(self, request_id, reservation):
+        with self._lock:
+            self._held[request_id] = reservation
+
+    def load(self, conn):
+        """Re-holds space for zips fetched before a restart that are still waiting for an extractor."""
+        rows = conn.execute(
+            f"SELECT request_id, content_length, fetched_path FROM requests WHERE {STAGE_CONDITIONS['extract']}"
+        ).fetchall()
+        for request_id, content_length, fetched_path in rows:
+            written = os.path.getsize(fetched_path) if os.path.exists(fetched_path) else 0
+            self.add(request_id, self.disk.hold(job_reservation_bytes(content_length), written))
+        return len(rows)
+
+    def sweep(self, conn):
+        """Releases the reservations of rows that were extracted or sent back to download."""
+        with self._lock:
+            request_ids = list(self._held)
+        if not request_ids:
+            return
+        placeholders = ", ".join("?" for _ in request_ids)
+        waiting = {row[0] for row in conn.execute(
+            f"SELECT request_id FROM requests WHERE request_id IN ({placeholders}) AND {STAGE_CONDITIONS['extract']}",
+            request_ids
+        )}
+        with self._lock:
+            for request_id in request_ids:
+                if request_id not in waiting:
+                    self.disk.release(self._held.pop(request_id))
+
+
+class SessionCookies:
+    """
+    Login cookies for browser accounts, captured the way retrieve.py's
+    collect_via_browser does and shared by the download threads. Their
+    download links only work inside a logged-in session; API accounts
+    download without cookies.
+    """
+
+    def __init__(self, accounts, logger):
+        self.accounts = {account.name: account for account in accounts}
+        self.logger = logger
+        self._cookies = {}
+        self._lock = threading.Lock()
+
+    def get(self, account_name):
+        account = self.accounts.get(account_name)
+        if account is None or not account.uses_browser:
+            return []
+        with self._lock:
+            if account_name not in self._cookies:
+                driver = browser.start_driver()
+                try:
+                    manager.selenium_login(driver, self.logger, account)
+                    self._cookies[account_name] = driver.get_cookies()
+                finally:
+                    driver.quit()
+                self.logger.info(f"[{account_name}] Login successful, session cookies captured.")
+            return self._cookies[account_name]
+
+    def forget(self, account_name):
+        """Drops an account's cookies (e.g. the session expired) so the next download logs in again."""
+        with self._lock:
+            self._cookies.pop(account_name, None)
+
+
+def download_rows(owner, disk, held, cookies, stop, logger):
+    """One download thread: claims, fetches and hands over rows until `stop` is set."""
+    conn = connect()
+    try:
+        while not stop.is_set():
+            held.sweep(conn)
+            row = claim_row(conn, 'download', owner)
+            if row is None:
+                stop.wait(IDLE_POLL_SECONDS)
+                continue
+            request_id, output_filename, location, content_length, _ = row
+
+            reservation = disk.try_reserve(job_reservation_bytes(content_length))
+            if reservation is None:
+                logger.warning(f"Not enough free disk space for {output_filename}. Backing off.")
+                release_row(conn, request_id, owner, backoff_seconds=FAILURE_BACKOFF_SECONDS)
+                continue
+
+            account = conn.execute("SELECT account FROM requests WHERE request_id = ?", (request_id,)).fetchone()[0]
+            zip_path = os.path.join(retrieve.DOWNLOAD_DIR, f"{request_id}.zip")
+            logger.info(f"Downloading {output_filename} (ID: {request_id})")
+            try:
+                with Heartbeat(owner, request_id=request_id) as heartbeat:
+                    session_cookies = cookies.get(account)
+                    retrieve.download_file_with_session(location, zip_path, session_cookies, retrieve.limiter, reservation)
+                if heartbeat.lost.is_set():
+                    logger.warning(f"Lease on {output_filename} was lost; leaving it to the new owner.")
+                    disk.release(reservation)
+                    continue
+                release_row(conn, request_id, owner, {'fetched_path': zip_path})
+                # Held until the extractor is done with the zip
+                held.add(request_id, reservation)
+                logger.info(f"  > Fetched {output_filename}")
+            except Exception as e:
+                logger.error(f"Download of {output_filename} failed: {e}")
+                cookies.forget(account)
+                disk.release(reservation)
+                release_row(conn, request_id, owner, backoff_seconds=FAILURE_BACKOFF_SECONDS)
+    finally:
+        conn.close()
+
+
+def run_downloader(name, owner, logger, threads=2):
+    """
+    Runs `threads` download threads in this one process, so they share one
+    disk budget and one bandwidth limiter. The role is a singleton, so a
+    second pipeline.py invocation cannot add downloads on top of them.
+    """
+    conn = connect()
+    wait_for_role(conn, 'downloader', owner, logger)
+    os.makedirs(retrieve.DOWNLOAD_DIR, exist_ok=True)
+    disk = DiskBudget(retrieve.DOWNLOAD_DIR, headroom_bytes=int(retrieve.DISK_HEADROOM_GB * 1024 * 1024 * 1024))
+    held = HeldReservations(disk)
+    cookies = SessionCookies(load_pipeline_accounts(logger), logger)
+    waiting = held.load(conn)
+    if waiting:
+        logger.info(f"Holding disk space for {waiting} zips waiting for extraction.")
+    conn.close()
+
+    stop = threading.Event()
+    workers = [
+        threading.Thread(target=download_rows, args=(f"{owner}/{i + 1}", disk, held, cookies, stop, logger),
+                         name=f"{name}-{i + 1}", daemon=True)
+        for i in range(max(threads, 1))
+    ]
+    with Heartbeat(owner, role='downloader') as heartbeat:
+        for worker in workers:
+            worker.start()
+        heartbeat.lost.wait()
+        logger.warning("Lost the 'downloader' lease. Stopping after the current downloads.")
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+
+def run_extractor(name, owner, logger):
+    conn = connect()
+    while True:
+        row = claim_row(conn, 'extract', owner)
+        if row is None:
+            time.sleep(IDLE_POLL_SECONDS)
+            continue
+        request_id, output_filename, _, _, zip_path = row
+
+        if not os.path.exists(zip_path):
+            # Lost (e.g. removed by reconcile.py): fetch it again
+            logger.warning(f"{os.path.basename(zip_path)} is gone. Sending {output_filename} back to download.")
+            release_row(conn, request_id, owner, {'fetched_path': None})
+            continue
+
+        logger.info(f"Extracting {output_filename} (ID: {request_id})")
+        try:
+            with Heartbeat(owner, request_id=request_id):
+                retrieve.process_downloaded_file(zip_path, output_filename)
+                if REPACK_AFTER_EXTRACT:
+                    import repack
+                    for path in stream_paths(retrieve.DOWNLOAD_DIR, output_filename):
+                        if os.path.exists(path):
+                            _, _, before, after = repack.repack_file(path)
+                            logger.info(f"  > Repacked {os.path.basename(path)}: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+            release_row(conn, request_id, owner, {'download': 1, 'downloaded_at': datetime.now(), 'fetched_path': None})
+            logger.info(f"  > Marked '{output_filename}' as downloaded.")
+        except Exception as e:
+            logger.error(f"Extraction of {output_filename} failed: {e}")
+            # A corrupt zip is fetched again
+            release_row(conn, request_id, owner, {'fetched_path': None}, backoff_seconds=FAILURE_BACKOFF_SECONDS)
+
+
+def run_uploader(name, owner, logger):
+    conn = connect()
+    wait_for_role(conn, 'uploader', owner, logger)
+    upload.check_auth()
+
+    with Heartbeat(owner, role='uploader') as heartbeat:
+        while not heartbeat.lost.is_set():
+            pending = conn.execute(
+                "SELECT request_id, output_filename FROM requests WHERE download = 1 AND uploaded = 0"
+            ).fetchall()
+            if len(pending) >= UPLOAD_MIN_NEW_FILES:
+                logger.info(f"Publishing {len(pending)} new files to Kaggle...")
+                staging = upload.build_staging(manager.output_dir)
+                logger.info(f"  > Staged {len(staging['staged'])} outputs ({staging['linked']} new links, "
+                            f"{staging['rejected']} rejected)")
+                upload.create_or_update_metadata_file()
+                message = f"Automated data update: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                if upload.check_dataset_exists():
+                    ok = upload.run_command(["kaggle", "datasets", "version", "-p", upload.DATASET_DIR, "-m", message], fail_on_error=False)
+                else:
+                    ok = upload.run_command(["kaggle", "datasets", "create", "-p", upload.DATASET_DIR], fail_on_error=False)
+                if ok:
+                    # Rows whose files failed verification are retried next time
+                    conn.executemany(
+                        "UPDATE requests SET uploaded = 1 WHERE request_id = ?",
+                        [(request_id,) for request_id, filename in pending if filename in staging['staged']]
+                    )
+                    conn.commit()
+                    logger.info("  > Upload complete.")
+                else:
+                    logger.error("  > Upload failed; will retry next interval.")
+            time.sleep(UPLOAD_INTERVAL_SECONDS)
+        logger.warning("Lost the 'uploader' lease. Exiting.")
+    conn.close()
+
+
+ROLES = {
+    'poller': run_poller,
+    'submitter': run_submitter,
+    'downloader': run_downloader,
+    'extractor': run_extractor,
+    'uploader': run_uploader,
+}
+
+
+def run_worker(role, name, options=None):
+    """Entry point of a worker process; `options` are passed on to the role's function."""
+    logger = worker_logger(name)
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    logger.info(f"Starting {role} worker '{name}' (owner {owner}).")
+    try:
+        ROLES[role](name, owner, logger, **(options or {}))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logger.critical(f"Worker crashed: {e}")
+        raise
+
+
+def supervise(plan, logger):
+    """Starts one process per (role, name, options) and restarts any that exit."""
+    processes = {}
+
+    def start(role, name, options):
+        process = Process(target=run_worker, args=(role, name, options), name=name, daemon=False)
+        process.start()
+        processes[name] = (role, options, process)
+        logger.info(f"Started {name} (pid {process.pid}).")
+
+    for role, name, options in plan:
+        start(role, name, options)
+    try:
+        while True:
+            time.sleep(IDLE_POLL_SECONDS)
+            for name, (role, options, process) in list(processes.items()):
+                if not process.is_alive():
+                    logger.warning(f"{name} exited with code {process.exitcode}. Restarting.")
+                    start(role, name, options)
+    except KeyboardInterrupt:
+        logger.info("Stopping workers...")
+    finally:
+        for role, options, process in processes.values():
+            process.terminate()
+        for role, options, process in processes.values():
+            process.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the CDS pipeline as independent worker processes.")
+    parser.add_argument('--role', choices=list(ROLES), help="Run a single worker of this role in the foreground.")
+    parser.add_argument('--downloaders', type=int, default=2, help="Download threads (all in one downloader process).")
+    parser.add_argument('--extractors', type=int, default=2)
+    parser.add_argument('--no-poller', action='store_true')
+    parser.add_argument('--no-submitter', action='store_true')
+    parser.add_argument('--no-uploader', action='store_true')
+    args = parser.parse_args()
+
+    logger = manager.setup_logging()
+    manager.setup_database(logger)
+    conn = connect()
+    setup_worker_table(conn)
+    conn.close()
+
+    downloader_options = {'threads': args.downloaders}
+    if args.role:
+        run_worker(args.role, f"{args.role}-{os.getpid()}", downloader_options if args.role == 'downloader' else None)
+        return
+
+    plan = []
+    if not args.no_poller:
+        plan.append(('poller', 'poller', None))
+    if not args.no_submitter:
+        plan.append(('submitter', 'submitter', None))
+    if args.downloaders > 0:
+        plan.append(('downloader', 'downloader', downloader_options))
+    plan += [('extractor', f"extractor-{i + 1}", None) for i in range(args.extractors)]
+    if not args.no_uploader:
+        plan.append(('uploader', 'uploader', None))
+    logger.info(f"Starting pipeline: {', '.join(name for _, name, _ in plan)}")
+    supervise(plan, logger)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Dry-run planner: expands the configured download plan without submitting
+anything and estimates how many CDS jobs, how many bytes and how much queue
+time it represents.
+
+Usage:
+    python planner.py                       # current configuration
+    python planner.py --years 2015-2024     # what would adding years cost?
+    python planner.py --states TX,CA --variables 2m_temperature,total_precipitation
+"""
+import argparse
+import calendar
+import os
+import sqlite3
+from collections import defaultdict
+from datetime import datetime
+
+from config import (
+    DB_NAME, MAX_ACTIVE_REQUESTS, bounding_boxes, years_to_download, variables_to_download,
+)
+from naming import three_month_chunks, build_output_filename, months_for_filename, parse_output_filename
+from regions import area_cover, job_area
+from landsea import prune_variables
+from scheduler import grid_points
+from concurrency import load_slot_target
+from database import setup_database
+
+# Used when requests.db has no completed requests to calibrate against
+DEFAULT_BYTES_PER_VALUE = 2.0
+DEFAULT_JOB_HOURS = 6.0
+
+
+def job_hours(year, months):
+    """Number of hourly time steps in the given months of a year."""
+    return sum(calendar.monthrange(int(year), int(month))[1] for month in months) * 24
+
+
+def job_values(state_abbr, year, months, variables, box=None):
+    """
+    Number of grid values (points x hours x variables) a job returns, after
+    sea-only variables are pruned for landlocked areas.
+    """
+    area = job_area({'state_abbr': state_abbr, 'box': box}, bounding_boxes)
+    kept, _ = prune_variables(variables, area)
+    return grid_points(area) * job_hours(year, months) * len(kept)
+
+
+def expand_plan(states, years, variables):
+    """
+    Every (state, year, chunk) output of the plan with its size in values
+    and the number of CDS requests it takes (one per box of a state cover).
+    """
+    jobs = []
+    for state_abbr in states:
+        boxes = list(area_cover(state_abbr, bounding_boxes) or [None])
+        for year in years:
+            for chunk in three_month_chunks:
+                jobs.append({
+                    'state_abbr': state_abbr,
+                    'year': year,
+                    'output_filename': build_output_filename(state_abbr, year, chunk['label']),
+                    'values': sum(job_values(state_abbr, year, chunk['months'], variables, box) for box in boxes),
+                    'requests': len(boxes),
+                })
+    return jobs
+
+
+def calibrate_bytes_per_value(conn):
+    """Median observed bytes per grid value over completed requests."""
+    rows = conn.execute(
+        "SELECT state_abbr, year, output_filename, content_length, pruned_variables FROM requests "
+        "WHERE status = 'completed' AND content_length > 0"
+    ).fetchall()
+    ratios = []
+    for state_abbr, year, filename, content_length, pruned in rows:
+        months = months_for_filename(filename)
+        if state_abbr not in bounding_boxes or not months:
+            continue
+        # Count the variables that were actually requested at the time
+        area = job_area({'state_abbr': state_abbr, 'box': parse_output_filename(filename)['box']}, bounding_boxes)
+        n_variables = len(variables_to_download) - len(pruned.split(',') if pruned else [])
+        values = grid_points(area) * job_hours(year, months) * n_variables
+        if values:
+            ratios.append(content_length / values)
+    if not ratios:
+        return DEFAULT_BYTES_PER_VALUE, 0
+    ratios.sort()
+    return ratios[len(ratios) // 2], len(ratios)
+
+
+def historical_job_hours(conn):
+    """Median hours a request holds a slot (submission to completion)."""
+    rows = conn.execute(
+        "SELECT created_at, COALESCE(finished_at, updated_at) FROM requests WHERE status = 'completed'"
+    ).fetchall()
+    durations = sorted(
+        (datetime.fromisoformat(str(end)) - datetime.fromisoformat(str(start))).total_seconds() / 3600
+        for start, end in rows if start and end
+    )
+    durations = [d for d in durations if d > 0]
+    if not durations:
+        return DEFAULT_JOB_HOURS, 0
+    return durations[len(durations) // 2], len(durations)
+
+
+def current_slot_limit(conn):
+    """Sum of the latest slot targets of all accounts, or the static limit."""
+    try:
+        accounts = [row[0] for row in conn.execute("SELECT DISTINCT account FROM slot_metrics")]
+    except sqlite3.OperationalError:
+        accounts = []
+    if not accounts:
+        return MAX_ACTIVE_REQUESTS
+    return int(sum(load_slot_target(conn, account, MAX_ACTIVE_REQUESTS) for account in accounts))
+
+
+def parse_years(text):
+    """'2019-2024' or '2019,2021' -> ['2019', ...]"""
+    years = []
+    for part in text.split(','):
+        if '-' in part:
+            start, end = part.split('-')
+            years.extend(str(y) for y in range(int(start), int(end) + 1))
+        elif part.strip():
+            years.append(part.strip())
+    return years
+
+
+def format_bytes(n):
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if n < 1024 or unit == 'TB':
+            return f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def print_breakdown(title, key, jobs):
+    groups = defaultdict(lambda: {'jobs': 0, 'remaining': 0, 'bytes': 0, 'remaining_bytes': 0})
+    for job in jobs:
+        g = groups[job[key]]
+        g['jobs'] += 1
+        g['bytes'] += job['bytes']
+        if job['remaining']:
+            g['remaining'] += 1
+            g['remaining_bytes'] += job['bytes']
+
+    print(f"\n--- By {title} ---")
+    print(f"{title:<8}{'Jobs':>6}{'To do':>7}{'Est. size':>12}{'To fetch':>12}")
+    for name in sorted(groups):
+        g = groups[name]
+        print(f"{name:<8}{g['jobs']:>6}{g['remaining']:>7}{format_bytes(g['bytes']):>12}{format_bytes(g['remaining_bytes']):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate jobs, bytes and completion time of the download plan.")
+    parser.add_argument('--years', help="Years to plan, e.g. 2015-2024 (default: configured years).")
+    parser.add_argument('--states', help="Comma-separated states (default: all configured).")
+    parser.add_argument('--variables', help="Comma-separated variables (default: configured variables).")
+    parser.add_argument('--slots', type=int, help="Active request limit to assume (default: current target).")
+    parser.add_argument('--by', choices=['state', 'year', 'both'], default='both')
+    args = parser.parse_args()
+
+    years = parse_years(args.years) if args.years else years_to_download
+    states = [s.strip().upper() for s in args.states.split(',')] if args.states else list(bounding_boxes)
+    variables = args.variables.split(',') if args.variables else variables_to_download
+    unknown = [s for s in states if s not in bounding_boxes]
+    if unknown:
+        print(f"Error: no bounding box for {', '.join(unknown)}")
+        return
+
+    if os.path.exists(DB_NAME):
+        # Databases from older versions lack columns the calibration reads
+        setup_database()
+        conn = sqlite3.connect(DB_NAME)
+        try:
+            bytes_per_value, n_calibration = calibrate_bytes_per_value(conn)
+            hours_per_job, n_history = historical_job_hours(conn)
+            slots = args.slots or current_slot_limit(conn)
+            done = {row[0] for row in conn.execute("SELECT output_filename FROM requests WHERE download = 1")}
+            in_db = {row[0] for row in conn.execute("SELECT output_filename FROM requests")}
+        finally:
+            conn.close()
+    else:
+        # No database yet: nothing to calibrate against
+        bytes_per_value, n_calibration = DEFAULT_BYTES_PER_VALUE, 0
+        hours_per_job, n_history = DEFAULT_JOB_HOURS, 0
+        slots = args.slots or MAX_ACTIVE_REQUESTS
+        done, in_db = set(), set()
+
+    jobs = expand_plan(states, years, variables)
+    for job in jobs:
+        job['bytes'] = job['values'] * bytes_per_value
+        job['remaining'] = job['output_filename'] not in done
+
+    to_submit = [job for job in jobs if job['output_filename'] not in in_db]
+    in_flight = [job for job in jobs if job['output_filename'] in in_db and job['output_filename'] not in done]
+    remaining_bytes = sum(job['bytes'] for job in jobs if job['remaining'])
+
+    print("--- Download Plan (dry run, nothing is submitted) ---")
+    print(f"States: {len(states)}, years: {years[0]}-{years[-1]} ({len(years)}), variables: {len(variables)}")
+    print(f"Total jobs: {len(jobs)}  |  downloaded: {len(jobs) - len(to_submit) - len(in_flight)}"
+          f"  |  in flight: {len(in_flight)}  |  to submit: {len(to_submit)}")
+    print(f"Estimated size: {format_bytes(sum(job['bytes'] for job in jobs))} total, {format_bytes(remaining_bytes)} still to fetch")
+    print(f"Calibration: {bytes_per_value:.3f} bytes/value "
+          f"({'from ' + str(n_calibration) + ' completed requests' if n_calibration else 'default, no history'})")
+
+    if args.by in ('state', 'both'):
+        print_breakdown('State', 'state_abbr', jobs)
+    if args.by in ('year', 'both'):
+        print_breakdown('Year', 'year', jobs)
+
+    # Each slot turns over one job per median slot-holding time
+    jobs_per_hour = slots / hours_per_job
+    open_requests = sum(job['requests'] for job in to_submit + in_flight)
+    eta_hours = open_requests / jobs_per_hour if jobs_per_hour else float('inf')
+    print("\n--- Projection ---")
+    print(f"Median time per job: {hours_per_job:.1f} h "
+          f"({'from ' + str(n_history) + ' completed requests' if n_history else 'default, no history'})")
+    print(f"Slot limit: {slots}  ->  ~{jobs_per_hour:.1f} jobs/hour")
+    print(f"Estimated time to complete: {eta_hours:.0f} h ({eta_hours / 24:.1f} days)")
+
+
+if __name__ == '__main__':
+    main()
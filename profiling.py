@@ -0,0 +1,200 @@
+"""
+Built-in profiling for the entry points (manager.py, retrieve.py,
+upload.py), enabled with --profile:
+
+    python manager.py --profile                  # timing spans per phase
+    python retrieve.py --profile --profile-sample   # plus a sampling profile
+
+Phases are timed with span() blocks in the code and by wrapping a few
+library calls when profiling is on (WebDriverWait.until, cdsapi retrieve,
+SQLite commits, ...). Each span records wall time and the CPU time of its
+thread, so the report separates waiting (network, browser, disk, sleeps)
+from computing. With --profile-sample a background thread also samples
+every thread's stack every PROFILE_SAMPLE_SECONDS and counts the functions
+seen, which shows the hot loops without a debugger.
+
+The report is written next to the log as <script>.profile.txt, at exit and
+whenever write_report() is called (the manager does so after every cycle).
+When profiling is off, span() is a no-op context manager.
+"""
+import atexit
+import functools
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+PROFILE_SAMPLE_SECONDS = 0.01
+REPORT_TOP_PHASES = 25
+REPORT_TOP_FUNCTIONS = 25
+
+_profiler = None
+
+
+class Sampler(threading.Thread):
+    """Samples the stacks of all other threads at a fixed interval."""
+
+    def __init__(self, interval=PROFILE_SAMPLE_SECONDS):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.samples = 0
+        self.own = Counter()        # innermost frame
+        self.inclusive = Counter()  # anywhere on the stack
+        self.stopped = threading.Event()
+
+    @staticmethod
+    def describe(code):
+        return f"{os.path.basename(code.co_filename)}:{code.co_firstlineno} {code.co_name}"
+
+    def run(self):
+        me = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                self.samples += 1
+                self.own[self.describe(frame.f_code)] += 1
+                seen = set()
+                while frame is not None:
+                    seen.add(self.describe(frame.f_code))
+                    frame = frame.f_back
+                self.inclusive.update(seen)
+
+
+class Profiler:
+    """Accumulates wall and CPU time per named phase, across threads."""
+
+    def __init__(self, script, report_path, sample=False):
+        self.script = script
+        self.report_path = report_path
+        self.started_at = datetime.now()
+        self.wall_started = time.perf_counter()
+        self.cpu_started = time.process_time()
+        self.phases = {}    # name -> [calls, wall, cpu, max wall]
+        self.lock = threading.Lock()
+        self.sampler = Sampler() if sample else None
+        if self.sampler:
+            self.sampler.start()
+
+    @contextmanager
+    def span(self, phase):
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - wall, time.thread_time() - cpu)
+
+    def record(self, phase, wall, cpu):
+        with self.lock:
+            stats = self.phases.setdefault(phase, [0, 0.0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += wall
+            stats[2] += cpu
+            stats[3] = max(stats[3], wall)
+
+    def report(self):
+        wall = time.perf_counter() - self.wall_started
+        cpu = time.process_time() - self.cpu_started
+        lines = [
+            f"--- Profile: {self.script} (pid {os.getpid()}), started {self.started_at:%Y-%m-%d %H:%M:%S}, "
+            f"written {datetime.now():%Y-%m-%d %H:%M:%S} ---",
+            f"Wall time: {wall:.1f} s, process CPU: {cpu:.1f} s "
+            f"({max(wall - cpu, 0) / wall:.0%} of wall time not on a CPU)" if wall else "",
+            "",
+            "Phases (inclusive: a nested phase is also counted in its parent; wait = wall - CPU of the thread)",
+            f"{'phase':<28}{'calls':>8}{'wall s':>10}{'cpu s':>9}{'wait s':>10}{'wait':>6}{'max s':>9}{'mean ms':>10}",
+        ]
+        with self.lock:
+            phases = sorted(self.phases.items(), key=lambda item: item[1][1], reverse=True)
+        for name, (calls, phase_wall, phase_cpu, longest) in phases[:REPORT_TOP_PHASES]:
+            wait = max(phase_wall - phase_cpu, 0.0)
+            lines.append(
+                f"{name:<28}{calls:>8}{phase_wall:>10.2f}{phase_cpu:>9.2f}{wait:>10.2f}"
+                f"{wait / phase_wall if phase_wall else 0:>6.0%}{longest:>9.2f}{phase_wall / calls * 1000:>10.1f}"
+            )
+
+        if self.sampler:
+            samples = self.sampler.samples or 1
+            lines += [
+                "",
+                f"Top functions ({self.sampler.samples} stack samples every {self.sampler.interval * 1000:.0f} ms; "
+                "own = innermost frame, incl = anywhere on the stack)",
+                f"{'own':>6}{'incl':>7}  function",
+            ]
+            for name, count in self.sampler.own.most_common(REPORT_TOP_FUNCTIONS):
+                lines.append(f"{count / samples:>6.1%}{self.sampler.inclusive[name] / samples:>7.1%}  {name}")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self):
+        temp_path = self.report_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            f.write(self.report())
+        os.replace(temp_path, self.report_path)
+
+
+def span(phase):
+    """Times the enclosed block as `phase` when profiling is on."""
+    return _profiler.span(phase) if _profiler else nullcontext()
+
+
+def write_report():
+    if _profiler:
+        _profiler.write_report()
+
+
+def instrument(owner, attribute, phase):
+    """Wraps owner.attribute (a function or method) so every call is timed as `phase`."""
+    original = getattr(owner, attribute)
+
+    @functools.wraps(original)
+    def timed(*args, **kwargs):
+        with span(phase):
+            return original(*args, **kwargs)
+
+    setattr(owner, attribute, timed)
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """sqlite3 connection whose commits (where the fsync and lock waits land) are timed."""
+
+    def commit(self):
+        with span('sqlite.commit'):
+            return super().commit()
+
+
+def instrument_sqlite():
+    """Makes sqlite3.connect() return timed connections, for every module that calls it."""
+    original = sqlite3.connect
+
+    @functools.wraps(original)
+    def connect(*args, **kwargs):
+        kwargs.setdefault('factory', ProfiledConnection)
+        return original(*args, **kwargs)
+
+    sqlite3.connect = connect
+
+
+def add_arguments(parser):
+    parser.add_argument('--profile', action='store_true',
+                        help="Time each phase and write <script>.profile.txt next to the log.")
+    parser.add_argument('--profile-sample', action='store_true',
+                        help="With --profile, also sample the call stacks of every thread.")
+
+
+def enable(script, report_dir=".", sample=False, targets=()):
+    """
+    Turns profiling on for this process. `targets` are (owner, attribute,
+    phase) triples of library calls to time as well. Returns the report path.
+    """
+    global _profiler
+    report_path = os.path.join(report_dir or ".", f"{script}.profile.txt")
+    _profiler = Profiler(script, report_path, sample=sample)
+    instrument_sqlite()
+    for owner, attribute, phase in targets:
+        instrument(owner, attribute, phase)
+    atexit.register(write_report)
+    return report_path
@@ -0,0 +1,142 @@
+import os
+import shutil
+import time
+from datetime import datetime
+
+from naming import parse_output_filename
+
+# Temp files younger than this may belong to a download that is still
+# running in retrieve.py, so they are left alone.
+STALE_SECONDS = 3600
+
+
+def scan_output_dir(output_dir):
+    """
+    One os.scandir pass over the output directory.
+    Returns ({output_filename: set of streams on disk}, {recently modified
+    output_filenames}, [stale temp paths]). The stream is '' for a
+    single-file download, else 'instant' or 'accum'.
+    """
+    on_disk = {}
+    recent = set()
+    stale = []
+    cutoff = time.time() - STALE_SECONDS
+
+    if not os.path.isdir(output_dir):
+        return on_disk, recent, stale
+
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            name = entry.name
+            parsed = parse_output_filename(name)
+            if parsed and entry.is_file():
+                base = name[:-len(".nc")]
+                if parsed['stream']:
+                    base = base[:-len(parsed['stream']) - 1]
+                on_disk.setdefault(base + ".nc", set()).add(parsed['stream'] or '')
+                if entry.stat().st_mtime >= cutoff:
+                    recent.add(base + ".nc")
+                continue
+
+            # Leftovers of interrupted downloads / extractions / merges
+            is_temp = (
+                name.endswith((".zip", ".part", ".tmp"))
+                or (entry.is_dir() and name.endswith("_extract"))
+                or (name.startswith("data") and name.endswith(".nc"))
+            )
+            if is_temp and entry.stat().st_mtime < cutoff:
+                stale.append(entry.path)
+
+    return on_disk, recent, stale
+
+
+def is_complete(streams):
+    """A download is complete as a single file or as both instant and accum."""
+    return '' in streams or {'instant', 'accum'} <= streams
+
+
+def reconcile(conn, output_dir, logger):
+    """
+    Brings requests.db in line with the files in output_dir:
+      * rows not marked downloaded whose output is complete on disk -> download = 1
+      * rows marked downloaded whose output is missing or half-extracted -> download = 0
+        (a lone _instant/_accum file is removed so it is fetched again)
+      * stale .zip/.part/.tmp files and extraction leftovers are deleted
+    All DB changes are applied in a single transaction.
+    Returns a dict of counts.
+    """
+    started = time.perf_counter()
+    on_disk, recent, stale = scan_output_dir(output_dir)
+
+    # 'merged' rows are monthly parts already assembled into their parent;
+    # their files are gone on purpose, as are those of outputs moved to the
+    # cold tier by storage.py. Rolling chunks (rolling.py) are rebuilt from
+    # parts that stay on disk, so the chunk file alone says nothing.
+    rows = conn.execute(
+        """
+        SELECT r.request_id, r.output_filename, r.download, r.status,
+               r.parent_filename IS NOT NULL AND NOT EXISTS (
+                   SELECT 1 FROM requests p WHERE p.output_filename = r.parent_filename
+                                              AND p.status IN ('split', 'rolling')
+               ) AS merged
+        FROM requests r WHERE r.status != 'split' AND COALESCE(r.storage_tier, 'hot') = 'hot'
+        """
+    ).fetchall()
+
+    mark_downloaded = []
+    mark_missing = []
+    partial_paths = []
+    for request_id, filename, downloaded, status, merged in rows:
+        if merged or status == 'rolling' or filename in recent:
+            # Assembled part, rolling chunk, or possibly still being extracted right now
+            continue
+        streams = on_disk.get(filename, set())
+        complete = is_complete(streams)
+        if complete and not downloaded:
+            mark_downloaded.append(request_id)
+        elif not complete and downloaded:
+            mark_missing.append(request_id)
+        if streams and not complete:
+            base = filename[:-len(".nc")]
+            partial_paths.extend(os.path.join(output_dir, f"{base}_{stream}.nc") for stream in streams)
+
+    tracked = {row[1] for row in rows}
+    untracked = [name for name in on_disk if name not in tracked]
+
+    now = datetime.now()
+    with conn:
+        conn.executemany(
+            "UPDATE requests SET download = 1, updated_at = ? WHERE request_id = ?",
+            [(now, request_id) for request_id in mark_downloaded]
+        )
+        conn.executemany(
+            "UPDATE requests SET download = 0, updated_at = ? WHERE request_id = ?",
+            [(now, request_id) for request_id in mark_missing]
+        )
+
+    for path in partial_paths + stale:
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not remove {path}: {e}")
+
+    counts = {
+        'files': sum(len(streams) for streams in on_disk.values()),
+        'marked_downloaded': len(mark_downloaded),
+        'marked_missing': len(mark_missing),
+        'removed_partial': len(partial_paths),
+        'removed_stale': len(stale),
+        'untracked': len(untracked),
+    }
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Reconciled {counts['files']} files with {len(rows)} rows in {elapsed * 1000:.0f} ms: "
+        f"{counts['marked_downloaded']} marked downloaded, {counts['marked_missing']} marked missing, "
+        f"{counts['removed_partial']} partial and {counts['removed_stale']} stale files removed."
+    )
+    if untracked:
+        logger.warning(f"{len(untracked)} output files on disk have no row in the DB (e.g. {untracked[0]}).")
+    return counts
@@ -0,0 +1,54 @@
+# Request areas are [North, West, South, East] in degrees, as CDS expects.
+#
+# A single box cannot describe a state that crosses the antimeridian: AK's
+# configured box runs from -179.15 to 179.78, i.e. almost all the way round
+# the globe, and HI's includes 20 degrees of open ocean to reach the
+# north-western islands. For these states the plan requests a tight cover of
+# smaller boxes instead, one sub-request per box, and the parts are merged
+# back into the usual per-state output file.
+AREA_COVERS = {
+    'AK': {
+        'mainland': [71.4, -172.0, 51.2, -141.0],   # incl. Alaska Peninsula, eastern Aleutians
+        'panhandle': [60.4, -141.0, 54.6, -129.9],
+        'bering': [60.6, -180.0, 51.2, -172.0],     # central Aleutians, St. Matthew Island
+        'near': [53.1, 172.4, 51.2, 180.0],         # Near/Rat Islands, west of the antimeridian
+    },
+    'HI': {
+        'main': [22.3, -160.3, 18.9, -154.8],       # Hawaii .. Niihau
+        'nwchain': [25.9, -171.8, 22.9, -161.9],    # Nihoa .. Laysan
+        'midway': [28.5, -178.4, 25.9, -173.9],     # Lisianski .. Kure
+    },
+}
+
+
+def crosses_antimeridian(area):
+    """True for a box written with West > East, i.e. wrapping across 180."""
+    return area[1] > area[3]
+
+
+def split_antimeridian(area):
+    """Splits a wrapping box into the parts east and west of 180."""
+    north, west, south, east = area
+    return {'west': [north, west, south, 180.0], 'east': [north, -180.0, south, east]}
+
+
+def area_cover(state_abbr, bounding_boxes):
+    """
+    {box name: area} to request for a state, or None when the state's single
+    bounding box is requested as is.
+    """
+    if state_abbr in AREA_COVERS:
+        return AREA_COVERS[state_abbr]
+    area = bounding_boxes.get(state_abbr)
+    if area and crosses_antimeridian(area):
+        return split_antimeridian(area)
+    return None
+
+
+def job_area(job, bounding_boxes):
+    """The area a submission job requests: its cover box, or the state's box."""
+    box = job.get('box')
+    if box:
+        return area_cover(job['state_abbr'], bounding_boxes)[box]
+    return bounding_boxes[job['state_abbr']]
+
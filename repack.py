@@ -0,0 +1,267 @@
+"""
+Repack stage: rewrites downloaded NetCDF files with a storage-friendly
+encoding instead of whatever CDS chose.
+
+    python repack.py                          # every file in era5_data not yet repacked
+    python repack.py --codec zlib4 FILE ...   # a different codec setting
+    python repack.py --benchmark FILE         # size / read speed / error per codec setting
+
+The default setting packs each variable to int16 with scale_factor/add_offset
+(only where the quantization error stays within PACKING_TOLERANCE), applies
+shuffle + zlib and chunks the data along time, so per-point time series are
+read from a few chunks. Files are rewritten atomically and tagged with the
+codec name, so a later run skips them.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import xarray as xr
+
+import storage
+from naming import parse_output_filename
+
+DEFAULT_DATA_DIR = "era5_data"
+DEFAULT_WORKERS = max((os.cpu_count() or 2) - 1, 1)
+INT16_STEPS = 2 ** 16 - 2  # -32767..32767; -32768 is kept as the fill value
+INT16_FILL = np.int16(-32768)
+
+# Largest acceptable absolute error per variable (file units) for int16 packing
+PACKING_TOLERANCE = {
+    'u10': 0.01,   # m s-1
+    'v10': 0.01,   # m s-1
+    't2m': 0.01,   # K
+    'd2m': 0.01,   # K
+    'sst': 0.01,   # K
+    'msl': 1.0,    # Pa
+    'sp': 1.0,     # Pa
+    'tp': 1e-5,    # m (0.01 mm)
+}
+
+# Chunk shape: long in time, small in space (balanced to the file's shape)
+CHUNK_TIME_STEPS = 24 * 31
+CHUNK_SPACE_CELLS = 32
+
+# name -> (int16 packing, zlib level or None, shuffle)
+CODECS = {
+    'raw': (False, None, False),
+    'zlib1': (False, 1, True),
+    'zlib4': (False, 4, True),
+    'zlib9': (False, 9, True),
+    'packed': (True, None, False),
+    'packed_zlib1': (True, 1, True),
+    'packed_zlib4': (True, 4, True),
+}
+DEFAULT_CODEC = 'packed_zlib4'
+CODEC_ATTR = 'repack_codec'
+
+
+def time_dim_of(ds):
+    return 'valid_time' if 'valid_time' in ds.dims else 'time'
+
+
+def packing_params(values, tolerance):
+    """
+    (scale_factor, add_offset) that map the value range onto int16, or None
+    if the quantization error (half a step) would exceed the tolerance.
+    """
+    low, high = np.nanmin(values), np.nanmax(values)
+    if not np.isfinite(low) or not np.isfinite(high):
+        return None
+    scale = (high - low) / INT16_STEPS if high > low else 1.0
+    if scale / 2 > tolerance:
+        return None
+    return np.float32(scale), np.float32((high + low) / 2)
+
+
+def balanced_chunk(size, target):
+    """Chunk length near `target` that splits `size` evenly (HDF5 stores edge chunks full-sized)."""
+    count = -(-size // target)
+    return -(-size // count)
+
+
+def chunk_shape(da, time_dim):
+    return tuple(
+        balanced_chunk(size, CHUNK_TIME_STEPS if dim == time_dim else CHUNK_SPACE_CELLS)
+        for dim, size in zip(da.dims, da.shape)
+    )
+
+
+def build_encoding(ds, codec):
+    """Per-variable encoding for to_netcdf() under a codec setting."""
+    pack, level, shuffle = CODECS[codec]
+    time_dim = time_dim_of(ds)
+    encoding = {}
+    for name, da in ds.data_vars.items():
+        enc = {}
+        if da.ndim >= 2 and time_dim in da.dims:
+            enc['chunksizes'] = chunk_shape(da, time_dim)
+        if level:
+            enc.update({'zlib': True, 'complevel': level, 'shuffle': shuffle})
+        params = None
+        if pack and name in PACKING_TOLERANCE and np.issubdtype(da.dtype, np.floating):
+            params = packing_params(da.values, PACKING_TOLERANCE[name])
+        if params:
+            enc.update({'dtype': 'int16', 'scale_factor': params[0], 'add_offset': params[1], '_FillValue': INT16_FILL})
+        elif np.issubdtype(da.dtype, np.floating):
+            enc.update({'dtype': 'float32', '_FillValue': np.float32(np.nan)})
+        encoding[name] = enc
+    return encoding
+
+
+def write_repacked(ds, path, codec):
+    ds = ds.copy()
+    for da in ds.variables.values():
+        # Drop CDS's own encoding so only ours applies
+        da.encoding = {}
+    ds.attrs[CODEC_ATTR] = codec
+    ds.to_netcdf(path, encoding=build_encoding(ds, codec))
+
+
+def repack_file(path, codec=DEFAULT_CODEC, force=False):
+    """
+    Rewrites one file in place (via a temp file). Returns (path, status,
+    bytes before, bytes after) where status is 'repacked' or 'skipped'.
+    """
+    storage.ensure_hot(path)
+    before = os.path.getsize(path)
+    with xr.open_dataset(path) as ds:
+        if not force and ds.attrs.get(CODEC_ATTR) == codec:
+            return path, 'skipped', before, before
+        ds.load()
+    temp_path = path + ".tmp"
+    write_repacked(ds, temp_path, codec)
+    os.replace(temp_path, path)
+    return path, 'repacked', before, os.path.getsize(path)
+
+
+def source_files(data_dir=DEFAULT_DATA_DIR):
+    """Every downloaded output file in the data directory (monthly/box parts excluded)."""
+    paths = []
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            parsed = parse_output_filename(entry.name)
+            if parsed and not (parsed['month'] or parsed['box']) and entry.is_file():
+                paths.append(entry.path)
+    return sorted(paths)
+
+
+def repack_all(paths, codec=DEFAULT_CODEC, workers=DEFAULT_WORKERS, force=False):
+    """Repacks many files in a process pool. Returns {status: count, 'bytes_before', 'bytes_after'}."""
+    totals = {'repacked': 0, 'skipped': 0, 'failed': 0, 'bytes_before': 0, 'bytes_after': 0}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(repack_file, path, codec, force): path for path in paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                _, status, before, after = future.result()
+            except Exception as e:
+                print(f"  > FAILED {os.path.basename(path)}: {e}")
+                totals['failed'] += 1
+                continue
+            if status == 'repacked':
+                print(f"  > Repacked {os.path.basename(path)}: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB")
+                totals['bytes_before'] += before
+                totals['bytes_after'] += after
+            totals[status] += 1
+    return totals
+
+
+# --- Benchmark ---
+
+def timed_read(path, reader):
+    started = time.perf_counter()
+    with xr.open_dataset(path) as ds:
+        reader(ds)
+    return time.perf_counter() - started
+
+
+def read_all(ds):
+    for da in ds.data_vars.values():
+        da.values
+
+
+def read_point_series(ds):
+    """One grid cell's full time series of every variable (the common consumer read)."""
+    time_dim = time_dim_of(ds)
+    for da in ds.data_vars.values():
+        if time_dim in da.dims and da.ndim >= 3:
+            da.isel({dim: da.sizes[dim] // 2 for dim in da.dims if dim != time_dim}).values
+
+
+def max_errors(original, path):
+    """Largest absolute difference per variable against the original values."""
+    errors = {}
+    with xr.open_dataset(path) as ds:
+        for name, da in original.data_vars.items():
+            if np.issubdtype(da.dtype, np.floating):
+                errors[name] = float(np.nanmax(np.abs(ds[name].values.astype(np.float64) - da.values)))
+    return errors
+
+
+def benchmark(path, codecs=None):
+    """Writes the file with every codec setting and prints size, timings and error."""
+    codecs = codecs or list(CODECS)
+    original_size = os.path.getsize(path)
+    with xr.open_dataset(path) as original:
+        original.load()
+
+    print(f"--- Benchmark: {os.path.basename(path)} ({original_size / 1e6:.1f} MB as downloaded) ---")
+    print(f"{'codec':<14}{'MB':>9}{'ratio':>8}{'write s':>9}{'read all s':>12}{'point s':>9}  max error")
+    results = []
+    temp_dir = tempfile.mkdtemp(prefix="repack_bench_")
+    try:
+        for codec in codecs:
+            out_path = os.path.join(temp_dir, f"{codec}.nc")
+            started = time.perf_counter()
+            write_repacked(original, out_path, codec)
+            write_seconds = time.perf_counter() - started
+            size = os.path.getsize(out_path)
+            read_seconds = timed_read(out_path, read_all)
+            point_seconds = timed_read(out_path, read_point_series)
+            errors = max_errors(original, out_path)
+            worst = ", ".join(f"{name} {error:.2g}" for name, error in errors.items() if error)
+            print(f"{codec:<14}{size / 1e6:>9.1f}{original_size / size:>8.2f}{write_seconds:>9.2f}"
+                  f"{read_seconds:>12.3f}{point_seconds:>9.3f}  {worst or 'lossless'}")
+            results.append({
+                'codec': codec, 'bytes': size, 'write_seconds': write_seconds,
+                'read_seconds': read_seconds, 'point_read_seconds': point_seconds, 'max_errors': errors,
+            })
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Repack downloaded ERA5 NetCDF files for smaller storage and faster reads.")
+    parser.add_argument('files', nargs='*', help="Files to repack (default: every file in era5_data).")
+    parser.add_argument('--codec', choices=list(CODECS), default=DEFAULT_CODEC)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--force', action='store_true', help="Repack even if already written with this codec.")
+    parser.add_argument('--benchmark', action='store_true', help="Compare every codec setting on the given files instead.")
+    args = parser.parse_args()
+
+    paths = args.files or source_files()
+    if not paths:
+        print("No source files found.")
+        sys.exit(0)
+
+    if args.benchmark:
+        for path in paths:
+            benchmark(path)
+        return
+
+    print(f"--- Repacking {len(paths)} files as '{args.codec}' with {args.workers} workers ---")
+    totals = repack_all(paths, codec=args.codec, workers=args.workers, force=args.force)
+    saved = totals['bytes_before'] - totals['bytes_after']
+    print(f"--- Done: {totals['repacked']} repacked, {totals['skipped']} already repacked, {totals['failed']} failed. "
+          f"Saved {saved / 1e9:.2f} GB ---")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,60 +1,39 @@
+import argparse
 import os
 import time
-import re
+import shutil
 import sqlite3
 import zipfile
 from datetime import datetime
-from dotenv import load_dotenv
 import requests  # <-- ADDED for direct downloading
 from selenium import webdriver
 from selenium.webdriver.common.by import By
-from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import NoSuchElementException, TimeoutException
-
-# 1. Load credentials from .env file
-load_dotenv()
-CDS_USERNAME = os.getenv("CDS_USERNAME")
-CDS_PASSWORD = os.getenv("CDS_PASSWORD")
-DB_NAME = "requests.db"
-output_dir = "era5_data"
+from selenium.common.exceptions import NoSuchElementException
+import browser
+from accounts import load_accounts, validate_accounts
+from config import DB_NAME, output_dir
+from database import setup_database
+from transfers import DiskBudget, BandwidthLimiter, run_download_jobs
+import profiling
+
+# Credentials come from .env (loaded by config.py)
+accounts = load_accounts()
 # Set full path for download directory
 DOWNLOAD_DIR = os.path.join(os.getcwd(), output_dir)
+# Concurrent downloads, shared bandwidth cap (MB/s, 0 = unlimited) and disk
+# space kept free for everything else on the box
+MAX_PARALLEL_DOWNLOADS = int(os.getenv("MAX_PARALLEL_DOWNLOADS", "2"))
+DOWNLOAD_BANDWIDTH_MBPS = float(os.getenv("DOWNLOAD_BANDWIDTH_MBPS", "0"))
+DISK_HEADROOM_GB = float(os.getenv("DISK_HEADROOM_GB", "1"))
 
-if not CDS_USERNAME or not CDS_PASSWORD:
-    print("Error: CDS_USERNAME or CDS_PASSWORD not found in .env file.")
-    print("Please create a .env file with your credentials.")
-    exit()
-
-def setup_database():
-    """Creates the database table if it doesn't exist."""
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    # UPDATED TABLE to include 'download' column
-    c.execute("""
-    CREATE TABLE IF NOT EXISTS requests (
-        request_id TEXT PRIMARY KEY,
-        state_abbr TEXT NOT NULL,
-        year TEXT NOT NULL,
-        output_filename TEXT NOT NULL UNIQUE,
-        status TEXT NOT NULL,
-        location TEXT,
-        content_length INTEGER,
-        download BOOLEAN DEFAULT 0,
-        created_at TIMESTAMP NOT NULL,
-        updated_at TIMESTAMP NOT NULL
-    )
-    """)
-    conn.commit()
-    conn.close()
+# Shared by every download thread of this process
+limiter = BandwidthLimiter(int(DOWNLOAD_BANDWIDTH_MBPS * 1024 * 1024))
 
 # --- Helper function to handle unzip and rename ---
-def process_downloaded_file(zip_path, target_nc_filename):
+def process_downloaded_file(zip_path, target_nc_filename, output_dir=DOWNLOAD_DIR):
     """
-    Unzips the downloaded file(s), renames them logically, and cleans up.
+    Unzips the downloaded file(s) into output_dir, renames them logically, and cleans up.
     Handles single files (data.nc) and multiple files (instant.nc, accum.nc).
     """
     print(f"  > Unzipping {os.path.basename(zip_path)}...")
@@ -62,6 +41,11 @@ def process_downloaded_file(zip_path, target_nc_filename):
     # Get the base filename without the .nc extension
     # e.g., "ERA5_hourly_multivariable_AL_2019_Jan-Mar"
     base_target_name = target_nc_filename.replace(".nc", "")
+
+    # Extract into a directory of our own: parallel downloads all contain
+    # files with the same names (data_stream-oper_stepType-instant.nc, ...)
+    extract_dir = zip_path[:-len(".zip")] + "_extract"
+    os.makedirs(extract_dir, exist_ok=True)
     
     with zipfile.ZipFile(zip_path, 'r') as zip_ref:
         zip_contents = zip_ref.namelist()
@@ -90,11 +74,11 @@ def process_downloaded_file(zip_path, target_nc_filename):
                     name_part = extracted_file_name.replace(".nc", "")
                     final_nc_filename = f"{base_target_name}_{name_part}.nc"
             
-            final_nc_path = os.path.join(DOWNLOAD_DIR, final_nc_filename)
+            final_nc_path = os.path.join(output_dir, final_nc_filename)
             
             # Extract the file
-            zip_ref.extract(extracted_file_name, path=DOWNLOAD_DIR)
-            extracted_file_path = os.path.join(DOWNLOAD_DIR, extracted_file_name)
+            zip_ref.extract(extracted_file_name, path=extract_dir)
+            extracted_file_path = os.path.join(extract_dir, extracted_file_name)
             
             # Rename the extracted file
             if os.path.exists(final_nc_path):
@@ -105,13 +89,16 @@ def process_downloaded_file(zip_path, target_nc_filename):
             print(f"  > Renamed {extracted_file_name} to {final_nc_filename}")
 
     os.remove(zip_path)
+    shutil.rmtree(extract_dir, ignore_errors=True)
     print(f"  > Removed temporary {os.path.basename(zip_path)}")
 
 # --- Helper function to download file with requests ---
-def download_file_with_session(url, target_zip_path, driver_cookies):
+def download_file_with_session(url, target_zip_path, driver_cookies, limiter=None, reservation=None):
     """
     Downloads a file from a URL using a requests session
     and the browser's login cookies.
+    Writes to a .part file first, throttled by the shared bandwidth limiter,
+    and counts the bytes written against the job's disk reservation.
     """
     print(f"  > Downloading from {url[:50]}...")
     
@@ -127,141 +114,186 @@ def download_file_with_session(url, target_zip_path, driver_cookies):
         r.raise_for_status() # Will stop if we get a 401/403/404
         
         # 4. Save the file to disk chunk by chunk
-        with open(target_zip_path, 'wb') as f:
-            for chunk in r.iter_content(chunk_size=8192):
+        part_path = target_zip_path + ".part"
+        with open(part_path, 'wb') as f:
+            for chunk in r.iter_content(chunk_size=65536):
+                if limiter:
+                    limiter.consume(len(chunk))
                 f.write(chunk)
+                if reservation:
+                    reservation.written += len(chunk)
+        os.replace(part_path, target_zip_path)
                 
     print(f"  > Saved to {os.path.basename(target_zip_path)}")
 
 
-# 2. Set up the Chrome driver automatically
-print("Setting up Chrome driver...")
-# We no longer need to set a download directory for Chrome
-service = ChromeService(ChromeDriverManager().install())
-driver = webdriver.Chrome(service=service)
+def download_job(job, reservation):
+    """Downloads and unzips one completed request (runs in a worker thread)."""
+    print(f"Downloading: {job['output_filename']} (ID: {job['request_id']})")
 
-# Ensure the output directory exists
-os.makedirs(DOWNLOAD_DIR, exist_ok=True)
-setup_database()
+    # Use the request_id to make a unique temp zip name
+    temp_zip_path = os.path.join(DOWNLOAD_DIR, f"{job['request_id']}.zip")
 
-# Use a try...finally block to make sure the browser always closes
-try:
-    # Action 1: Go to the website
-    print("Opening cds.climate.copernicus.eu...")
-    driver.get("https://cds.climate.copernicus.eu/")
-
-    # Action 2: Handle Cookie Banner
-    try:
-        print("Waiting for cookie banner...")
-        WebDriverWait(driver, 5).until(
-            EC.element_to_be_clickable((By.XPATH, "//button[text()='Deny all']"))
-        ).click()
-        print("Clicked 'Deny all' on cookie banner.")
-    except Exception as e:
-        print("Cookie banner not found or 'Deny all' not clickable. Continuing...")
-
-    # Action 3: Click "Login - Register"
-    print("Waiting for Login button...")
-    WebDriverWait(driver, 10).until(
-        EC.element_to_be_clickable((By.XPATH, "//button[.//p[text()='Login - Register']]"))
-    ).click()
-
-    # Action 4: Input Username and Password
-    print("Waiting for login form...")
-    username_field = WebDriverWait(driver, 10).until(
-        EC.visibility_of_element_located((By.ID, "username"))
-    )
-    
-    print("Entering credentials...")
-    username_field.send_keys(CDS_USERNAME)
-    driver.find_element(By.ID, "password").send_keys(CDS_PASSWORD)
-
-    # Action 5: Hit Enter
-    print("Logging in...")
-    driver.find_element(By.ID, "password").send_keys(Keys.RETURN)
-
-    # Action 6: Click "Your requests"
-    print("Waiting for 'Your requests' link...")
-    WebDriverWait(driver, 10).until(
-        EC.element_to_be_clickable((By.LINK_TEXT, "Your requests"))
-    ).click()
+    # Download the file using requests (+ session cookies, if any)
+    with profiling.span('download'):
+        download_file_with_session(job['url'], temp_zip_path, job['cookies'], limiter, reservation)
     
-    # --- ACTION 6.5: Get cookies *after* login is successful ---
-    WebDriverWait(driver, 10).until(
-        EC.visibility_of_element_located((By.CSS_SELECTOR, "div[data-requid]"))
-    )
+    # Unzip, rename, and clean up
+    with profiling.span('extract'):
+        process_downloaded_file(temp_zip_path, job['output_filename'])
+    return True
+
+def mark_downloaded(conn, job, success):
+    """Records a finished download in the DB (runs on the main thread)."""
+    if not success:
+        return
+    now = datetime.now()
+    conn.execute("UPDATE requests SET download = 1, downloaded_at = ?, updated_at = ? WHERE request_id = ?", (now, now, job['request_id']))
+    conn.commit()
+    print(f"  > Successfully processed and marked '{job['output_filename']}' as downloaded in DB.")
+
+def collect_via_browser(driver, account, conn):
+    """Collects download jobs for the account's completed requests from its requests page."""
+    browser.login(driver, account)
+
+    # --- Get cookies *after* login is successful ---
     driver_cookies = driver.get_cookies()
-    print("Login successful, session cookies captured.")
+    print(f"[{account.name}] Login successful, session cookies captured.")
 
-    # Action 7: Find and Download Completed Files
+    # Find Completed Files
     print("Checking for files to download...")
-    
-    conn = sqlite3.connect(DB_NAME)
     c = conn.cursor()
     
     request_rows = driver.find_elements(By.CSS_SELECTOR, "div[data-requid]")
     print(f"Found {len(request_rows)} requests on page.")
     
-    download_count = 0
+    jobs = []
     
     for row in request_rows:
         request_id = row.get_attribute("data-requid")
         
-        c.execute("SELECT output_filename, status, download FROM requests WHERE request_id = ?", (request_id,))
+        c.execute("SELECT output_filename, status, download, content_length FROM requests WHERE request_id = ? AND account = ?", (request_id, account.name))
         db_row = c.fetchone()
         
         if not db_row:
             continue
             
-        output_filename, status, downloaded = db_row
+        output_filename, status, downloaded, content_length = db_row
         
         if status == 'completed' and not downloaded:
             print(f"Found pending download: {output_filename} (ID: {request_id})")
-            
             try:
-                # 1. Find the download link element
-                link_element = row.find_element(By.LINK_TEXT, "Download")
-                
-                # 2. Get the URL from the 'href' attribute
-                download_url = link_element.get_attribute('href')
-                
-                # 3. Define where to save the .zip file
-                # We'll use the request_id to make a unique temp zip name
-                temp_zip_path = os.path.join(DOWNLOAD_DIR, f"{request_id}.zip")
-
-                # 4. Download the file using requests + session cookies
-                download_file_with_session(download_url, temp_zip_path, driver_cookies)
-                
-                # 5. Unzip, rename, and clean up
-                process_downloaded_file(temp_zip_path, output_filename)
-                
-                # 6. Update database
-                c.execute("UPDATE requests SET download = 1, updated_at = ? WHERE request_id = ?", (datetime.now(), request_id))
-                conn.commit()
-                print(f"  > Successfully processed and marked '{output_filename}' as downloaded in DB.")
-                download_count += 1
-                
-            except Exception as e:
-                print(f"  > FAILED to download {output_filename}. Error: {e}")
+                download_url = row.find_element(By.LINK_TEXT, "Download").get_attribute('href')
+            except NoSuchElementException:
+                print(f"  > FAILED to find Download link for {output_filename}.")
+                continue
+            jobs.append({
+                'request_id': request_id, 'output_filename': output_filename,
+                'url': download_url, 'cookies': driver_cookies, 'content_length': content_length,
+            })
 
         elif status == 'completed' and downloaded:
              print(f"Already downloaded: {output_filename}")
-            
-    conn.close()
-    print(f"\nDownload run complete. {download_count} new files processed.")
 
-    print("\nBrowser will close in 10 seconds.")
-    time.sleep(10)
+    return jobs
+
+def collect_via_location(account, conn):
+    """Collects download jobs for the account's completed requests from the locations stored in the DB."""
+    c = conn.cursor()
+    c.execute(
+        "SELECT request_id, output_filename, location, content_length FROM requests "
+        "WHERE status = 'completed' AND download = 0 AND location IS NOT NULL AND account = ?",
+        (account.name,)
+    )
+    pending = c.fetchall()
+    print(f"[{account.name}] {len(pending)} completed requests to download.")
+
+    return [
+        {
+            'request_id': request_id, 'output_filename': output_filename,
+            'url': location, 'cookies': [], 'content_length': content_length,
+        }
+        for request_id, output_filename, location, content_length in pending
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Downloads completed CDS requests into era5_data.")
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    if args.profile:
+        report_path = profiling.enable('retrieve', sample=args.profile_sample, targets=[
+            (WebDriverWait, 'until', 'selenium.wait'),
+            (webdriver.Chrome, 'get', 'selenium.get'),
+            # Time the downloads spend held back by DOWNLOAD_BANDWIDTH_MBPS
+            (BandwidthLimiter, 'consume', 'download.throttle'),
+        ])
+        print(f"Profiling enabled; report will be written to {report_path}")
+
+    problems = validate_accounts(accounts)
+    if problems:
+        for problem in problems:
+            print(f"Error: {problem}")
+        print("Please check the credentials in your .env file.")
+        exit()
+
+    # Ensure the output directory exists
+    os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+    setup_database()
 
-except Exception as e:
-    print(f"\nAn error occurred: {e}")
-    print("Saving screenshot as 'error.png'")
-    driver.save_screenshot("error.png")
+    drivers = []
+    disk = DiskBudget(DOWNLOAD_DIR, headroom_bytes=int(DISK_HEADROOM_GB * 1024 * 1024 * 1024))
 
-finally:
-    # Clean up and close the browser
-    print("Closing browser.")
-    driver.quit()
+    # Use a try...finally block to make sure the browsers always close
+    try:
+        conn = sqlite3.connect(DB_NAME)
+        jobs = []
+
+        for account in accounts:
+            if account.uses_browser:
+                # Set up the Chrome driver automatically
+                print(f"[{account.name}] Setting up Chrome driver...")
+                driver = browser.start_driver()
+                drivers.append(driver)
+                try:
+                    with profiling.span('collect'):
+                        jobs.extend(collect_via_browser(driver, account, conn))
+                except Exception as e:
+                    print(f"\n[{account.name}] An error occurred: {e}")
+                    print(f"Saving screenshot as 'error_{account.name}.png'")
+                    driver.save_screenshot(f"error_{account.name}.png")
+            else:
+                with profiling.span('collect'):
+                    jobs.extend(collect_via_location(account, conn))
+
+        # Largest first, so big jobs are not starved of disk by a stream of small ones
+        jobs.sort(key=lambda job: job['content_length'] or 0, reverse=True)
+        print(f"\n{len(jobs)} files to download with up to {MAX_PARALLEL_DOWNLOADS} parallel transfers.")
+
+        results = []
+        def on_done(job, success):
+            mark_downloaded(conn, job, success)
+            results.append(success)
+
+        with profiling.span('transfers'):
+            deferred = run_download_jobs(jobs, download_job, disk, max_workers=MAX_PARALLEL_DOWNLOADS, on_done=on_done)
+
+        conn.close()
+        print(f"\nDownload run complete. {sum(results)} new files processed, {len(deferred)} deferred.")
+
+        if drivers:
+            print("\nBrowser will close in 10 seconds.")
+            time.sleep(10)
+
+    except Exception as e:
+        print(f"\nAn error occurred: {e}")
 
+    finally:
+        # Clean up and close the browsers
+        for driver in drivers:
+            print("Closing browser.")
+            driver.quit()
 
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+import os
+from datetime import datetime, timedelta
+
+from naming import build_output_filename, chunk_months, months_for_filename, parse_output_filename, STREAM_SUFFIXES
+from regions import area_cover
+
+# --- Retry Configuration ---
+# A failed request is resubmitted after RETRY_BASE_SECONDS, doubling on every
+# further failure up to RETRY_MAX_SECONDS. Once a multi-month request has
+# failed SPLIT_AFTER_ATTEMPTS times it is split into one request per month.
+RETRY_BASE_SECONDS = 3600       # 1 hour
+RETRY_MAX_SECONDS = 24 * 3600   # 1 day
+SPLIT_AFTER_ATTEMPTS = 3
+
+# Status given to a parent row whose work has been handed to sub-requests.
+SPLIT_STATUS = 'split'
+# Prefix for the request_id of split parents, so the status scrape (which
+# still sees the old rejected request on the CDS page) no longer matches them.
+SPLIT_ID_PREFIX = 'split:'
+# Synthetic request_id prefix of the parent of a multi-box state cover, which
+# is never submitted to CDS itself.
+COVER_ID_PREFIX = SPLIT_ID_PREFIX + 'cover:'
+
+
+def retry_delay_seconds(attempts):
+    """Exponential backoff delay after the given number of attempts."""
+    return min(RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0), RETRY_MAX_SECONDS)
+
+
+def split_children(state_abbr, year, parent_filename, bounding_boxes=None):
+    """
+    The sub-requests a split parent is made of, as (filename, months, box):
+    one per cover box for a whole chunk of a multi-box state (regions.py),
+    otherwise one per month (keeping the parent's box, if any).
+    """
+    parsed = parse_output_filename(parent_filename)
+    if not parsed:
+        return []
+    cover = area_cover(state_abbr, bounding_boxes or {})
+    if cover and not parsed['box'] and not parsed['month']:
+        months = chunk_months(parsed['label'])
+        return [
+            (build_output_filename(state_abbr, year, parsed['label'], box=box), months, box)
+            for box in cover
+        ]
+    return [
+        (build_output_filename(state_abbr, year, parsed['label'], month, parsed['box']), [month], parsed['box'])
+        for month in months_for_filename(parent_filename)
+    ]
+
+
+def schedule_failed_requests(conn, logger, now=None, bounding_boxes=None):
+    """
+    Looks at newly failed requests and decides what happens to them:
+    either a retry time is stamped on the row, or, if the request has failed
+    too often and can be split (per month, or per cover box), it is marked
+    as split.
+    """
+    now = now or datetime.now()
+    c = conn.cursor()
+    c.execute(
+        "SELECT request_id, state_abbr, year, output_filename, attempts FROM requests "
+        "WHERE status = 'failed' AND next_retry_at IS NULL"
+    )
+    rows = c.fetchall()
+
+    for request_id, state_abbr, year, filename, attempts in rows:
+        attempts = attempts or 1
+        children = split_children(state_abbr, year, filename, bounding_boxes)
+
+        if attempts >= SPLIT_AFTER_ATTEMPTS and len(children) > 1:
+            logger.warning(f"{filename} failed {attempts} times. Splitting into {len(children)} requests.")
+            c.execute(
+                "UPDATE requests SET request_id = ?, status = ?, parts = ?, updated_at = ? WHERE request_id = ?",
+                (SPLIT_ID_PREFIX + request_id, SPLIT_STATUS, len(children), now, request_id)
+            )
+        else:
+            delay = retry_delay_seconds(attempts)
+            next_retry_at = now + timedelta(seconds=delay)
+            logger.info(f"{filename} failed (attempt {attempts}). Retrying after {next_retry_at:%Y-%m-%d %H:%M}.")
+            c.execute(
+                "UPDATE requests SET next_retry_at = ? WHERE request_id = ?",
+                (next_retry_at, request_id)
+            )
+
+    conn.commit()
+    return len(rows)
+
+
+def get_due_retries(conn, now=None):
+    """Returns submission jobs for failed requests whose backoff has expired."""
+    now = now or datetime.now()
+    c = conn.cursor()
+    c.execute(
+        "SELECT request_id, state_abbr, year, output_filename, parent_filename FROM requests "
+        "WHERE status = 'failed' AND next_retry_at IS NOT NULL AND next_retry_at <= ? "
+        "ORDER BY next_retry_at",
+        (now,)
+    )
+    return [
+        {
+            'state_abbr': state_abbr,
+            'year': year,
+            'months': months_for_filename(filename),
+            'box': (parse_output_filename(filename) or {}).get('box'),
+            'output_filename': filename,
+            'parent_filename': parent_filename,
+            'retry_of': request_id,
+        }
+        for request_id, state_abbr, year, filename, parent_filename in c.fetchall()
+    ]
+
+
+def get_split_children(conn, db_filenames, bounding_boxes=None):
+    """Returns submission jobs for the parts (months or cover boxes) of split requests not yet submitted."""
+    c = conn.cursor()
+    c.execute("SELECT state_abbr, year, output_filename FROM requests WHERE status = ?", (SPLIT_STATUS,))
+
+    jobs = []
+    for state_abbr, year, parent_filename in c.fetchall():
+        for child_filename, months, box in split_children(state_abbr, year, parent_filename, bounding_boxes):
+            if child_filename in db_filenames:
+                continue
+            jobs.append({
+                'state_abbr': state_abbr,
+                'year': year,
+                'months': months,
+                'box': box,
+                'output_filename': child_filename,
+                'parent_filename': parent_filename,
+                'retry_of': None,
+            })
+    return jobs
+
+
+def record_cover_parent(conn, job, now=None):
+    """
+    Creates the parent row of a multi-box chunk when its first box is
+    submitted. The parent is born split: it is assembled from its parts.
+    """
+    now = now or datetime.now()
+    conn.execute(
+        "INSERT OR IGNORE INTO requests (request_id, state_abbr, year, output_filename, status, parts, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (COVER_ID_PREFIX + job['parent_filename'], job['state_abbr'], job['year'], job['parent_filename'],
+         SPLIT_STATUS, job['cover_parts'], now, now)
+    )
+
+
+def record_resubmission(conn, old_request_id, new_request_id, status, now=None, account=None):
+    """
+    Points an existing row at its new CDS request and counts the attempt.
+    The retry may run under a different account than the original request.
+    """
+    now = now or datetime.now()
+    conn.execute(
+        """
+        UPDATE requests
+        SET request_id = ?, status = ?, attempts = COALESCE(attempts, 1) + 1,
+            next_retry_at = NULL, location = NULL, content_length = NULL, download = 0,
+            started_at = NULL, finished_at = NULL, created_at = ?,
+            account = COALESCE(?, account), updated_at = ?
+        WHERE request_id = ?
+        """,
+        (new_request_id, status, now, account, now, old_request_id)
+    )
+    conn.commit()
+
+
+def merge_netcdf_parts(part_paths, target_path, spatial=False):
+    """
+    Combines NetCDF parts into a single file: monthly parts are concatenated
+    along time, cover boxes (spatial=True) are merged onto the union of their
+    grids. Longitude 180 is written as -180 so boxes either side of the
+    antimeridian share that column; columns between boxes are not stored.
+    """
+    # Imported here so that the manager loop does not need xarray unless a
+    # split request actually has to be assembled.
+    import xarray as xr
+
+    datasets = [xr.open_dataset(path) for path in part_paths]
+    try:
+        time_dim = 'valid_time' if 'valid_time' in datasets[0].dims else 'time'
+        if spatial:
+            parts = []
+            for ds in datasets:
+                if 'longitude' in ds.coords:
+                    ds = ds.assign_coords(longitude=ds['longitude'].where(ds['longitude'] < 180, -180.0))
+                parts.append(ds)
+            merged = parts[0]
+            for ds in parts[1:]:
+                merged = merged.combine_first(ds)
+            merged = merged.sortby('latitude', ascending=False).sortby('longitude')
+        else:
+            merged = xr.concat(datasets, dim=time_dim).sortby(time_dim)
+        temp_path = target_path + ".tmp"
+        merged.to_netcdf(temp_path)
+    finally:
+        for ds in datasets:
+            ds.close()
+    os.replace(temp_path, target_path)
+
+
+def assemble_split_requests(conn, output_dir, logger):
+    """
+    Merges the downloaded parts (months or cover boxes) of every split request
+    back into the original output filename(s) and marks the parent as downloaded.
+    Returns the number of parents assembled.
+    """
+    c = conn.cursor()
+    c.execute(
+        """
+        SELECT p.request_id, p.output_filename
+        FROM requests p
+        WHERE p.status = ?
+          AND p.parts = (SELECT COUNT(*) FROM requests ch
+                         WHERE ch.parent_filename = p.output_filename AND ch.download = 1)
+        """,
+        (SPLIT_STATUS,)
+    )
+    parents = c.fetchall()
+
+    assembled = 0
+    for parent_id, parent_filename in parents:
+        c.execute("SELECT output_filename FROM requests WHERE parent_filename = ? ORDER BY output_filename", (parent_filename,))
+        children = [row[0] for row in c.fetchall()]
+        base_target = parent_filename[:-len(".nc")]
+        # Box parts of a state cover are merged in space, monthly parts in time
+        spatial = any((parse_output_filename(child) or {}).get('box') for child in children) and \
+            not (parse_output_filename(parent_filename) or {}).get('box')
+
+        try:
+            merged_paths = []
+            for suffix in STREAM_SUFFIXES:
+                part_paths = [
+                    os.path.join(output_dir, f"{child[:-len('.nc')]}{suffix}.nc") for child in children
+                ]
+                part_paths = [p for p in part_paths if os.path.exists(p)]
+                if not part_paths:
+                    continue
+                if len(part_paths) != len(children):
+                    raise Exception(f"Only {len(part_paths)} of {len(children)} parts found for stream '{suffix or 'single'}'")
+
+                target_path = os.path.join(output_dir, f"{base_target}{suffix}.nc")
+                logger.info(f"Merging {len(part_paths)} parts into {os.path.basename(target_path)}...")
+                merge_netcdf_parts(part_paths, target_path, spatial=spatial)
+                merged_paths.extend(part_paths)
+
+            if not merged_paths:
+                raise Exception("No part files found on disk")
+
+            for path in merged_paths:
+                os.remove(path)
+
+            now = datetime.now()
+            c.execute(
+                "UPDATE requests SET status = 'completed', download = 1, downloaded_at = ?, updated_at = ? WHERE request_id = ?",
+                (now, now, parent_id)
+            )
+            conn.commit()
+            assembled += 1
+            logger.info(f"  > Assembled {parent_filename} from {len(children)} parts.")
+        except Exception as e:
+            logger.error(f"Failed to assemble {parent_filename}: {e}")
+
+    return assembled
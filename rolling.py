@@ -0,0 +1,350 @@
+"""
+Rolling near-real-time mode: keeps the archive extended past the configured
+years up to the newest month CDS has published, one month at a time.
+
+    ROLLING_MODE=1 python manager.py     # the manager also submits the tail
+    python rolling.py                    # what the tail and replacements look like now
+    python rolling.py --rebuild          # rebuild the rolling chunk files by hand
+
+ERA5 is published about ERA5T_LAG_DAYS behind real time as preliminary
+ERA5T data (expver 0005), which final ERA5 (expver 0001) replaces some two
+to three months later. Each cycle, for every state:
+
+  * the months from ROLLING_START up to the newest complete month past the
+    publication lag that have no row yet are submitted as monthly parts
+    (`..._m<MM>.nc`) of their three-month chunk. The chunk row gets status
+    'rolling' and counts its parts, like a split request.
+  * downloaded parts stay in era5_data next to the chunk file, which is
+    rebuilt from them whenever one changes. Rollups and the archive see a
+    chunk file that grows month by month.
+  * a part whose file holds ERA5T data is marked preliminary and fetched
+    again once final data should be out (FINAL_LAG_DAYS after the month).
+    If it is still preliminary, it is checked again after FINAL_RECHECK_DAYS.
+  * once every part is downloaded and final, the chunk is assembled one
+    last time, the parts are removed and the chunk becomes a normal
+    completed, downloaded row (so upload.py publishes it).
+
+A daily run therefore costs the new month's requests, when one has just
+been published, plus the replacements that fell due, instead of a sweep
+over the whole plan.
+"""
+import argparse
+import calendar
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import retry
+from config import DB_NAME, bounding_boxes, output_dir, states_to_download, years_to_download
+from naming import STREAM_SUFFIXES, build_output_filename, parse_output_filename, three_month_chunks
+from regions import area_cover
+
+ROLLING_ENABLED = os.getenv("ROLLING_MODE", "0") == "1"
+# First month of the tail, 'YYYY-MM'; by default the month after the configured years
+ROLLING_START = os.getenv("ROLLING_START", f"{int(max(years_to_download)) + 1}-01")
+ERA5T_LAG_DAYS = int(os.getenv("ERA5T_LAG_DAYS", "5"))
+FINAL_LAG_DAYS = int(os.getenv("FINAL_LAG_DAYS", "90"))
+FINAL_RECHECK_DAYS = int(os.getenv("FINAL_RECHECK_DAYS", "7"))
+
+ROLLING_STATUS = 'rolling'
+# Synthetic request_id prefix of a rolling chunk row, which is never submitted itself
+ROLLING_ID_PREFIX = 'rolling:'
+# expver of preliminary ERA5T data in CDS files (final ERA5 is 0001)
+ERA5T_EXPVER = '0005'
+
+
+# --- The tail ---
+
+def parse_month(text):
+    year, month = text.split('-')
+    return int(year), int(month)
+
+
+def month_end(year, month):
+    """The last moment of a month, as a datetime."""
+    return datetime(year, month, calendar.monthrange(year, month)[1], 23, 59, 59)
+
+
+def newest_available_month(now=None, lag_days=ERA5T_LAG_DAYS):
+    """(year, month) of the newest month CDS has published in full, given the publication lag."""
+    published_until = (now or datetime.now()) - timedelta(days=lag_days)
+    year, month = published_until.year, published_until.month
+    if published_until < month_end(year, month):
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return year, month
+
+
+def tail_months(start, newest):
+    """Every (year, month) from start to newest, inclusive."""
+    year, month = start
+    months = []
+    while (year, month) <= newest:
+        months.append((year, month))
+        year, month = (year, month + 1) if month < 12 else (year + 1, 1)
+    return months
+
+
+def chunk_label(month):
+    for chunk in three_month_chunks:
+        if f"{month:02d}" in chunk['months']:
+            return chunk['label']
+
+
+def tail_parts(state_abbr, year, month):
+    """
+    (part filename, chunk filename, box, parts in the chunk) for one month of
+    a state: one part per cover box for multi-box states (regions.py).
+    """
+    label = chunk_label(month)
+    chunk_filename = build_output_filename(state_abbr, str(year), label)
+    boxes = list(area_cover(state_abbr, bounding_boxes) or [None])
+    return [
+        (build_output_filename(state_abbr, str(year), label, f"{month:02d}", box), chunk_filename, box, 3 * len(boxes))
+        for box in boxes
+    ]
+
+
+def pending_jobs(conn, db_filenames, now=None, states=None):
+    """
+    Submission jobs for the months of the tail that have no row yet. Chunks
+    that already have a row of their own (from the configured plan, or a
+    finished rolling chunk) are left alone.
+    """
+    months = tail_months(parse_month(ROLLING_START), newest_available_month(now))
+    # Years of the configured plan are fetched as whole chunks by the manager
+    planned_years = {str(year) for year in years_to_download}
+    statuses = dict(conn.execute("SELECT output_filename, status FROM requests WHERE parent_filename IS NULL"))
+    jobs = []
+    for state_abbr in states or states_to_download:
+        if state_abbr not in bounding_boxes:
+            continue
+        for year, month in months:
+            if str(year) in planned_years:
+                continue
+            for part_filename, chunk_filename, box, parts in tail_parts(state_abbr, year, month):
+                if part_filename in db_filenames:
+                    continue
+                if statuses.get(chunk_filename, ROLLING_STATUS) != ROLLING_STATUS:
+                    continue
+                jobs.append({
+                    'state_abbr': state_abbr,
+                    'year': str(year),
+                    'months': [f"{month:02d}"],
+                    'box': box,
+                    'output_filename': part_filename,
+                    'parent_filename': chunk_filename,
+                    'rolling_parts': parts,
+                    'retry_of': None,
+                })
+    return jobs
+
+
+def record_rolling_parent(conn, job, now=None):
+    """Creates the row of a rolling chunk when its first part is submitted."""
+    now = now or datetime.now()
+    conn.execute(
+        "INSERT OR IGNORE INTO requests (request_id, state_abbr, year, output_filename, status, parts, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        (ROLLING_ID_PREFIX + job['parent_filename'], job['state_abbr'], job['year'], job['parent_filename'],
+         ROLLING_STATUS, job['rolling_parts'], now, now)
+    )
+
+
+# --- ERA5T replacement ---
+
+def due_replacements(conn, now=None):
+    """
+    Resubmission jobs for downloaded preliminary parts whose final data
+    should be out by now. `refetch` keeps the manager from adopting the
+    earlier (preliminary) request for the same payload.
+    """
+    now = now or datetime.now()
+    rows = conn.execute(
+        "SELECT request_id, state_abbr, year, output_filename, parent_filename FROM requests "
+        "WHERE preliminary = 1 AND download = 1 AND status = 'completed' AND final_check_at <= ? "
+        "ORDER BY final_check_at",
+        (now,)
+    ).fetchall()
+    jobs = []
+    for request_id, state_abbr, year, filename, parent_filename in rows:
+        parsed = parse_output_filename(filename) or {}
+        jobs.append({
+            'state_abbr': state_abbr,
+            'year': year,
+            'months': [parsed.get('month')],
+            'box': parsed.get('box'),
+            'output_filename': filename,
+            'parent_filename': parent_filename,
+            'retry_of': request_id,
+            'refetch': True,
+        })
+    return jobs
+
+
+def is_preliminary(path, year, month, now=None):
+    """
+    True if the file holds ERA5T data. Files without an expver coordinate
+    count as preliminary while the month is younger than FINAL_LAG_DAYS.
+    """
+    import xarray as xr
+
+    with xr.open_dataset(path) as ds:
+        if 'expver' in ds.variables:
+            return any(str(value).strip() in (ERA5T_EXPVER, ERA5T_EXPVER.lstrip('0')) for value in ds['expver'].values.ravel())
+    return (now or datetime.now()) < month_end(year, month) + timedelta(days=FINAL_LAG_DAYS)
+
+
+# --- Rebuilding the rolling chunks ---
+
+def part_paths(data_dir, filename):
+    """{stream suffix: path} of a part's files on disk."""
+    base = filename[:-len(".nc")]
+    paths = {suffix: os.path.join(data_dir, f"{base}{suffix}.nc") for suffix in STREAM_SUFFIXES}
+    return {suffix: path for suffix, path in paths.items() if os.path.exists(path)}
+
+
+def rebuild_chunk(conn, parent_filename, parts, data_dir, logger, now=None):
+    """
+    Brings one rolling chunk up to date with its downloaded parts: classifies
+    new part files as preliminary or final, reassembles the chunk file if a
+    part changed and, once every part is in and final, finishes the chunk.
+    Returns 'rebuilt', 'finished' or None (nothing changed).
+    """
+    now = now or datetime.now()
+    children = conn.execute(
+        "SELECT request_id, output_filename, year, download FROM requests "
+        "WHERE parent_filename = ? ORDER BY output_filename",
+        (parent_filename,)
+    ).fetchall()
+    if not children:
+        return None
+
+    base_target = parent_filename[:-len(".nc")]
+    targets = {suffix: os.path.join(data_dir, f"{base_target}{suffix}.nc") for suffix in STREAM_SUFFIXES}
+    built_at = min((os.path.getmtime(path) for path in targets.values() if os.path.exists(path)), default=0)
+
+    files = {}
+    changed = False
+    for request_id, filename, year, downloaded in children:
+        # A part being refetched keeps its preliminary file in the chunk until the new one is in
+        paths = part_paths(data_dir, filename)
+        if not paths:
+            continue
+        files[filename] = paths
+        if not downloaded or max(os.path.getmtime(path) for path in paths.values()) <= built_at:
+            continue
+        # Downloaded since the last build: new, or refetched for final data
+        changed = True
+        month = int(parse_output_filename(filename)['month'])
+        preliminary = is_preliminary(next(iter(paths.values())), int(year), month, now)
+        final_check_at = max(month_end(int(year), month) + timedelta(days=FINAL_LAG_DAYS),
+                             now + timedelta(days=FINAL_RECHECK_DAYS)) if preliminary else None
+        conn.execute(
+            "UPDATE requests SET preliminary = ?, final_check_at = ?, updated_at = ? WHERE request_id = ?",
+            (int(preliminary), final_check_at, now, request_id)
+        )
+        logger.info(f"  > {filename}: {'preliminary ERA5T' if preliminary else 'final ERA5'} data.")
+    conn.commit()
+
+    if changed and files:
+        spatial = any((parse_output_filename(name) or {}).get('box') for name in files)
+        for suffix, target in targets.items():
+            sources = [paths[suffix] for paths in files.values() if suffix in paths]
+            if sources:
+                retry.merge_netcdf_parts(sources, target, spatial=spatial)
+        logger.info(f"Rebuilt {parent_filename} from {len(files)} of {parts} parts.")
+
+    final = conn.execute(
+        "SELECT COUNT(*) FROM requests WHERE parent_filename = ? AND download = 1 AND COALESCE(preliminary, 0) = 0",
+        (parent_filename,)
+    ).fetchone()[0]
+    if final < parts or len(files) < parts:
+        return 'rebuilt' if changed else None
+
+    # Every part is in and final: the chunk file is complete, the parts can go
+    for paths in files.values():
+        for path in paths.values():
+            os.remove(path)
+    conn.execute(
+        "UPDATE requests SET status = 'completed', download = 1, downloaded_at = ?, updated_at = ? WHERE output_filename = ?",
+        (now, now, parent_filename)
+    )
+    conn.commit()
+    logger.info(f"  > {parent_filename} is complete with final data.")
+    return 'finished'
+
+
+def update_rolling_chunks(conn, data_dir, logger, now=None):
+    """Rebuilds every rolling chunk that has new parts. Returns {'rebuilt', 'finished', 'failed'}."""
+    counts = {'rebuilt': 0, 'finished': 0, 'failed': 0}
+    parents = conn.execute(
+        "SELECT output_filename, parts FROM requests WHERE status = ?", (ROLLING_STATUS,)
+    ).fetchall()
+    for parent_filename, parts in parents:
+        try:
+            result = rebuild_chunk(conn, parent_filename, parts, data_dir, logger, now)
+        except Exception as e:
+            logger.error(f"Failed to rebuild {parent_filename}: {e}")
+            counts['failed'] += 1
+            continue
+        if result == 'finished':
+            counts['rebuilt'] += 1
+            counts['finished'] += 1
+        elif result:
+            counts['rebuilt'] += 1
+    return counts
+
+
+# --- Status ---
+
+def print_status(conn, now=None):
+    now = now or datetime.now()
+    start = parse_month(ROLLING_START)
+    newest = newest_available_month(now)
+    db_filenames = {row[0] for row in conn.execute("SELECT output_filename FROM requests")}
+    pending = pending_jobs(conn, db_filenames, now)
+    replacements = due_replacements(conn, now)
+    rolling = conn.execute("SELECT COUNT(*) FROM requests WHERE status = ?", (ROLLING_STATUS,)).fetchone()[0]
+    preliminary = conn.execute(
+        "SELECT COUNT(*), MIN(final_check_at) FROM requests WHERE preliminary = 1 AND download = 1"
+    ).fetchone()
+
+    print(f"--- Rolling tail at {now:%Y-%m-%d %H:%M} ---")
+    print(f"Tail: {start[0]}-{start[1]:02d} to {newest[0]}-{newest[1]:02d} "
+          f"(newest month published {ERA5T_LAG_DAYS} days ago or earlier)")
+    print(f"Rolling chunks: {rolling}; preliminary parts: {preliminary[0]}"
+          + (f", next final-data check {preliminary[1][:16]}" if preliminary[0] and preliminary[1] else ""))
+    print(f"Pending: {len(pending)} monthly requests, {len(replacements)} ERA5T replacements due")
+    by_month = {}
+    for job in pending:
+        key = f"{job['year']}-{job['months'][0]}"
+        by_month[key] = by_month.get(key, 0) + 1
+    for key in sorted(by_month):
+        print(f"  {key}: {by_month[key]} requests")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Near-real-time tail of the archive (ERA5T, replaced by final ERA5).")
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild the rolling chunk files from their downloaded parts.")
+    args = parser.parse_args()
+
+    if not os.path.exists(DB_NAME):
+        print(f"{DB_NAME} not found.")
+        return
+    # The preliminary/final_check_at columns come with the manager's migrations
+    from database import setup_database
+    setup_database()
+    conn = sqlite3.connect(DB_NAME)
+    try:
+        if args.rebuild:
+            import logging
+            logging.basicConfig(level=logging.INFO, format='%(message)s')
+            counts = update_rolling_chunks(conn, output_dir, logging.getLogger('rolling'))
+            print(f"--- {counts['rebuilt']} chunks rebuilt, {counts['finished']} finished, {counts['failed']} failed ---")
+        print_status(conn)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
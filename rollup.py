@@ -0,0 +1,314 @@
+"""
+Rollup stage: keeps daily and monthly state aggregates of the hourly data,
+so model training and QA do not re-reduce years of hourly grids per query.
+
+    python rollup.py                       # fold in every new or changed file in era5_data
+    python rollup.py --show TX --freq monthly --start 2021-06 --end 2021-08
+
+    import rollup
+    df = rollup.query('TX', '2021-06-01', '2021-08-31', ['t2m', 'tp'], freq='daily')
+
+Each hourly grid is first reduced to a state value per time step (the
+latitude-weighted mean over the state's grid cells), then to min/mean/max
+per day and per month, plus the sum for accumulated variables such as
+total precipitation. Results live in one small columnar NetCDF file per
+state and frequency under rollups/ (<STATE>_daily.nc, <STATE>_monthly.nc),
+one column per variable and statistic.
+
+Only files that are new or changed since the last run (by size and mtime,
+recorded in rollups/.rollup_index.json) are read, and only the days they
+cover and the months those days fall in are recomputed. Rollups are kept
+when a raw file is later removed or moved to cold storage.
+"""
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from naming import parse_output_filename, short_variable_names
+
+DEFAULT_DATA_DIR = "era5_data"
+DEFAULT_ROLLUP_DIR = "rollups"
+INDEX_FILENAME = ".rollup_index.json"
+INDEX_VERSION = 1
+DEFAULT_WORKERS = max((os.cpu_count() or 2) - 1, 1)
+# Time steps reduced per chunk; bounds memory for the largest state boxes
+ROLLUP_CHUNK_HOURS = 24 * 31
+
+STATISTICS = ('min', 'mean', 'max')
+# Accumulated variables (short names) that also get a sum
+SUM_VARIABLES = {'tp'}
+FREQUENCIES = ('daily', 'monthly')
+
+
+def time_dim_of(ds):
+    return 'valid_time' if 'valid_time' in ds.dims else 'time'
+
+
+def rollup_path(rollup_dir, state, freq):
+    return os.path.join(rollup_dir, f"{state}_{freq}.nc")
+
+
+# --- Reduction ---
+
+def state_series(ds, chunk_hours=ROLLUP_CHUNK_HOURS):
+    """
+    Hourly state-mean series of every gridded variable, as a DataFrame
+    indexed by time. Cells are weighted by cos(latitude); missing cells
+    (e.g. between the boxes of a multi-box cover) are left out.
+    """
+    time_dim = time_dim_of(ds)
+    weights = np.cos(np.deg2rad(ds['latitude'].values.astype(np.float64)))[:, None]
+    n_times = ds.sizes[time_dim]
+    columns = {}
+    for name, da in ds.data_vars.items():
+        if not {time_dim, 'latitude', 'longitude'} <= set(da.dims):
+            continue
+        # Drop singleton extras such as expver/number
+        da = da.isel({dim: 0 for dim in da.dims if dim not in (time_dim, 'latitude', 'longitude')})
+        da = da.transpose(time_dim, 'latitude', 'longitude')
+        series = np.full(n_times, np.nan)
+        for start in range(0, n_times, chunk_hours):
+            window = slice(start, min(start + chunk_hours, n_times))
+            values = da.isel({time_dim: window}).values.astype(np.float64)
+            valid = ~np.isnan(values)
+            numerator = np.where(valid, values, 0.0) * weights
+            denominator = (valid * weights).sum(axis=(1, 2))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                series[window] = numerator.sum(axis=(1, 2)) / denominator
+        columns[name] = series
+    return pd.DataFrame(columns, index=pd.DatetimeIndex(ds[time_dim].values, name='time'))
+
+
+def daily_rollup(series):
+    """Daily min/mean/max (and sum) per variable, plus the number of hours behind each row."""
+    frames = {}
+    for name in series.columns:
+        grouped = series[name].resample('1D')
+        stats = list(STATISTICS) + (['sum'] if name in SUM_VARIABLES else []) + ['count']
+        frame = grouped.agg(stats)
+        frame.columns = [f"{name}_{'hours' if stat == 'count' else stat}" for stat in stats]
+        frames[name] = frame
+    daily = pd.concat(frames.values(), axis=1)
+    daily.index.name = 'time'
+    return daily
+
+
+def monthly_from_daily(daily, months):
+    """
+    Monthly rows for the given month starts, combined from the daily rows:
+    min of minima, max of maxima, sums added up, means weighted by hours.
+    """
+    in_months = daily[daily.index.to_period('M').to_timestamp().isin(months)]
+    month_key = in_months.index.to_period('M').to_timestamp()
+    variables = sorted({column.rsplit('_', 1)[0] for column in daily.columns})
+    columns = {}
+    for name in variables:
+        if f"{name}_hours" not in in_months:
+            continue
+        hours = in_months[f"{name}_hours"].fillna(0)
+        grouped_hours = hours.groupby(month_key).sum()
+        columns[f"{name}_min"] = in_months[f"{name}_min"].groupby(month_key).min()
+        columns[f"{name}_max"] = in_months[f"{name}_max"].groupby(month_key).max()
+        weighted = (in_months[f"{name}_mean"] * hours).groupby(month_key).sum(min_count=1)
+        columns[f"{name}_mean"] = weighted / grouped_hours.where(grouped_hours > 0)
+        if f"{name}_sum" in in_months:
+            columns[f"{name}_sum"] = in_months[f"{name}_sum"].groupby(month_key).sum(min_count=1)
+        columns[f"{name}_hours"] = grouped_hours
+    monthly = pd.DataFrame(columns)
+    monthly.index.name = 'time'
+    return monthly
+
+
+# --- Storage ---
+
+def read_table(path):
+    if not os.path.exists(path):
+        return pd.DataFrame(index=pd.DatetimeIndex([], name='time'))
+    with xr.open_dataset(path) as ds:
+        return ds.to_dataframe()
+
+
+def write_table(table, path, state, freq):
+    ds = xr.Dataset.from_dataframe(table.sort_index().sort_index(axis=1))
+    ds.attrs.update({'state': state, 'frequency': freq})
+    encoding = {
+        name: {'dtype': 'float32', 'zlib': True, 'complevel': 4, '_FillValue': np.float32(np.nan)}
+        for name in ds.data_vars
+    }
+    temp_path = path + ".tmp"
+    ds.to_netcdf(temp_path, encoding=encoding)
+    os.replace(temp_path, path)
+
+
+def upsert(old, new):
+    """Rows of `new` replace the same rows of `old`, column by column."""
+    if old.empty:
+        return new
+    return new.combine_first(old)
+
+
+def rollup_state(state, paths, rollup_dir=DEFAULT_ROLLUP_DIR, chunk_hours=ROLLUP_CHUNK_HOURS):
+    """
+    Folds the given (new or changed) files of one state into its rollups.
+    Returns (state, days recomputed, months recomputed).
+    """
+    daily_path = rollup_path(rollup_dir, state, 'daily')
+    monthly_path = rollup_path(rollup_dir, state, 'monthly')
+    daily = read_table(daily_path)
+
+    new_days = None
+    for path in paths:
+        with xr.open_dataset(path) as ds:
+            days = daily_rollup(state_series(ds, chunk_hours))
+        # The instant and accum streams of a quarter hold different columns of the same days
+        new_days = days if new_days is None else days.combine_first(new_days)
+    if new_days is None or new_days.empty:
+        return state, 0, 0
+    daily = upsert(daily, new_days)
+
+    months = pd.DatetimeIndex(new_days.index.to_period('M').to_timestamp().unique())
+    monthly = upsert(read_table(monthly_path), monthly_from_daily(daily, months))
+
+    write_table(daily, daily_path, state, 'daily')
+    write_table(monthly, monthly_path, state, 'monthly')
+    return state, len(new_days), len(months)
+
+
+# --- Incremental bookkeeping ---
+
+def load_index(rollup_dir=DEFAULT_ROLLUP_DIR):
+    path = os.path.join(rollup_dir, INDEX_FILENAME)
+    try:
+        with open(path) as f:
+            index = json.load(f)
+        if index.get('version') == INDEX_VERSION:
+            return index
+    except (OSError, json.JSONDecodeError):
+        pass
+    return {'version': INDEX_VERSION, 'files': {}}
+
+
+def save_index(index, rollup_dir=DEFAULT_ROLLUP_DIR):
+    path = os.path.join(rollup_dir, INDEX_FILENAME)
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(index, f, indent=1, sort_keys=True)
+    os.replace(temp_path, path)
+
+
+def changed_files(index, data_dir=DEFAULT_DATA_DIR, force=False):
+    """{state: [paths]} of output files that are new or changed since they were rolled up."""
+    by_state = {}
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            parsed = parse_output_filename(entry.name)
+            # Monthly/box parts are merged into the chunk file first
+            if not parsed or parsed['month'] or parsed['box'] or not entry.is_file():
+                continue
+            stat = entry.stat()
+            known = index['files'].get(entry.name)
+            if not force and known and known['bytes'] == stat.st_size and known['mtime'] == stat.st_mtime:
+                continue
+            by_state.setdefault(parsed['state'], []).append(entry.path)
+    return by_state
+
+
+def update_rollups(data_dir=DEFAULT_DATA_DIR, rollup_dir=DEFAULT_ROLLUP_DIR, workers=DEFAULT_WORKERS, force=False):
+    """
+    Folds every new or changed file into the rollups, one state per worker.
+    Returns {'states', 'files', 'days', 'months', 'failed'}.
+    """
+    os.makedirs(rollup_dir, exist_ok=True)
+    index = load_index(rollup_dir)
+    by_state = changed_files(index, data_dir, force)
+    totals = {'states': 0, 'files': 0, 'days': 0, 'months': 0, 'failed': 0}
+    if not by_state:
+        return totals
+
+    # Stat before reading, so a file rewritten meanwhile is picked up next run
+    stats = {path: os.stat(path) for paths in by_state.values() for path in paths}
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(rollup_state, state, paths, rollup_dir): state for state, paths in by_state.items()}
+        for future in as_completed(futures):
+            state = futures[future]
+            try:
+                _, days, months = future.result()
+            except Exception as e:
+                print(f"  > FAILED rollup of {state}: {e}")
+                totals['failed'] += 1
+                continue
+            for path in by_state[state]:
+                stat = stats[path]
+                index['files'][os.path.basename(path)] = {'bytes': stat.st_size, 'mtime': stat.st_mtime}
+            print(f"  > {state}: {len(by_state[state])} files, {days} days and {months} months recomputed")
+            totals['states'] += 1
+            totals['files'] += len(by_state[state])
+            totals['days'] += days
+            totals['months'] += months
+    save_index(index, rollup_dir)
+    return totals
+
+
+# --- Read API ---
+
+def query(state, start=None, end=None, variables=None, freq='daily', stats=None, rollup_dir=DEFAULT_ROLLUP_DIR):
+    """
+    Rows of a state's daily or monthly rollup between start and end
+    (inclusive) as a DataFrame. `variables` may list CDS or short names;
+    `stats` limits the columns to some of min/mean/max/sum/hours.
+    """
+    if freq not in FREQUENCIES:
+        raise ValueError(f"freq must be one of {FREQUENCIES}")
+    path = rollup_path(rollup_dir, state, freq)
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No {freq} rollup for {state} in {rollup_dir}. Run rollup.py first.")
+    table = read_table(path).loc[start:end]
+    if variables or stats:
+        names = set(short_variable_names(variables)) if variables else None
+        table = table[[
+            column for column in table.columns
+            if (names is None or column.rsplit('_', 1)[0] in names)
+            and (stats is None or column.rsplit('_', 1)[1] in stats)
+        ]]
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain daily and monthly state rollups of the hourly ERA5 files.")
+    parser.add_argument('--data-dir', default=DEFAULT_DATA_DIR)
+    parser.add_argument('--rollup-dir', default=DEFAULT_ROLLUP_DIR)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--force', action='store_true', help="Recompute from every file, not only new/changed ones.")
+    parser.add_argument('--show', metavar='STATE', help="Print a state's rollup instead of updating.")
+    parser.add_argument('--freq', choices=FREQUENCIES, default='monthly')
+    parser.add_argument('--start')
+    parser.add_argument('--end')
+    args = parser.parse_args()
+
+    if args.show:
+        try:
+            table = query(args.show, args.start, args.end, freq=args.freq, rollup_dir=args.rollup_dir)
+        except FileNotFoundError as e:
+            print(e)
+            sys.exit(1)
+        with pd.option_context('display.max_rows', None, 'display.width', 200):
+            print(table)
+        return
+
+    if not os.path.isdir(args.data_dir):
+        print(f"Data directory '{args.data_dir}' not found.")
+        sys.exit(1)
+    print(f"--- Updating rollups in {args.rollup_dir} ---")
+    totals = update_rollups(args.data_dir, args.rollup_dir, workers=args.workers, force=args.force)
+    print(f"--- Done: {totals['files']} files from {totals['states']} states, {totals['days']} days and "
+          f"{totals['months']} months recomputed, {totals['failed']} states failed ---")
+
+
+if __name__ == '__main__':
+    main()
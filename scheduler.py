@@ -0,0 +1,121 @@
+import heapq
+import math
+from datetime import datetime
+
+from config import years_to_download
+from regions import job_area
+
+# --- Scheduler Configuration ---
+# Higher weight = served sooner. States not listed get DEFAULT_STATE_WEIGHT.
+STATE_WEIGHTS = {
+    'TX': 3.0, 'CA': 3.0, 'NY': 2.5, 'FL': 2.5,
+    'PA': 1.5, 'IL': 1.5, 'OH': 1.5, 'GA': 1.5, 'NC': 1.5,
+}
+DEFAULT_STATE_WEIGHT = 1.0
+# Explicit per-year weights. Years not listed get 1.0 plus YEAR_RECENCY_BONUS
+# for every year they are newer than the oldest year in the plan (fixed when
+# the queue is built, so every entry is scored against the same baseline).
+YEAR_WEIGHTS = {}
+YEAR_RECENCY_BONUS = 0.2
+# Priority gained for every hour a state has gone without a submission, so
+# low-weight states climb the queue instead of starving.
+AGING_PER_HOUR = 0.05
+
+GRID_RESOLUTION = 0.25  # ERA5 single levels grid, in degrees
+
+
+def grid_points(area):
+    """Number of 0.25° grid points CDS returns for an [N, W, S, E] area."""
+    north, west, south, east = area
+    n_lat = math.floor(north / GRID_RESOLUTION) - math.ceil(south / GRID_RESOLUTION) + 1
+    n_lon = math.floor(east / GRID_RESOLUTION) - math.ceil(west / GRID_RESOLUTION) + 1
+    return max(n_lat, 0) * max(n_lon, 0)
+
+
+def estimated_job_size(job, bounding_boxes):
+    """Relative size of a job: grid points times months requested."""
+    return grid_points(job_area(job, bounding_boxes)) * len(job['months'])
+
+
+class PriorityScheduler:
+    """
+    Weighted priority queue over pending submission jobs.
+
+    A job's priority is its state weight times its year weight, plus an aging
+    term that grows with the time since its state was last served. Ties go to
+    the smaller job. Serving a state resets its age, which is applied lazily:
+    stale entries are re-scored when they reach the top of the heap.
+    """
+
+    def __init__(self, bounding_boxes, last_served=None, epoch=None, now=None, oldest_year=None):
+        self.bounding_boxes = bounding_boxes
+        self.last_served = dict(last_served or {})
+        self.now = now or datetime.now()
+        self.epoch = epoch or self.now
+        self.oldest_year = int(oldest_year if oldest_year is not None else min(years_to_download))
+        self._heap = []
+        self._counter = 0
+
+    def year_weight(self, year):
+        if year in YEAR_WEIGHTS:
+            return YEAR_WEIGHTS[year]
+        return 1.0 + YEAR_RECENCY_BONUS * max(int(year) - self.oldest_year, 0)
+
+    def age_hours(self, state_abbr):
+        since = self.last_served.get(state_abbr) or self.epoch
+        return max((self.now - since).total_seconds() / 3600, 0.0)
+
+    def priority(self, job):
+        weight = STATE_WEIGHTS.get(job['state_abbr'], DEFAULT_STATE_WEIGHT) * self.year_weight(job['year'])
+        return weight + AGING_PER_HOUR * self.age_hours(job['state_abbr'])
+
+    def extend(self, jobs):
+        for job in jobs:
+            self._push(job)
+
+    def _push(self, job):
+        served_at = self.last_served.get(job['state_abbr'])
+        entry = (-self.priority(job), estimated_job_size(job, self.bounding_boxes), self._counter, served_at, job)
+        self._counter += 1
+        heapq.heappush(self._heap, entry)
+
+    def pop(self):
+        """Returns the highest-priority job, or None when the queue is empty."""
+        while self._heap:
+            _, _, _, served_at, job = heapq.heappop(self._heap)
+            if served_at != self.last_served.get(job['state_abbr']):
+                # State was served since this entry was scored; re-score it
+                self._push(job)
+                continue
+            return job
+        return None
+
+    def peek(self, n=20):
+        """
+        The n best (priority, job) pairs without removing them. Lazy re-scoring
+        is not applied, so the order is approximate after mark_served().
+        """
+        return [(-entry[0], entry[4]) for entry in heapq.nsmallest(n, self._heap)]
+
+    def mark_served(self, state_abbr, when=None):
+        self.last_served[state_abbr] = when or self.now
+
+    def __len__(self):
+        return len(self._heap)
+
+
+def load_service_history(conn):
+    """
+    Returns ({state: last submission time}, epoch) from the requests table.
+    The epoch (first submission ever) is the age origin for unserved states.
+    """
+    c = conn.cursor()
+    c.execute("SELECT state_abbr, MAX(created_at) FROM requests GROUP BY state_abbr")
+    last_served = {
+        state_abbr: datetime.fromisoformat(str(created_at))
+        for state_abbr, created_at in c.fetchall() if created_at
+    }
+    c.execute("SELECT MIN(created_at) FROM requests")
+    first = c.fetchone()[0]
+    epoch = datetime.fromisoformat(str(first)) if first else None
+    return last_served, epoch
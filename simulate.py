@@ -0,0 +1,398 @@
+"""
+Offline scheduler simulator: replays the download plan against the queue,
+run and size behaviour observed in requests.db, under alternative policies,
+in seconds instead of days of real queue time.
+
+Usage:
+    python simulate.py                                    # current settings
+    python simulate.py --max-active 12 --loop-minutes 20  # what if?
+    python simulate.py --chunk-months 1 --policy smallest
+    python simulate.py --compare                          # a grid of policies side by side
+
+Model (discrete-event, one clock):
+  * The manager wakes every --loop-minutes. It sees the requests that
+    finished since the last cycle, schedules retries for rejected ones
+    (retry.py backoff), and submits into its free slots, one every
+    --submit-spacing seconds, in the order of --policy.
+  * Each submitted request waits in the CDS queue for a time drawn from the
+    observed queue waits, then runs for a time proportional to its size
+    (observed run seconds per grid value). Draws come from requests of the
+    same state when there are enough of them, else from requests of the same
+    size class. A share of requests is rejected, as in the history.
+  * Completed requests are downloaded by --downloaders parallel downloads
+    at --download-mbps each; the estimated size uses planner.py's
+    calibration.
+
+Queue waits are assumed not to depend on our own load beyond what the
+history shows; --congestion stretches them by (active / historical
+slots) ** exponent to test that assumption.
+"""
+import argparse
+import heapq
+import os
+import random
+import statistics
+from collections import deque
+from datetime import datetime, timedelta
+
+from config import DB_NAME, MAX_ACTIVE_REQUESTS, LOOP_SLEEP_SECONDS, bounding_boxes, years_to_download, variables_to_download
+from database import connect_read_only
+from naming import months_for_filename, parse_output_filename
+from planner import (
+    DEFAULT_BYTES_PER_VALUE, DEFAULT_JOB_HOURS, calibrate_bytes_per_value, current_slot_limit, format_bytes, job_values, parse_years,
+)
+from regions import area_cover
+from retry import retry_delay_seconds
+from scheduler import PriorityScheduler
+
+SUBMIT_SPACING_SECONDS = 15
+DEFAULT_DOWNLOAD_MBPS = 20.0
+DEFAULT_DOWNLOADERS = 4
+MIN_STATE_SAMPLES = 10      # fewer completed requests than this: use the size class instead
+SIZE_CLASSES = 3            # small / medium / large, split at the observed tertiles
+DEFAULT_SEED = 1
+POLICIES = ('priority', 'fifo', 'smallest', 'largest')
+
+
+# --- History ---
+
+def load_history(conn):
+    """
+    One sample per finished request: state, grid values, queue wait and run
+    time (seconds) and whether it was rejected.
+    """
+    rows = conn.execute(
+        "SELECT state_abbr, year, output_filename, status, created_at, started_at, finished_at, updated_at "
+        "FROM requests WHERE status IN ('completed', 'failed')"
+    ).fetchall()
+    samples = []
+    for state_abbr, year, filename, status, created, started, finished, updated in rows:
+        parsed = parse_output_filename(filename)
+        if state_abbr not in bounding_boxes or not parsed or not created:
+            continue
+        created = datetime.fromisoformat(str(created))
+        finished = datetime.fromisoformat(str(finished or updated))
+        started = datetime.fromisoformat(str(started)) if started else None
+        total = (finished - created).total_seconds()
+        if total <= 0:
+            continue
+        queue_wait = (started - created).total_seconds() if started else total / 2
+        values = job_values(state_abbr, year, months_for_filename(filename), variables_to_download, parsed['box'])
+        samples.append({
+            'state': state_abbr,
+            'values': values,
+            'queue_seconds': max(queue_wait, 0.0),
+            'run_seconds_per_value': max(total - queue_wait, 0.0) / values if values else 0.0,
+            'failed': status == 'failed',
+        })
+    return samples
+
+
+def default_samples(plan):
+    """Stand-in history when requests.db has none: DEFAULT_JOB_HOURS for a median job, half of it queued."""
+    median_values = statistics.median(job['values'] for job in plan)
+    seconds = DEFAULT_JOB_HOURS * 3600
+    return [{
+        'state': None, 'values': median_values, 'queue_seconds': seconds / 2,
+        'run_seconds_per_value': seconds / 2 / median_values, 'failed': False,
+    }]
+
+
+class Distributions:
+    """Draws queue waits, run times and rejections for a job from matching history samples."""
+
+    def __init__(self, samples, rng):
+        self.rng = rng
+        self.samples = samples
+        self.by_state = {}
+        for sample in samples:
+            self.by_state.setdefault(sample['state'], []).append(sample)
+        values = sorted(sample['values'] for sample in samples)
+        self.thresholds = [values[len(values) * i // SIZE_CLASSES] for i in range(1, SIZE_CLASSES)]
+        self.by_class = {}
+        for sample in samples:
+            self.by_class.setdefault(self.size_class(sample['values']), []).append(sample)
+        self.rejection_rate = sum(sample['failed'] for sample in samples) / len(samples)
+
+    def size_class(self, values):
+        return sum(values > threshold for threshold in self.thresholds)
+
+    def pool(self, job):
+        state_samples = self.by_state.get(job['state_abbr'], [])
+        if len(state_samples) >= MIN_STATE_SAMPLES:
+            return state_samples
+        return self.by_class.get(self.size_class(job['values'])) or self.samples
+
+    def draw(self, job):
+        """(queue seconds, run seconds, rejected) for one submission of the job."""
+        pool = self.pool(job)
+        completed = [sample for sample in pool if not sample['failed']] or pool
+        queue_seconds = self.rng.choice(pool)['queue_seconds']
+        run_seconds = self.rng.choice(completed)['run_seconds_per_value'] * job['values']
+        return queue_seconds, run_seconds, self.rng.random() < self.rejection_rate
+
+
+# --- Plan and policies ---
+
+def chunk_month_groups(chunk_months):
+    months = [f"{m:02d}" for m in range(1, 13)]
+    return [months[i:i + chunk_months] for i in range(0, 12, chunk_months)]
+
+
+def expand_jobs(states, years, chunk_months, variables=None):
+    """Submission jobs of the full plan with --chunk-months months each (one per box of a cover)."""
+    variables = variables or variables_to_download
+    jobs = []
+    for state_abbr in states:
+        boxes = list(area_cover(state_abbr, bounding_boxes) or [None])
+        for year in years:
+            for months in chunk_month_groups(chunk_months):
+                for box in boxes:
+                    jobs.append({
+                        'state_abbr': state_abbr,
+                        'year': year,
+                        'months': months,
+                        'box': box,
+                        'values': job_values(state_abbr, year, months, variables, box),
+                        'attempts': 0,
+                    })
+    return jobs
+
+
+class FifoQueue:
+    """Plan order, as the manager walked it before the priority queue."""
+
+    def __init__(self):
+        self._jobs = deque()
+
+    def extend(self, jobs):
+        self._jobs.extend(jobs)
+
+    def pop(self):
+        return self._jobs.popleft() if self._jobs else None
+
+    def mark_served(self, state_abbr, when=None):
+        pass
+
+    def __len__(self):
+        return len(self._jobs)
+
+
+class SizeQueue(FifoQueue):
+    """Smallest (or largest) job first."""
+
+    def __init__(self, largest_first=False):
+        self._heap = []
+        self._sign = -1 if largest_first else 1
+        self._counter = 0
+
+    def extend(self, jobs):
+        for job in jobs:
+            heapq.heappush(self._heap, (self._sign * job['values'], self._counter, job))
+            self._counter += 1
+
+    def pop(self):
+        return heapq.heappop(self._heap)[2] if self._heap else None
+
+    def __len__(self):
+        return len(self._heap)
+
+
+def build_queue(policy, epoch, oldest_year=None):
+    if policy == 'priority':
+        return PriorityScheduler(bounding_boxes, epoch=epoch, now=epoch, oldest_year=oldest_year)
+    if policy == 'fifo':
+        return FifoQueue()
+    return SizeQueue(largest_first=(policy == 'largest'))
+
+
+# --- Simulation ---
+
+def simulate(jobs, distributions, bytes_per_value, policy='priority', max_active=MAX_ACTIVE_REQUESTS,
+             loop_seconds=LOOP_SLEEP_SECONDS, submit_spacing=SUBMIT_SPACING_SECONDS, downloaders=DEFAULT_DOWNLOADERS,
+             download_mbps=DEFAULT_DOWNLOAD_MBPS, congestion=0.0, reference_slots=MAX_ACTIVE_REQUESTS):
+    """
+    Runs the plan to the last download. Returns a dict of results; times
+    are in seconds from the start.
+    """
+    epoch = datetime(2000, 1, 1)
+    # The simulated plan may cover other years than the configured one
+    queue = build_queue(policy, epoch, oldest_year=min((int(job['year']) for job in jobs), default=None))
+    queue.extend(dict(job) for job in jobs)
+    retries = []              # (due time, job)
+    in_flight = []            # heap of (finish time, counter, job, rejected)
+    downloader_free = [0.0] * downloaders
+    backlog_events = []       # (time, +1/-1) for requests waiting for a downloader
+    active_events = []        # (time, +1/-1) for requests occupying a CDS slot
+    counter = 0
+    submitted = rejected = 0
+    last_download = 0.0
+    now = 0.0
+
+    while len(queue) or retries or in_flight:
+        # --- What the manager learns when it polls ---
+        while in_flight and in_flight[0][0] <= now:
+            finish, _, job, was_rejected = heapq.heappop(in_flight)
+            if was_rejected:
+                job['attempts'] += 1
+                retries.append((now + retry_delay_seconds(job['attempts']), job))
+                continue
+            # Downloads start once the manager has seen the completion
+            slot = min(range(downloaders), key=downloader_free.__getitem__)
+            start = max(now, downloader_free[slot])
+            duration = job['values'] * bytes_per_value / (download_mbps * 1e6)
+            downloader_free[slot] = start + duration
+            backlog_events += [(now, 1), (start, -1)]
+            last_download = max(last_download, start + duration)
+
+        due = [job for due_at, job in retries if due_at <= now]
+        retries = [(due_at, job) for due_at, job in retries if due_at > now]
+        queue.extend(due)
+
+        # --- Submissions into free slots ---
+        if isinstance(queue, PriorityScheduler):
+            queue.now = epoch + timedelta(seconds=now)
+        clock = now
+        for _ in range(max_active - len(in_flight)):
+            job = queue.pop()
+            if job is None:
+                break
+            queue.mark_served(job['state_abbr'], epoch + timedelta(seconds=clock))
+            queue_seconds, run_seconds, was_rejected = distributions.draw(job)
+            if congestion:
+                queue_seconds *= (max(len(in_flight) + 1, 1) / reference_slots) ** congestion
+            finish = clock + queue_seconds + run_seconds
+            heapq.heappush(in_flight, (finish, counter, job, was_rejected))
+            active_events += [(clock, 1), (finish, -1)]
+            counter += 1
+            submitted += 1
+            rejected += was_rejected
+            clock += submit_spacing
+
+        # --- Next wake-up: the loop interval ---
+        now += loop_seconds
+
+    makespan = max(last_download, now - loop_seconds)
+    return {
+        'policy': policy,
+        'makespan_hours': makespan / 3600,
+        'submitted': submitted,
+        'rejected': rejected,
+        'slot_utilization': time_average(active_events, makespan) / max_active if makespan else 0.0,
+        'backlog_mean': time_average(backlog_events, makespan),
+        'backlog_max': peak(backlog_events),
+    }
+
+
+def time_average(events, horizon):
+    """Time-weighted mean of a counter given its (time, delta) changes."""
+    level, last, area = 0, 0.0, 0.0
+    for time, delta in sorted(events):
+        time = min(time, horizon)
+        area += level * (time - last)
+        level += delta
+        last = time
+    return area / horizon if horizon else 0.0
+
+
+def peak(events):
+    level, highest = 0, 0
+    # At equal times, leaving the backlog counts before joining it
+    for _, delta in sorted(events, key=lambda e: (e[0], e[1])):
+        level += delta
+        highest = max(highest, level)
+    return highest
+
+
+def median_result(results):
+    """Per-metric median over repeated runs with different seeds."""
+    merged = dict(results[0])
+    for key, value in results[0].items():
+        if isinstance(value, (int, float)):
+            merged[key] = statistics.median(result[key] for result in results)
+    return merged
+
+
+def print_results(rows):
+    print(f"{'policy':<10}{'slots':>6}{'loop min':>9}{'chunk':>6}{'done in':>10}{'slot use':>10}"
+          f"{'backlog':>9}{'max':>5}{'submits':>9}{'rejected':>9}")
+    for row in rows:
+        print(f"{row['policy']:<10}{row['max_active']:>6}{row['loop_minutes']:>9g}{row['chunk_months']:>6}"
+              f"{row['makespan_hours'] / 24:>8.1f} d{row['slot_utilization']:>10.0%}"
+              f"{row['backlog_mean']:>9.1f}{row['backlog_max']:>5.0f}{row['submitted']:>9.0f}{row['rejected']:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the download plan under alternative scheduling policies.")
+    parser.add_argument('--policy', choices=POLICIES, default='priority')
+    parser.add_argument('--max-active', type=int, help="Active request slots (default: current target).")
+    parser.add_argument('--loop-minutes', type=float, default=LOOP_SLEEP_SECONDS / 60)
+    parser.add_argument('--submit-spacing', type=float, default=SUBMIT_SPACING_SECONDS, help="Seconds between submissions.")
+    parser.add_argument('--chunk-months', type=int, choices=[1, 2, 3, 4, 6, 12], default=3)
+    parser.add_argument('--downloaders', type=int, default=DEFAULT_DOWNLOADERS)
+    parser.add_argument('--download-mbps', type=float, default=DEFAULT_DOWNLOAD_MBPS, help="MB/s per download.")
+    parser.add_argument('--congestion', type=float, default=0.0, help="Exponent stretching queue waits with our load.")
+    parser.add_argument('--years', help="Years to plan, e.g. 2015-2024 (default: configured years).")
+    parser.add_argument('--states', help="Comma-separated states (default: all configured).")
+    parser.add_argument('--runs', type=int, default=5, help="Runs per setting (median reported).")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--compare', action='store_true', help="Run every policy, slot count and chunk size variant.")
+    args = parser.parse_args()
+
+    years = parse_years(args.years) if args.years else years_to_download
+    states = [s.strip().upper() for s in args.states.split(',')] if args.states else list(bounding_boxes)
+
+    if os.path.exists(DB_NAME):
+        # Read-only: nothing is migrated or created, older databases read with column defaults
+        conn = connect_read_only(DB_NAME)
+        try:
+            samples = load_history(conn)
+            bytes_per_value, _ = calibrate_bytes_per_value(conn)
+            slots = current_slot_limit(conn)
+        finally:
+            conn.close()
+    else:
+        samples, bytes_per_value, slots = [], DEFAULT_BYTES_PER_VALUE, MAX_ACTIVE_REQUESTS
+    max_active = args.max_active or slots
+
+    if args.compare:
+        settings = [
+            (policy, active, args.loop_minutes, chunk)
+            for policy in POLICIES
+            for active in sorted({max_active, max_active * 2})
+            for chunk in (1, 3)
+        ] + [('priority', max_active, minutes, 3) for minutes in (15, 30) if minutes != args.loop_minutes]
+    else:
+        settings = [(args.policy, max_active, args.loop_minutes, args.chunk_months)]
+
+    plans = {}
+    rows = []
+    for policy, active, loop_minutes, chunk in settings:
+        if chunk not in plans:
+            plans[chunk] = expand_jobs(states, years, chunk)
+        jobs = plans[chunk]
+        history = samples or default_samples(jobs)
+        results = []
+        for run in range(args.runs):
+            distributions = Distributions(history, random.Random(args.seed + run))
+            results.append(simulate(
+                jobs, distributions, bytes_per_value, policy=policy, max_active=active,
+                loop_seconds=loop_minutes * 60, submit_spacing=args.submit_spacing, downloaders=args.downloaders,
+                download_mbps=args.download_mbps, congestion=args.congestion, reference_slots=slots,
+            ))
+        row = median_result(results)
+        row.update({'max_active': active, 'loop_minutes': loop_minutes, 'chunk_months': chunk})
+        rows.append(row)
+
+    total_values = sum(job['values'] for job in plans[settings[0][3]])
+    print("--- Scheduler Simulation (nothing is submitted) ---")
+    print(f"Plan: {len(states)} states x {len(years)} years, "
+          f"~{format_bytes(total_values * bytes_per_value)} to download")
+    print(f"History: {len(samples)} finished requests" if samples else
+          f"History: none in {DB_NAME}, assuming {DEFAULT_JOB_HOURS:g} h per median job")
+    print(f"Runs per setting: {args.runs} (median), downloads: {args.downloaders} x {args.download_mbps:g} MB/s\n")
+    print_results(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,398 @@
+"""
+Storage tiers for the raw downloads, so era5_data/ stays small and fast to
+scan and upload once the derived products exist.
+
+    python storage.py                     # demote idle converted files, then evict over budget
+    python storage.py --status            # files and bytes per tier
+    python storage.py --rehydrate ERA5_hourly_multivariable_TX_2021_Jan-Mar.nc
+
+Tiers (requests.storage_tier):
+    hot      in era5_data/, as downloaded
+    cold     gzip-compressed in era5_cold/, removed from era5_data/
+    evicted  deleted to stay within COLD_BUDGET_GB; only the rollups remain
+
+A downloaded file is demoted once it has been verified (it opens and covers
+its whole chunk), it has been folded into the rollups (rollup.py) and it
+has not been used for HOT_RETENTION_HOURS. When era5_cold/ grows beyond the
+budget, the least recently used cold files are evicted.
+
+Cold files are rehydrated transparently: archive.load(), derive.py and
+repack.py call ensure_hot() for the files they need. Rehydrating an evicted
+file sends its request back to the retry engine to be downloaded again; for
+a chunk assembled from parts (split, cover or rolling), the parts are.
+"""
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import sys
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+import retry
+import rolling
+from config import DB_NAME, output_dir
+from naming import parse_output_filename, chunk_months, is_part_filename, stream_paths
+
+HOT_DIR = output_dir
+COLD_DIR = "era5_cold"
+COLD_SUFFIX = ".gz"
+HOT_RETENTION_HOURS = float(os.getenv("HOT_RETENTION_HOURS", "72"))
+COLD_BUDGET_GB = float(os.getenv("COLD_BUDGET_GB", "500"))
+COLD_GZIP_LEVEL = 6
+COPY_BLOCK_BYTES = 4 * 1024 * 1024
+
+TIERS = ('hot', 'cold', 'evicted')
+
+
+def cold_path(hot_path, cold_dir=COLD_DIR):
+    return os.path.join(cold_dir, os.path.basename(hot_path) + COLD_SUFFIX)
+
+
+def hot_files(filename, hot_dir=HOT_DIR):
+    """The stream files of an output that exist in the hot directory."""
+    return [path for path in stream_paths(hot_dir, filename) if os.path.exists(path)]
+
+
+def cold_files(filename, cold_dir=COLD_DIR):
+    return [
+        path for path in (cold_path(p, cold_dir) for p in stream_paths(cold_dir, filename))
+        if os.path.exists(path)
+    ]
+
+
+# --- Demotion ---
+
+def verify_file(path):
+    """True if the file opens and its time axis spans the whole chunk."""
+    import xarray as xr
+
+    parsed = parse_output_filename(path)
+    months = chunk_months(parsed['label']) if parsed else []
+    if not months:
+        return False
+    try:
+        with xr.open_dataset(path) as ds:
+            time_dim = 'valid_time' if 'valid_time' in ds.dims else 'time'
+            times = pd.DatetimeIndex(ds[time_dim].values)
+    except Exception:
+        return False
+    if times.empty:
+        return False
+    first = pd.Timestamp(f"{parsed['year']}-{months[0]}-01")
+    last = pd.Timestamp(f"{parsed['year']}-{months[-1]}-01") + pd.offsets.MonthEnd(0)
+    return times.min() < first + pd.Timedelta(days=1) and times.max() >= last
+
+
+def is_rolled_up(path, rollup_index):
+    """True if rollup.py has folded in this exact version of the file."""
+    known = rollup_index['files'].get(os.path.basename(path))
+    stat = os.stat(path)
+    return bool(known) and known['bytes'] == stat.st_size and known['mtime'] == stat.st_mtime
+
+
+def compress_file(source, target):
+    """gzip `source` to `target` via a temp file, keeping the source's mtime."""
+    temp_path = target + ".tmp"
+    with open(source, 'rb') as src, gzip.open(temp_path, 'wb', compresslevel=COLD_GZIP_LEVEL) as dst:
+        shutil.copyfileobj(src, dst, COPY_BLOCK_BYTES)
+    shutil.copystat(source, temp_path)
+    os.replace(temp_path, target)
+
+
+def decompress_file(source, target):
+    temp_path = target + ".tmp"
+    with gzip.open(source, 'rb') as src, open(temp_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, COPY_BLOCK_BYTES)
+    # Same mtime as before demotion, so rollup.py and archive.py see an unchanged file
+    shutil.copystat(source, temp_path)
+    os.replace(temp_path, target)
+
+
+def demotion_candidates(conn, now, retention_hours=HOT_RETENTION_HOURS):
+    """
+    Downloaded hot rows not touched for the retention period (parts excluded).
+    Idleness is measured from the last access or the download, never from
+    updated_at: status scrapes rewrite that on every cycle. Rows downloaded
+    before downloaded_at existed fall back to created_at.
+    """
+    cutoff = now - timedelta(hours=retention_hours)
+    idle_since = "COALESCE(last_accessed_at, downloaded_at, tier_changed_at, created_at)"
+    rows = conn.execute(
+        "SELECT request_id, output_filename FROM requests "
+        "WHERE download = 1 AND COALESCE(storage_tier, 'hot') = 'hot' AND status != 'split' "
+        f"AND {idle_since} < ? ORDER BY {idle_since}",
+        (cutoff,)
+    ).fetchall()
+    return [(request_id, filename) for request_id, filename in rows if not is_part_filename(filename)]
+
+
+def demote(conn, hot_dir=HOT_DIR, cold_dir=COLD_DIR, now=None, retention_hours=HOT_RETENTION_HOURS):
+    """
+    Moves verified, rolled-up, idle outputs to the cold tier.
+    Returns {'demoted', 'unverified', 'not_rolled_up', 'bytes_hot', 'bytes_cold'}.
+    """
+    import rollup
+
+    now = now or datetime.now()
+    os.makedirs(cold_dir, exist_ok=True)
+    rollup_index = rollup.load_index()
+    counts = {'demoted': 0, 'unverified': 0, 'not_rolled_up': 0, 'bytes_hot': 0, 'bytes_cold': 0}
+
+    for request_id, filename in demotion_candidates(conn, now, retention_hours):
+        paths = hot_files(filename, hot_dir)
+        if not paths:
+            continue
+        if not all(verify_file(path) for path in paths):
+            counts['unverified'] += 1
+            continue
+        if not all(is_rolled_up(path, rollup_index) for path in paths):
+            counts['not_rolled_up'] += 1
+            continue
+        for path in paths:
+            target = cold_path(path, cold_dir)
+            counts['bytes_hot'] += os.path.getsize(path)
+            compress_file(path, target)
+            counts['bytes_cold'] += os.path.getsize(target)
+        # Record the new tier before the hot copies go, so a crash leaves both
+        conn.execute(
+            "UPDATE requests SET storage_tier = 'cold', tier_changed_at = ?, updated_at = ? WHERE request_id = ?",
+            (now, now, request_id)
+        )
+        conn.commit()
+        for path in paths:
+            os.remove(path)
+        counts['demoted'] += 1
+    return counts
+
+
+# --- Eviction ---
+
+def evict(conn, cold_dir=COLD_DIR, budget_bytes=None, now=None):
+    """
+    Deletes the least recently used cold outputs until the cold tier fits
+    the budget. Returns (outputs evicted, bytes freed).
+    """
+    budget_bytes = budget_bytes if budget_bytes is not None else int(COLD_BUDGET_GB * 1024 ** 3)
+    now = now or datetime.now()
+    if not os.path.isdir(cold_dir):
+        return 0, 0
+    with os.scandir(cold_dir) as entries:
+        total = sum(entry.stat().st_size for entry in entries if entry.name.endswith(COLD_SUFFIX))
+    if total <= budget_bytes:
+        return 0, 0
+
+    rows = conn.execute(
+        "SELECT request_id, output_filename FROM requests WHERE storage_tier = 'cold' "
+        "ORDER BY COALESCE(last_accessed_at, tier_changed_at)"
+    ).fetchall()
+    evicted, freed = 0, 0
+    for request_id, filename in rows:
+        if total - freed <= budget_bytes:
+            break
+        conn.execute(
+            "UPDATE requests SET storage_tier = 'evicted', tier_changed_at = ?, updated_at = ? WHERE request_id = ?",
+            (now, now, request_id)
+        )
+        conn.commit()
+        for path in cold_files(filename, cold_dir):
+            freed += os.path.getsize(path)
+            os.remove(path)
+        evicted += 1
+    return evicted, freed
+
+
+# --- Rehydration ---
+
+def refetch_parts(conn, request_id, filename, now):
+    """
+    Sends an evicted chunk that was assembled from parts back to those
+    parts. The chunk's own row is not a CDS request (a cover parent never
+    was one; a split parent's request kept failing), so its parts are
+    retried and the chunk is assembled again once they are all downloaded.
+    Parts that were split themselves are handled the same way.
+    """
+    status = rolling.ROLLING_STATUS if request_id.startswith(rolling.ROLLING_ID_PREFIX) else retry.SPLIT_STATUS
+    conn.execute(
+        "UPDATE requests SET status = ?, download = 0, updated_at = ? WHERE request_id = ?",
+        (status, now, request_id)
+    )
+    parts = conn.execute("SELECT request_id, output_filename FROM requests WHERE parent_filename = ?", (filename,)).fetchall()
+    for part_id, part_filename in parts:
+        if part_id.startswith(retry.SPLIT_ID_PREFIX):
+            refetch_parts(conn, part_id, part_filename, now)
+        else:
+            conn.execute(
+                "UPDATE requests SET status = 'failed', download = 0, next_retry_at = ?, updated_at = ? WHERE request_id = ?",
+                (now, now, part_id)
+            )
+
+
+def rehydrate(conn, filename, hot_dir=HOT_DIR, cold_dir=COLD_DIR, now=None):
+    """
+    Brings an output back to the hot tier. Returns 'hot' if it is on disk
+    again, or 'refetch' for an evicted output, whose request is handed back
+    to the retry engine to be downloaded again.
+    """
+    now = now or datetime.now()
+    row = conn.execute(
+        "SELECT request_id, COALESCE(storage_tier, 'hot') FROM requests WHERE output_filename = ?", (filename,)
+    ).fetchone()
+    if row is None:
+        raise KeyError(f"{filename} is not tracked in {DB_NAME}")
+    request_id, tier = row
+
+    if tier == 'evicted' and request_id.startswith((retry.SPLIT_ID_PREFIX, rolling.ROLLING_ID_PREFIX)):
+        refetch_parts(conn, request_id, filename, now)
+        conn.execute(
+            "UPDATE requests SET storage_tier = 'hot', tier_changed_at = ?, last_accessed_at = ? WHERE request_id = ?",
+            (now, now, request_id)
+        )
+        conn.commit()
+        return 'refetch'
+
+    if tier == 'evicted':
+        conn.execute(
+            "UPDATE requests SET status = 'failed', download = 0, next_retry_at = ?, storage_tier = 'hot', "
+            "tier_changed_at = ?, last_accessed_at = ?, updated_at = ? WHERE request_id = ?",
+            (now, now, now, now, request_id)
+        )
+        conn.commit()
+        return 'refetch'
+
+    if tier == 'cold':
+        sources = cold_files(filename, cold_dir)
+        if not sources:
+            raise FileNotFoundError(f"{filename} is marked cold but nothing is in {cold_dir}")
+        os.makedirs(hot_dir, exist_ok=True)
+        for source in sources:
+            decompress_file(source, os.path.join(hot_dir, os.path.basename(source)[:-len(COLD_SUFFIX)]))
+        conn.execute(
+            "UPDATE requests SET storage_tier = 'hot', tier_changed_at = ?, last_accessed_at = ?, updated_at = ? "
+            "WHERE request_id = ?",
+            (now, now, now, request_id)
+        )
+        conn.commit()
+        for source in sources:
+            os.remove(source)
+        return 'hot'
+
+    conn.execute("UPDATE requests SET last_accessed_at = ? WHERE request_id = ?", (now, request_id))
+    conn.commit()
+    return 'hot'
+
+
+def output_filename_of(path):
+    """The requests.db output_filename a (stream) file belongs to."""
+    parsed = parse_output_filename(path)
+    name = os.path.basename(path)
+    if parsed and parsed['stream']:
+        return name[:-len(f"_{parsed['stream']}.nc")] + ".nc"
+    return name
+
+
+def ensure_hot(path, db_name=DB_NAME):
+    """
+    Makes sure a file a reprocess needs is in the hot tier, rehydrating it
+    from cold storage if necessary. Returns True if the file is on disk.
+    """
+    if os.path.exists(path):
+        return True
+    if not os.path.exists(db_name) or not parse_output_filename(path):
+        return False
+    conn = sqlite3.connect(db_name)
+    try:
+        result = rehydrate(conn, output_filename_of(path), hot_dir=os.path.dirname(path) or HOT_DIR)
+    except (KeyError, FileNotFoundError, sqlite3.OperationalError) as e:
+        print(f"Could not rehydrate {os.path.basename(path)}: {e}")
+        return False
+    finally:
+        conn.close()
+    if result == 'refetch':
+        print(f"{os.path.basename(path)} was evicted; its request will be downloaded again.")
+    return os.path.exists(path)
+
+
+def rehydrate_range(state, start, end, hot_dir=HOT_DIR, db_name=DB_NAME):
+    """Rehydrates every cold output of a state overlapping [start, end]. Returns the number rehydrated."""
+    if not os.path.exists(db_name):
+        return 0
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    conn = sqlite3.connect(db_name)
+    try:
+        rows = conn.execute(
+            "SELECT output_filename FROM requests WHERE state_abbr = ? AND storage_tier = 'cold' AND year BETWEEN ? AND ?",
+            (state, str(start.year), str(end.year))
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # Database from before storage tiers
+        conn.close()
+        return 0
+    count = 0
+    try:
+        for (filename,) in rows:
+            parsed = parse_output_filename(filename)
+            months = chunk_months(parsed['label'])
+            first = pd.Timestamp(f"{parsed['year']}-{months[0]}-01")
+            last = pd.Timestamp(f"{parsed['year']}-{months[-1]}-01") + pd.offsets.MonthEnd(0) + pd.Timedelta(days=1)
+            if first <= end and last > start and rehydrate(conn, filename, hot_dir=hot_dir) == 'hot':
+                count += 1
+    finally:
+        conn.close()
+    return count
+
+
+def tier_summary(conn):
+    return dict(conn.execute(
+        "SELECT COALESCE(storage_tier, 'hot'), COUNT(*) FROM requests WHERE download = 1 GROUP BY 1"
+    ).fetchall())
+
+
+def directory_bytes(path):
+    if not os.path.isdir(path):
+        return 0
+    with os.scandir(path) as entries:
+        return sum(entry.stat().st_size for entry in entries if entry.is_file())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move converted raw files to cold storage and evict over budget.")
+    parser.add_argument('--status', action='store_true', help="Show files and bytes per tier.")
+    parser.add_argument('--rehydrate', nargs='+', metavar='FILE', help=f"Bring outputs back to {HOT_DIR}.")
+    parser.add_argument('--retention-hours', type=float, default=HOT_RETENTION_HOURS)
+    parser.add_argument('--budget-gb', type=float, default=COLD_BUDGET_GB)
+    args = parser.parse_args()
+
+    if not os.path.exists(DB_NAME):
+        print(f"{DB_NAME} not found.")
+        sys.exit(1)
+    conn = sqlite3.connect(DB_NAME)
+    try:
+        if args.status:
+            summary = tier_summary(conn)
+            for tier in TIERS:
+                print(f"{tier.title()}:\t{summary.get(tier, 0)} outputs")
+            print(f"{HOT_DIR}: {directory_bytes(HOT_DIR) / 1e9:.2f} GB, {COLD_DIR}: {directory_bytes(COLD_DIR) / 1e9:.2f} GB "
+                  f"(budget {args.budget_gb:.0f} GB)")
+            return
+
+        if args.rehydrate:
+            for name in args.rehydrate:
+                result = rehydrate(conn, output_filename_of(name))
+                print(f"  > {name}: {'rehydrated' if result == 'hot' else 'evicted, queued for download again'}")
+            return
+
+        print(f"--- Demoting outputs idle for {args.retention_hours:g} h to {COLD_DIR} ---")
+        counts = demote(conn, retention_hours=args.retention_hours)
+        print(f"  > {counts['demoted']} demoted ({counts['bytes_hot'] / 1e9:.2f} GB -> {counts['bytes_cold'] / 1e9:.2f} GB), "
+              f"{counts['unverified']} failed verification, {counts['not_rolled_up']} not rolled up yet")
+        evicted, freed = evict(conn, budget_bytes=int(args.budget_gb * 1024 ** 3))
+        print(f"  > {evicted} evicted from {COLD_DIR} ({freed / 1e9:.2f} GB freed)")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# --- Transfer Configuration ---
+# Extraction keeps the zip and the extracted .nc files on disk at the same
+# time, so a job needs about twice its content_length while it runs.
+EXTRACT_SPACE_FACTOR = 2.0
+# Reservation used when CDS did not report a size for the job.
+DEFAULT_JOB_BYTES = 512 * 1024 * 1024
+# Free space that is never handed out to downloads.
+DISK_HEADROOM_BYTES = 1024 * 1024 * 1024
+
+
+class Reservation:
+    """Disk space set aside for one job; `written` tracks what it has used so far."""
+
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+        self.written = 0
+
+    @property
+    def outstanding(self):
+        return max(self.nbytes - self.written, 0)
+
+
+class DiskBudget:
+    """
+    Hands out disk space reservations against the free space of a directory.
+    Space already written by a running job is counted by the filesystem, so
+    only the unwritten part of each reservation is held back.
+    """
+
+    def __init__(self, path, headroom_bytes=DISK_HEADROOM_BYTES):
+        self.path = path
+        self.headroom_bytes = headroom_bytes
+        self._active = []
+        self._lock = threading.Lock()
+
+    def available(self):
+        free = shutil.disk_usage(self.path).free
+        return free - self.headroom_bytes - sum(r.outstanding for r in self._active)
+
+    def try_reserve(self, nbytes):
+        """Returns a Reservation, or None if the job does not fit right now."""
+        with self._lock:
+            if nbytes > self.available():
+                return None
+            reservation = Reservation(nbytes)
+            self._active.append(reservation)
+            return reservation
+
+    def hold(self, nbytes, written=0):
+        """Records space that is already committed (e.g. a fetched zip still waiting for extraction)."""
+        with self._lock:
+            reservation = Reservation(nbytes)
+            reservation.written = written
+            self._active.append(reservation)
+            return reservation
+
+    def release(self, reservation):
+        with self._lock:
+            if reservation in self._active:
+                self._active.remove(reservation)
+
+
+class BandwidthLimiter:
+    """Token bucket shared by all concurrent transfers. A rate of 0 means unlimited."""
+
+    def __init__(self, bytes_per_second):
+        self.rate = bytes_per_second
+        self.tokens = bytes_per_second
+        self.last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, nbytes):
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            # At most one second's worth of burst
+            self.tokens = min(self.rate, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= nbytes
+            deficit = -self.tokens
+        if deficit > 0:
+            time.sleep(deficit / self.rate)
+
+
+def job_reservation_bytes(content_length):
+    """Disk space to reserve for a job of the given zip size."""
+    return int((content_length or DEFAULT_JOB_BYTES) * EXTRACT_SPACE_FACTOR)
+
+
+def run_download_jobs(jobs, worker, disk, max_workers=2, on_done=None):
+    """
+    Runs worker(job, reservation) for every job in a thread pool, starting a
+    job only once its disk reservation fits. Jobs that do not fit wait for
+    running jobs to finish; if nothing is running and still nothing fits,
+    the remaining jobs are deferred.
+    on_done(job, result) is called on the calling thread as jobs finish.
+    Returns the list of jobs that were skipped.
+    """
+    pending = list(jobs)
+    skipped = []
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while pending or running:
+            # Start every pending job that fits, up to the worker limit
+            for job in list(pending):
+                if len(running) >= max_workers:
+                    break
+                reservation = disk.try_reserve(job_reservation_bytes(job.get('content_length')))
+                if reservation is None:
+                    continue
+                pending.remove(job)
+                running[pool.submit(worker, job, reservation)] = (job, reservation)
+
+            if not running:
+                if pending:
+                    # Nothing running yet nothing fits: the space is used by
+                    # something else on the box. Leave these for the next run.
+                    print(f"  > Not enough free disk space. Deferring {len(pending)} downloads to the next run.")
+                    skipped.extend(pending)
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                job, reservation = running.pop(future)
+                disk.release(reservation)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"  > FAILED to download {job['output_filename']}. Error: {e}")
+                    result = False
+                if on_done:
+                    on_done(job, result)
+
+    return skipped
@@ -1,10 +1,19 @@
+import argparse
+import errno
 import os
+import shutil
+import sqlite3
 import subprocess
 import json
 import sys
 import stat
 from datetime import datetime
 
+from config import DB_NAME, output_dir
+from naming import is_part_filename, parse_output_filename, stream_paths
+from storage import COLD_DIR, COLD_SUFFIX, cold_files, decompress_file, hot_files, output_filename_of, verify_file
+import profiling
+
 # --- 1. USER CONFIGURATION ---
 # !!! YOU MUST CHANGE THESE 3 VARIABLES !!!
 KAGGLE_USERNAME = "pratamasidhi"  # Your Kaggle username (lowercase)
@@ -13,7 +22,12 @@ DATASET_TITLE = "ERA5 US Hourly Weather Data" # The human-friendly title
 # -----------------------------
 
 # --- Script Configuration ---
-DATASET_DIR = "era5_data" # The folder with your .nc files
+SOURCE_DIR = output_dir # The folder retrieve.py writes your .nc files to
+# The folder that is published: hard links to the finalized files in
+# SOURCE_DIR (or copies from the cold tier, storage.py) plus the metadata,
+# rebuilt incrementally before every upload.
+# Temp zips and half-extracted files in SOURCE_DIR never reach Kaggle.
+DATASET_DIR = "era5_upload"
 METADATA_FILE = os.path.join(DATASET_DIR, "dataset-metadata.json")
 
 
@@ -22,7 +36,7 @@ def run_command(command, fail_on_error=True):
     print(f"\n--- Running: {' '.join(command)} ---")
     try:
         # We stream the output instead of capturing it
-        with subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, universal_newlines=True) as p:
+        with profiling.span(f"command.{' '.join(command[:3])}"), subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, bufsize=1, universal_newlines=True) as p:
             for line in p.stdout:
                 print(line, end='')
         
@@ -117,11 +131,152 @@ def check_dataset_exists():
         print(f"Result: Dataset does not exist.")
         return False
 
+# --- Upload Staging ---
+
+def finalized_outputs(source_dir=SOURCE_DIR, db_name=DB_NAME):
+    """
+    {output filename: storage tier} of the outputs ready to publish: whole
+    chunks (no monthly or box parts) whose row in requests.db is completed
+    and marked downloaded, whichever tier their file is in now. Without a
+    database, every output file in the source directory is a candidate.
+    """
+    if not os.path.exists(db_name):
+        with os.scandir(source_dir) as entries:
+            return {
+                output_filename_of(entry.name): 'hot' for entry in entries
+                if entry.is_file() and parse_output_filename(entry.name) and not is_part_filename(entry.name)
+            }
+
+    conn = sqlite3.connect(db_name)
+    try:
+        rows = conn.execute(
+            "SELECT output_filename, COALESCE(storage_tier, 'hot') FROM requests "
+            "WHERE download = 1 AND status = 'completed'"
+        ).fetchall()
+    finally:
+        conn.close()
+    return {filename: tier for filename, tier in rows if not is_part_filename(filename)}
+
+
+def link_or_copy(source, target):
+    """
+    Hard-links `source` to `target` through a temp name, so `target` is
+    replaced atomically. Falls back to a copy across filesystems.
+    Returns 'linked' or 'copied'.
+    """
+    temp_path = target + ".tmp"
+    if os.path.lexists(temp_path):
+        os.remove(temp_path)
+    try:
+        os.link(source, temp_path)
+        result = 'linked'
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP):
+            raise
+        shutil.copy2(source, temp_path)
+        result = 'copied'
+    os.replace(temp_path, target)
+    return result
+
+
+def is_current(source, target):
+    """True if the staged file is the source (same inode) or an identical copy of it."""
+    try:
+        source_stat, target_stat = os.stat(source), os.stat(target)
+    except FileNotFoundError:
+        return False
+    if os.path.samestat(source_stat, target_stat):
+        return True
+    return source_stat.st_size == target_stat.st_size and source_stat.st_mtime == target_stat.st_mtime
+
+
+def stage_from_cold(source, target):
+    """
+    Decompresses a cold-tier file straight into the staging directory (the
+    hot tier is left as it is). The staged copy keeps the file's mtime, so
+    it is recognized as current on the next run. Returns 'copied', or None
+    if the file does not verify.
+    """
+    decompress_file(source, target)
+    if verify_file(target):
+        return 'copied'
+    os.remove(target)
+    return None
+
+
+def build_staging(source_dir=SOURCE_DIR, staging_dir=DATASET_DIR, db_name=DB_NAME, cold_dir=COLD_DIR):
+    """
+    Brings the staging directory in line with the finalized outputs. Only
+    new or replaced files are verified and staged: hot files are linked,
+    files demoted by storage.py are decompressed from the cold tier. A
+    staged file stays as long as its row is downloaded, even once its raw
+    file has been evicted (the staged copy is then the only one left).
+    Returns counts plus the set of staged output filenames.
+    """
+    os.makedirs(staging_dir, exist_ok=True)
+    counts = {'linked': 0, 'copied': 0, 'unchanged': 0, 'rejected': 0, 'removed': 0, 'missing': 0}
+    finalized = finalized_outputs(source_dir, db_name)
+    staged_outputs = set()
+
+    for filename, tier in sorted(finalized.items()):
+        sources = [(path, 'hot') for path in hot_files(filename, source_dir)]
+        if not sources and tier == 'cold':
+            sources = [(path, 'cold') for path in cold_files(filename, cold_dir)]
+
+        for source, source_tier in sources:
+            name = os.path.basename(source)
+            if source_tier == 'cold':
+                name = name[:-len(COLD_SUFFIX)]
+            target = os.path.join(staging_dir, name)
+            if source_tier == 'hot' and is_current(source, target):
+                counts['unchanged'] += 1
+            elif source_tier == 'cold' and os.path.exists(target) and os.path.getmtime(target) == os.path.getmtime(source):
+                counts['unchanged'] += 1
+            elif source_tier == 'cold':
+                result = stage_from_cold(source, target)
+                if result is None:
+                    print(f"  > Not staging {name}: it does not open or does not cover its whole chunk.")
+                    counts['rejected'] += 1
+                    continue
+                counts[result] += 1
+            elif verify_file(source):
+                counts[link_or_copy(source, target)] += 1
+            else:
+                print(f"  > Not staging {name}: it does not open or does not cover its whole chunk.")
+                counts['rejected'] += 1
+                continue
+            staged_outputs.add(filename)
+
+        if any(os.path.exists(path) for path in stream_paths(staging_dir, filename)):
+            # Staged earlier; also covers an evicted output whose staged copy is all that is left
+            staged_outputs.add(filename)
+        elif not sources:
+            counts['missing'] += 1
+
+    # Only outputs that are no longer downloaded leave the published set
+    with os.scandir(staging_dir) as entries:
+        for entry in entries:
+            if entry.name == os.path.basename(METADATA_FILE) or output_filename_of(entry.name) in finalized:
+                continue
+            os.remove(entry.path)
+            counts['removed'] += 1
+
+    counts['staged'] = staged_outputs
+    return counts
+
+
 def create_or_update_metadata_file():
     """
     Creates the dataset-metadata.json file if it doesn't exist,
     then updates it with the correct title and id (slug).
     """
+    legacy_metadata = os.path.join(SOURCE_DIR, os.path.basename(METADATA_FILE))
+    if not os.path.exists(METADATA_FILE) and os.path.exists(legacy_metadata):
+        # Earlier versions kept the metadata next to the data
+        print(f"Moving {legacy_metadata} to the upload staging directory...")
+        os.makedirs(DATASET_DIR, exist_ok=True)
+        shutil.copy2(legacy_metadata, METADATA_FILE)
+
     if not os.path.exists(METADATA_FILE):
          print(f"Metadata file not found. Creating a new one...")
          run_command(["kaggle", "datasets", "init", "-p", DATASET_DIR])
@@ -149,6 +304,16 @@ def create_or_update_metadata_file():
 
 
 def main():
+    parser = argparse.ArgumentParser(description=f"Publishes the finalized files in {SOURCE_DIR} to Kaggle.")
+    profiling.add_arguments(parser)
+    args = parser.parse_args()
+    if args.profile:
+        report_path = profiling.enable('upload', sample=args.profile_sample, targets=[
+            (sys.modules[__name__], 'verify_file', 'staging.verify'),
+            (sys.modules[__name__], 'link_or_copy', 'staging.link'),
+        ])
+        print(f"Profiling enabled; report will be written to {report_path}")
+
     print("--- Starting Kaggle Upload Script ---")
     
     # 0. Check for user-filled info
@@ -163,16 +328,24 @@ def main():
     check_auth()
 
     # 2. Check for data directory
-    if not os.path.exists(DATASET_DIR):
-        print(f"Error: Data directory '{DATASET_DIR}' not found.")
-        print("Please run your downloader scripts first, or check the DATASET_DIR variable.")
+    if not os.path.exists(SOURCE_DIR):
+        print(f"Error: Data directory '{SOURCE_DIR}' not found.")
+        print("Please run your downloader scripts first, or check the SOURCE_DIR variable.")
         sys.exit(1)
-    
-    # 3. Create or update the local metadata file
+
+    # 3. Stage the finalized files (hard links, only changes are touched)
+    print(f"\nStaging finalized files from '{SOURCE_DIR}' in '{DATASET_DIR}'...")
+    with profiling.span('staging'):
+        counts = build_staging()
+    print(f"  > {len(counts['staged'])} outputs staged: {counts['linked']} linked, {counts['copied']} copied, "
+          f"{counts['unchanged']} unchanged, {counts['removed']} removed, {counts['rejected']} rejected, "
+          f"{counts['missing']} missing")
+
+    # 4. Create or update the local metadata file
     # We do this every time to ensure it's correct
     create_or_update_metadata_file()
 
-    # 4. Check if the dataset already exists on Kaggle
+    # 5. Check if the dataset already exists on Kaggle
     if check_dataset_exists():
         # --- UPDATE (Idempotent) ---
         print("\nDataset exists. Creating a new version...")